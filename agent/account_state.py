@@ -0,0 +1,181 @@
+"""
+État local du compte cTrader (solde, positions ouvertes, ordres en attente),
+tenu à jour à partir des events poussés par le serveur.
+
+Principe :
+- amorçage UNE fois après l'authentification du compte (voir
+  ctrader_trading._seed_account_state()) via ProtoOATraderReq (solde) et
+  ProtoOAReconcileReq (positions + ordres en attente) ;
+- ensuite, chaque ProtoOAExecutionEvent / ProtoOATraderUpdatedEvent reçu
+  par le callback _on_message_received() de get_client() est appliqué ici,
+  sans aucun aller-retour supplémentaire vers cTrader.
+
+execute_trade() peut ainsi dimensionner l'ordre à partir du solde en
+mémoire, et le chemin critique d'un signal se réduit à un seul
+ProtoOANewOrderReq.
+
+Les mises à jour arrivent depuis le thread du reactor Twisted (callback du
+SDK) alors que les lectures se font depuis la boucle asyncio d'Uvicorn :
+tout passe par un verrou unique, les sections critiques étant minuscules.
+
+NOTE - equity : cTrader ne pousse pas l'equity (elle dépend du PnL latent,
+donc des prix). On expose l'equity connue au dernier event réalisé, égale
+au solde tant qu'aucune source de prix ne permet de la recalculer.
+"""
+import threading
+import time
+
+import event_log
+from ctrader_open_api.messages.OpenApiModelMessages_pb2 import (
+    ProtoOAOrderStatus,
+    ProtoOAPositionStatus,
+)
+
+log = event_log.get_logger("account_state")
+
+_lock = threading.Lock()
+_accounts = {}
+
+
+def _money(value, money_digits) -> float:
+    # Les montants cTrader sont des entiers à l'échelle 10^moneyDigits
+    # (2 par défaut, c'est-à-dire des centimes).
+    digits = money_digits if money_digits else 2
+    return value / (10 ** digits)
+
+
+def _position_record(position) -> dict:
+    trade_data = position.tradeData
+    return {
+        "positionId": position.positionId,
+        "symbolId": trade_data.symbolId,
+        "volume": trade_data.volume,
+        "tradeSide": trade_data.tradeSide,
+        "price": getattr(position, "price", None),
+        "stopLoss": getattr(position, "stopLoss", None),
+        "takeProfit": getattr(position, "takeProfit", None),
+        "openTimestamp": getattr(trade_data, "openTimestamp", None),
+    }
+
+
+def _order_record(order) -> dict:
+    trade_data = order.tradeData
+    return {
+        "orderId": order.orderId,
+        "symbolId": trade_data.symbolId,
+        "volume": trade_data.volume,
+        "tradeSide": trade_data.tradeSide,
+        "orderType": order.orderType,
+        "limitPrice": getattr(order, "limitPrice", None),
+        "stopPrice": getattr(order, "stopPrice", None),
+    }
+
+
+def seed(account_id: int, trader, reconcile) -> None:
+    """
+    Initialise (ou réinitialise) l'état du compte à partir des réponses
+    ProtoOATraderRes.trader et ProtoOAReconcileRes.
+    """
+    balance = _money(trader.balance, getattr(trader, "moneyDigits", None))
+    positions = {p.positionId: _position_record(p) for p in reconcile.position}
+    orders = {o.orderId: _order_record(o) for o in reconcile.order}
+    with _lock:
+        _accounts[account_id] = {
+            "balance": balance,
+            "equity": balance,
+            "moneyDigits": getattr(trader, "moneyDigits", None) or 2,
+            "positions": positions,
+            "orders": orders,
+            "updated_at": time.time(),
+        }
+    log.info(
+        f"✅ Compte {account_id} amorcé : solde={balance}, "
+        f"{len(positions)} position(s), {len(orders)} ordre(s) en attente"
+    )
+
+
+def is_seeded(account_id: int) -> bool:
+    with _lock:
+        return account_id in _accounts
+
+
+def reset(account_id: int | None = None) -> None:
+    """Oublie l'état (d'un compte ou de tous), ex: après une déconnexion."""
+    with _lock:
+        if account_id is None:
+            _accounts.clear()
+        else:
+            _accounts.pop(account_id, None)
+
+
+def get_balance(account_id: int) -> float | None:
+    """Solde en mémoire, ou None si le compte n'a pas encore été amorcé."""
+    with _lock:
+        state = _accounts.get(account_id)
+        return state["balance"] if state else None
+
+
+def snapshot(account_id: int) -> dict | None:
+    """Copie de l'état du compte, pour les routes de diagnostic."""
+    with _lock:
+        state = _accounts.get(account_id)
+        if state is None:
+            return None
+        return {
+            "balance": state["balance"],
+            "equity": state["equity"],
+            "positions": list(state["positions"].values()),
+            "orders": list(state["orders"].values()),
+            "updated_at": state["updated_at"],
+        }
+
+
+def apply_execution_event(event) -> None:
+    """
+    Applique un ProtoOAExecutionEvent : ouverture/modification/clôture de
+    position, cycle de vie des ordres en attente, et nouveau solde après
+    clôture (closePositionDetail) ou dépôt/retrait (depositWithdraw).
+    """
+    with _lock:
+        state = _accounts.get(event.ctidTraderAccountId)
+        if state is None:
+            return
+
+        if event.HasField("position"):
+            position = event.position
+            if position.positionStatus == ProtoOAPositionStatus.POSITION_STATUS_CLOSED:
+                state["positions"].pop(position.positionId, None)
+            elif position.positionStatus == ProtoOAPositionStatus.POSITION_STATUS_OPEN:
+                state["positions"][position.positionId] = _position_record(position)
+
+        if event.HasField("order"):
+            order = event.order
+            if order.orderStatus == ProtoOAOrderStatus.ORDER_STATUS_ACCEPTED:
+                state["orders"][order.orderId] = _order_record(order)
+            else:
+                state["orders"].pop(order.orderId, None)
+
+        if event.HasField("deal") and event.deal.HasField("closePositionDetail"):
+            detail = event.deal.closePositionDetail
+            state["balance"] = _money(detail.balance, getattr(detail, "moneyDigits", None) or state["moneyDigits"])
+            state["equity"] = state["balance"]
+
+        if event.HasField("depositWithdraw"):
+            dw = event.depositWithdraw
+            state["balance"] = _money(dw.balance, getattr(dw, "moneyDigits", None) or state["moneyDigits"])
+            state["equity"] = state["balance"]
+
+        state["updated_at"] = time.time()
+
+
+def apply_trader_updated_event(event) -> None:
+    """Applique un ProtoOATraderUpdatedEvent (solde modifié côté broker)."""
+    with _lock:
+        state = _accounts.get(event.ctidTraderAccountId)
+        if state is None:
+            return
+        trader = event.trader
+        state["moneyDigits"] = getattr(trader, "moneyDigits", None) or state["moneyDigits"]
+        state["balance"] = _money(trader.balance, state["moneyDigits"])
+        state["equity"] = state["balance"]
+        state["updated_at"] = time.time()
@@ -0,0 +1,30 @@
+"""
+Application du benchmark (--spawn de bench_signal) : main:app, avec un
+token cTrader fixe à la place de Supabase et du rafraîchissement OAuth -
+le faux serveur (bench/fake_ctrader_server.py) accepte n'importe quel token.
+
+Le remplacement a lieu avant l'import de ctrader_trading (chargé en tâche
+de fond par main), qui reprend donc la version du benchmark :
+    uvicorn bench.bench_app:app
+"""
+import time
+
+import ctrader_auth
+
+_TOKENS = {
+    "accessToken": "bench-token",
+    "refreshToken": None,
+    "expiresIn": 10 ** 9,
+    "tokenType": "bearer",
+    "issuedAt": int(time.time()),
+}
+
+
+def _bench_tokens() -> dict:
+    return dict(_TOKENS)
+
+
+ctrader_auth.get_valid_tokens = _bench_tokens
+ctrader_auth.load_tokens = _bench_tokens
+
+from main import app  # noqa: E402,F401 - après le remplacement
@@ -0,0 +1,259 @@
+"""
+Benchmark de bout en bout de POST /webhook/signal : latence signal -> ordre
+(la réponse du webhook n'arrive qu'après la réponse du broker au
+ProtoOANewOrderReq) et débit, à concurrence configurable.
+
+Deux modes :
+
+1. Contre une instance déjà lancée :
+       python -m bench.bench_signal --url http://127.0.0.1:8000 -n 200 -c 20
+
+2. Tout-en-un (--spawn), depuis le dossier agent/ : démarre le faux serveur
+   cTrader (bench/fake_ctrader_server.py) et un Uvicorn configuré pour lui
+   parler (CTRADER_HOST/CTRADER_PORT, token fixe via bench/bench_app.py),
+   lance la mesure puis arrête tout :
+       python -m bench.bench_signal --spawn -n 200 -c 20 --latency-ms 40
+
+   Supabase et Telegram ne sont pas joignables dans ce mode : le journal et
+   les notifications échouent en tâche de fond, sans effet sur la mesure.
+
+Avec --async-mode, les signaux sont envoyés en mode asynchrone (?mode=async,
+réponse 202) et la latence mesurée va jusqu'à l'issue lue sur
+GET /signals/{id} ; la latence de l'accusé de réception est affichée à part.
+
+Résultat : p50/p95/p99/max de la latence, débit (signaux/s), nombre
+d'erreurs HTTP, et en fin de sortie les histogrammes de GET /metrics par
+étape (signal_stage_seconds) et par payloadType (ctrader_rtt_seconds).
+Avec --json, une ligne JSON récapitulative est écrite à la fin pour
+comparer automatiquement deux versions.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Les signaux du benchmark se ressemblent tous : chacun porte une clé
+# d'idempotence explicite, sinon signal_dedup les écarterait comme doublons.
+RUN_ID = f"{int(time.time())}-{os.getpid()}"
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def _signal_payload(i: int, symbol: str) -> dict:
+    return {
+        "symbol": symbol,
+        "direction": "BUY" if i % 2 == 0 else "SELL",
+        "niveau": "bench",
+        "type_trade": "bench",
+        "prix": 18000 + (i % 50),
+        "session": "bench",
+        "sl_points": 50,
+        "tp_points": 100,
+        "idempotency_key": f"bench-{RUN_ID}-{i}",
+    }
+
+
+async def _post_async_and_wait(client: httpx.AsyncClient, payload: dict, ack_latencies: list) -> bool:
+    """Mode asynchrone : POST ?mode=async (202) puis suivi de GET /signals/{id} jusqu'à l'issue."""
+    started = time.perf_counter()
+    response = await client.post("/webhook/signal", params={"mode": "async"}, json=payload)
+    ack_latencies.append(time.perf_counter() - started)
+    if response.status_code != 202:
+        return False
+    result_url = response.json()["result_url"]
+    while True:
+        entry = (await client.get(result_url)).json()
+        if entry["status"] in ("done", "failed"):
+            return entry["status"] == "done" and entry["result"]["executed"]
+        await asyncio.sleep(0.005)
+
+
+async def run_load(url: str, total: int, concurrency: int, symbol: str, warmup: int, async_mode: bool = False) -> dict:
+    latencies = []
+    ack_latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=url, timeout=60.0) as client:
+        for i in range(warmup):
+            await client.post("/webhook/signal", json=_signal_payload(-1 - i, symbol))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                try:
+                    if async_mode:
+                        ok = await _post_async_and_wait(client, _signal_payload(i, symbol), ack_latencies)
+                    else:
+                        response = await client.post("/webhook/signal", json=_signal_payload(i, symbol))
+                        ok = response.status_code < 300
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+        try:
+            metrics_text = (await client.get("/metrics")).text
+        except httpx.HTTPError:
+            metrics_text = ""
+
+    latencies.sort()
+    ack_latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_per_second": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else float("nan"),
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "ack_p50_ms": _percentile(ack_latencies, 50) * 1000 if ack_latencies else None,
+        "ack_p99_ms": _percentile(ack_latencies, 99) * 1000 if ack_latencies else None,
+        "metrics": metrics_text,
+    }
+
+
+def _summarize_metrics(metrics_text: str) -> list:
+    """Moyenne par série des histogrammes *_seconds (sum / count)."""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        if line.startswith("#") or not line:
+            continue
+        name_labels, _, value = line.rpartition(" ")
+        if name_labels.endswith("}") and "_seconds_" in name_labels:
+            name, _, labels = name_labels.partition("{")
+            if name.endswith("_sum"):
+                sums[(name[:-4], labels)] = float(value)
+            elif name.endswith("_count"):
+                counts[(name[:-6], labels)] = float(value)
+    out = []
+    for key, count in sorted(counts.items()):
+        if count:
+            out.append(f"  {key[0]}{{{key[1]}  n={int(count)}  moy={sums.get(key, 0) / count * 1000:.2f} ms")
+    return out
+
+
+def _wait_http(url: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} ne répond pas après {timeout}s")
+
+
+def _spawn(args) -> list:
+    fake = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_ctrader_server",
+            "--port", str(args.broker_port),
+            "--latency-ms", str(args.latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--error-rate", str(args.error_rate),
+            "--drop-rate", str(args.drop_rate),
+        ],
+        cwd=AGENT_DIR,
+    )
+    env = {
+        **os.environ,
+        "CTRADER_HOST": "127.0.0.1",
+        "CTRADER_PORT": str(args.broker_port),
+        "CTRADER_ACCOUNT_ID": "1000001",
+        "CTRADER_CLIENT_ID": os.environ.get("CTRADER_CLIENT_ID", "bench"),
+        "CTRADER_CLIENT_SECRET": os.environ.get("CTRADER_CLIENT_SECRET", "bench"),
+        "CTRADER_REDIRECT_URI": os.environ.get("CTRADER_REDIRECT_URI", "http://127.0.0.1/oauth/callback"),
+        "SUPABASE_URL": os.environ.get("BENCH_SUPABASE_URL", "http://127.0.0.1:9"),
+        "SUPABASE_KEY": os.environ.get("BENCH_SUPABASE_KEY", "bench.bench.bench"),
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bench.bench_app:app", "--host", "127.0.0.1", "--port", str(args.app_port)],
+        cwd=AGENT_DIR,
+        env=env,
+    )
+    return [app, fake]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de /webhook/signal")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("-n", "--requests", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("--symbol", default="NAS100")
+    parser.add_argument("--warmup", type=int, default=1, help="signaux envoyés avant la mesure (connexion, caches)")
+    parser.add_argument("--async-mode", action="store_true", help="POST ?mode=async puis suivi de /signals/{id}")
+    parser.add_argument("--json", action="store_true", help="écrit aussi un récapitulatif JSON sur une ligne")
+    parser.add_argument("--spawn", action="store_true", help="démarre faux serveur + Uvicorn localement")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--broker-port", type=int, default=15035)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    processes = []
+    url = args.url
+    try:
+        if args.spawn:
+            processes = _spawn(args)
+            url = f"http://127.0.0.1:{args.app_port}"
+            _wait_http(url, timeout=30)
+
+        result = asyncio.run(
+            run_load(url, args.requests, args.concurrency, args.symbol, args.warmup, args.async_mode)
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print()
+    print(f"Signaux : {result['ok']}/{result['requests']} OK, {result['errors']} erreur(s), concurrence {result['concurrency']}")
+    print(f"Débit   : {result['throughput_per_second']:.1f} signaux/s sur {result['wall_seconds']:.2f} s")
+    print(
+        f"Latence : p50={result['p50_ms']:.1f} ms  p95={result['p95_ms']:.1f} ms  "
+        f"p99={result['p99_ms']:.1f} ms  max={result['max_ms']:.1f} ms"
+    )
+    if result["ack_p50_ms"] is not None:
+        print(f"Accusé  : p50={result['ack_p50_ms']:.1f} ms  p99={result['ack_p99_ms']:.1f} ms (réponse 202)")
+    breakdown = _summarize_metrics(result["metrics"])
+    if breakdown:
+        print("Détail /metrics :")
+        print("\n".join(breakdown))
+    if args.json:
+        print(json.dumps({k: v for k, v in result.items() if k != "metrics"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+Faux serveur cTrader Open API, local, pour mesurer les performances du
+chemin d'exécution sans compte broker.
+
+Parle le même protocole que le vrai serveur tel que vu par le SDK
+(ctrader_open_api.TcpProtocol) : TLS, trames préfixées par leur longueur
+sur 4 octets (Int32StringReceiver), ProtoMessage(payloadType, payload,
+clientMsgId) - la réponse reprend le clientMsgId de la requête.
+
+Requêtes prises en charge :
+    ProtoOAApplicationAuthReq, ProtoOAAccountAuthReq,
+    ProtoOAGetAccountListByAccessTokenReq, ProtoOASymbolsListReq,
+    ProtoOASymbolByIdReq, ProtoOATraderReq, ProtoOAReconcileReq,
+    ProtoOASubscribeSpotsReq (+ ProtoOASpotEvent périodiques),
+    ProtoOANewOrderReq (-> ProtoOAExecutionEvent ORDER_FILLED),
+    ProtoOAVersionReq (ping de supervision de la connexion),
+    ProtoOAAmendPositionSLTPReq, ProtoOADealListReq.
+Toute autre requête reçoit un ProtoOAErrorRes "UNSUPPORTED_BY_FAKE_SERVER".
+
+Latence et pannes configurables :
+    --latency-ms / --jitter-ms   délai avant chaque réponse
+    --error-rate                 proportion de ProtoOAErrorRes injectés
+    --drop-rate                  proportion de requêtes sans réponse (timeouts)
+    --auto-close-ms              clôture de chaque position après ce délai
+
+Usage (depuis le dossier agent/) :
+    python -m bench.fake_ctrader_server --port 5035 --latency-ms 40
+puis lancer l'agent avec CTRADER_HOST=localhost CTRADER_PORT=5035
+(voir bench/bench_signal.py, qui sait aussi tout démarrer seul).
+"""
+import argparse
+import math
+import os
+import random
+import tempfile
+import time
+
+from OpenSSL import crypto
+from twisted.internet import reactor, ssl, task
+from twisted.internet.protocol import Factory
+from twisted.protocols.basic import Int32StringReceiver
+
+from ctrader_open_api import Protobuf
+from ctrader_open_api.messages.OpenApiCommonMessages_pb2 import ProtoHeartbeatEvent, ProtoMessage
+from ctrader_open_api.messages.OpenApiMessages_pb2 import (
+    ProtoOAAccountAuthRes,
+    ProtoOAAmendPositionSLTPReq,
+    ProtoOAApplicationAuthRes,
+    ProtoOADealListRes,
+    ProtoOAErrorRes,
+    ProtoOAExecutionEvent,
+    ProtoOAGetAccountListByAccessTokenRes,
+    ProtoOAGetTrendbarsRes,
+    ProtoOAReconcileRes,
+    ProtoOASpotEvent,
+    ProtoOASubscribeSpotsRes,
+    ProtoOASymbolByIdRes,
+    ProtoOASymbolsListRes,
+    ProtoOATraderRes,
+    ProtoOAVersionRes,
+)
+from ctrader_open_api.messages.OpenApiModelMessages_pb2 import (
+    ProtoOAExecutionType,
+    ProtoOAOrderStatus,
+    ProtoOAOrderType,
+    ProtoOAPositionStatus,
+    ProtoOADealStatus,
+    ProtoOATradeSide,
+)
+
+_HEARTBEAT_TYPE = ProtoHeartbeatEvent().payloadType
+SPOT_PRICE_SCALE = 100000
+
+
+def _self_signed_context(tmpdir: str) -> ssl.DefaultOpenSSLContextFactory:
+    """Certificat auto-signé jetable : le client du SDK ne vérifie pas le certificat."""
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    cert = crypto.X509()
+    cert.get_subject().CN = "localhost"
+    cert.set_serial_number(int(time.time()))
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(24 * 3600)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, "sha256")
+    key_path = os.path.join(tmpdir, "fake_ctrader.key")
+    cert_path = os.path.join(tmpdir, "fake_ctrader.crt")
+    with open(key_path, "wb") as f:
+        f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    with open(cert_path, "wb") as f:
+        f.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    return ssl.DefaultOpenSSLContextFactory(key_path, cert_path)
+
+
+class FakeBroker:
+    """État partagé entre connexions : compte, symboles, positions, compteurs."""
+
+    def __init__(self, args):
+        self.args = args
+        self.account_id = args.account_id
+        self.balance_cents = args.balance_cents
+        self.symbols = {1: "USTEC"}
+        for i in range(2, args.symbols + 1):
+            self.symbols[i] = f"SYM{i:05d}"
+        self.prices = {symbol_id: 18000.0 for symbol_id in self.symbols}
+        self.next_id = 1000
+        self.positions = {}
+        self.requests = 0
+        self.orders = 0
+
+    def new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+
+class FakeCTraderProtocol(Int32StringReceiver):
+    MAX_LENGTH = 15000000
+
+    def connectionMade(self):
+        self.broker = self.factory.broker
+        self.spot_subscriptions = set()
+        self.spot_loop = None
+        self.alive = True
+
+    def connectionLost(self, reason):
+        self.alive = False
+        if self.spot_loop is not None and self.spot_loop.running:
+            self.spot_loop.stop()
+
+    def stringReceived(self, data):
+        message = ProtoMessage()
+        message.ParseFromString(data)
+        if message.payloadType == _HEARTBEAT_TYPE:
+            return  # le client répond déjà aux heartbeats : ne pas faire de ping-pong
+        self.broker.requests += 1
+        args = self.broker.args
+
+        if random.random() < args.drop_rate:
+            return
+        delay = max(0.0, (args.latency_ms + random.uniform(-args.jitter_ms, args.jitter_ms)) / 1000.0)
+        reactor.callLater(delay, self._respond, message)
+
+    def _respond(self, message):
+        request = Protobuf.extract(message)
+        if random.random() < self.broker.args.error_rate:
+            response = ProtoOAErrorRes(errorCode="INJECTED_ERROR", description="Erreur injectée par le faux serveur")
+        else:
+            handler = getattr(self, f"on_{type(request).__name__}", None)
+            if handler is None:
+                response = ProtoOAErrorRes(errorCode="UNSUPPORTED_BY_FAKE_SERVER", description=type(request).__name__)
+            else:
+                response = handler(request)
+        self._send(response, message.clientMsgId)
+
+    def _send(self, payload, client_msg_id=None):
+        envelope = ProtoMessage(payloadType=payload.payloadType, payload=payload.SerializePartialToString())
+        if client_msg_id:
+            envelope.clientMsgId = client_msg_id
+        self.sendString(envelope.SerializePartialToString())
+
+    # --- handlers -----------------------------------------------------------
+
+    def on_ProtoOAVersionReq(self, req):
+        return ProtoOAVersionRes(version="fake-1.0")
+
+    def on_ProtoOAApplicationAuthReq(self, req):
+        return ProtoOAApplicationAuthRes()
+
+    def on_ProtoOAAccountAuthReq(self, req):
+        return ProtoOAAccountAuthRes(ctidTraderAccountId=req.ctidTraderAccountId)
+
+    def on_ProtoOAGetAccountListByAccessTokenReq(self, req):
+        res = ProtoOAGetAccountListByAccessTokenRes(accessToken=req.accessToken)
+        acc = res.ctidTraderAccount.add()
+        acc.ctidTraderAccountId = self.broker.account_id
+        acc.isLive = False
+        acc.traderLogin = 1234567
+        return res
+
+    def on_ProtoOASymbolsListReq(self, req):
+        res = ProtoOASymbolsListRes(ctidTraderAccountId=req.ctidTraderAccountId)
+        for symbol_id, name in self.broker.symbols.items():
+            s = res.symbol.add()
+            s.symbolId = symbol_id
+            s.symbolName = name
+            s.enabled = True
+        return res
+
+    def on_ProtoOASymbolByIdReq(self, req):
+        res = ProtoOASymbolByIdRes(ctidTraderAccountId=req.ctidTraderAccountId)
+        for symbol_id in req.symbolId:
+            if symbol_id not in self.broker.symbols:
+                continue
+            s = res.symbol.add()
+            s.symbolId = symbol_id
+            s.digits = 2
+            s.pipPosition = 0
+            s.minVolume = 10
+            s.maxVolume = 1000000
+            s.stepVolume = 10
+        return res
+
+    def on_ProtoOATraderReq(self, req):
+        res = ProtoOATraderRes(ctidTraderAccountId=req.ctidTraderAccountId)
+        res.trader.ctidTraderAccountId = req.ctidTraderAccountId
+        res.trader.balance = self.broker.balance_cents
+        res.trader.depositAssetId = 1
+        res.trader.moneyDigits = 2
+        return res
+
+    def on_ProtoOAReconcileReq(self, req):
+        res = ProtoOAReconcileRes(ctidTraderAccountId=req.ctidTraderAccountId)
+        for position in self.broker.positions.values():
+            res.position.add().CopyFrom(position)
+        return res
+
+    def on_ProtoOADealListReq(self, req):
+        return ProtoOADealListRes(ctidTraderAccountId=req.ctidTraderAccountId, hasMore=False)
+
+    def on_ProtoOAGetTrendbarsReq(self, req):
+        """Barres M1 déterministes (marche aléatoire dérivée de la minute), week-ends exclus."""
+        res = ProtoOAGetTrendbarsRes(ctidTraderAccountId=req.ctidTraderAccountId, period=req.period, symbolId=req.symbolId)
+        first = -(-req.fromTimestamp // 60000)
+        for minute in range(first, req.toTimestamp // 60000 + 1):
+            if time.gmtime(minute * 60).tm_wday >= 5:
+                continue
+            rng = random.Random(req.symbolId * 10**9 + minute)
+            open_price = 18000.0 + 300.0 * math.sin(minute / 900.0) + rng.uniform(-5, 5)
+            close_price = open_price + rng.uniform(-8, 8)
+            low = min(open_price, close_price) - rng.uniform(0, 4)
+            high = max(open_price, close_price) + rng.uniform(0, 4)
+            bar = res.trendbar.add()
+            bar.utcTimestampInMinutes = minute
+            bar.low = int(low * SPOT_PRICE_SCALE)
+            bar.deltaOpen = int((open_price - low) * SPOT_PRICE_SCALE)
+            bar.deltaClose = int((close_price - low) * SPOT_PRICE_SCALE)
+            bar.deltaHigh = int((high - low) * SPOT_PRICE_SCALE)
+            bar.volume = rng.randint(10, 500)
+        return res
+
+    def on_ProtoOASubscribeSpotsReq(self, req):
+        self.spot_subscriptions.update(req.symbolId)
+        self.spot_account_id = req.ctidTraderAccountId
+        if self.spot_loop is None and self.broker.args.spot_interval_ms > 0:
+            self.spot_loop = task.LoopingCall(self._push_spots)
+            self.spot_loop.start(self.broker.args.spot_interval_ms / 1000.0, now=False)
+        return ProtoOASubscribeSpotsRes(ctidTraderAccountId=req.ctidTraderAccountId)
+
+    def _push_spots(self):
+        for symbol_id in self.spot_subscriptions:
+            price = self.broker.prices[symbol_id] + random.uniform(-2.0, 2.0)
+            self.broker.prices[symbol_id] = price
+            event = ProtoOASpotEvent(ctidTraderAccountId=self.spot_account_id, symbolId=symbol_id)
+            event.bid = int(price * SPOT_PRICE_SCALE)
+            event.ask = int((price + 0.5) * SPOT_PRICE_SCALE)
+            event.timestamp = int(time.time() * 1000)
+            self._send(event)
+
+    def on_ProtoOANewOrderReq(self, req):
+        self.broker.orders += 1
+        now_ms = int(time.time() * 1000)
+        price = self.broker.prices.get(req.symbolId, 18000.0)
+        event = ProtoOAExecutionEvent(
+            ctidTraderAccountId=req.ctidTraderAccountId,
+            executionType=ProtoOAExecutionType.ORDER_FILLED,
+        )
+        position_id = self.broker.new_id()
+        order_id = self.broker.new_id()
+
+        position = event.position
+        position.positionId = position_id
+        position.tradeData.symbolId = req.symbolId
+        position.tradeData.volume = req.volume
+        position.tradeData.tradeSide = req.tradeSide
+        position.tradeData.openTimestamp = now_ms
+        if req.HasField("comment"):
+            position.tradeData.comment = req.comment
+        position.positionStatus = ProtoOAPositionStatus.POSITION_STATUS_OPEN
+        position.swap = 0
+        position.price = price
+        if req.HasField("stopLoss"):
+            position.stopLoss = req.stopLoss
+        if req.HasField("takeProfit"):
+            position.takeProfit = req.takeProfit
+        position.moneyDigits = 2
+
+        order = event.order
+        order.orderId = order_id
+        order.tradeData.CopyFrom(position.tradeData)
+        order.orderType = req.orderType or ProtoOAOrderType.MARKET
+        order.orderStatus = ProtoOAOrderStatus.ORDER_STATUS_FILLED
+        order.executionPrice = price
+        order.executedVolume = req.volume
+        order.positionId = position_id
+
+        deal = event.deal
+        deal.dealId = self.broker.new_id()
+        deal.orderId = order_id
+        deal.positionId = position_id
+        deal.volume = req.volume
+        deal.filledVolume = req.volume
+        deal.symbolId = req.symbolId
+        deal.createTimestamp = now_ms
+        deal.executionTimestamp = now_ms
+        deal.executionPrice = price
+        deal.tradeSide = req.tradeSide
+        deal.dealStatus = ProtoOADealStatus.FILLED
+        deal.moneyDigits = 2
+
+        self.broker.positions[position_id] = position
+        if self.broker.args.auto_close_ms > 0:
+            reactor.callLater(self.broker.args.auto_close_ms / 1000.0, self._close_position, position_id)
+        return event
+
+    def _close_position(self, position_id):
+        """Clôture "au marché" d'une position (--auto-close-ms), poussée comme le ferait cTrader."""
+        position = self.broker.positions.pop(position_id, None)
+        if position is None or not self.alive:
+            return
+        trade_data = position.tradeData
+        price = self.broker.prices.get(trade_data.symbolId, position.price)
+        sign = 1 if trade_data.tradeSide == ProtoOATradeSide.BUY else -1
+        gross_cents = int(round((price - position.price) * sign * trade_data.volume))
+        self.broker.balance_cents += gross_cents
+        now_ms = int(time.time() * 1000)
+
+        event = ProtoOAExecutionEvent(
+            ctidTraderAccountId=self.broker.account_id,
+            executionType=ProtoOAExecutionType.ORDER_FILLED,
+        )
+        event.position.CopyFrom(position)
+        event.position.positionStatus = ProtoOAPositionStatus.POSITION_STATUS_CLOSED
+        order = event.order
+        order.orderId = self.broker.new_id()
+        order.tradeData.CopyFrom(trade_data)
+        order.tradeData.tradeSide = ProtoOATradeSide.SELL if sign == 1 else ProtoOATradeSide.BUY
+        order.orderType = ProtoOAOrderType.MARKET
+        order.orderStatus = ProtoOAOrderStatus.ORDER_STATUS_FILLED
+        order.executionPrice = price
+        order.positionId = position_id
+        order.closingOrder = True
+        deal = event.deal
+        deal.dealId = self.broker.new_id()
+        deal.orderId = order.orderId
+        deal.positionId = position_id
+        deal.volume = trade_data.volume
+        deal.filledVolume = trade_data.volume
+        deal.symbolId = trade_data.symbolId
+        deal.createTimestamp = now_ms
+        deal.executionTimestamp = now_ms
+        deal.executionPrice = price
+        deal.tradeSide = order.tradeData.tradeSide
+        deal.dealStatus = ProtoOADealStatus.FILLED
+        deal.moneyDigits = 2
+        detail = deal.closePositionDetail
+        detail.entryPrice = position.price
+        detail.grossProfit = gross_cents
+        detail.swap = 0
+        detail.commission = 0
+        detail.balance = self.broker.balance_cents
+        detail.closedVolume = trade_data.volume
+        detail.moneyDigits = 2
+        self._send(event)
+
+    def on_ProtoOAAmendPositionSLTPReq(self, req: ProtoOAAmendPositionSLTPReq):
+        position = self.broker.positions.get(req.positionId)
+        if position is None:
+            return ProtoOAErrorRes(errorCode="POSITION_NOT_FOUND", description=str(req.positionId))
+        if req.HasField("stopLoss"):
+            position.stopLoss = req.stopLoss
+        if req.HasField("takeProfit"):
+            position.takeProfit = req.takeProfit
+        event = ProtoOAExecutionEvent(
+            ctidTraderAccountId=req.ctidTraderAccountId,
+            executionType=ProtoOAExecutionType.ORDER_REPLACED,
+        )
+        event.position.CopyFrom(position)
+        return event
+
+
+class FakeCTraderFactory(Factory):
+    protocol = FakeCTraderProtocol
+
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Faux serveur cTrader Open API (benchmarks hors ligne)")
+    parser.add_argument("--port", type=int, default=5035)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--symbols", type=int, default=2000, help="taille du catalogue simulé")
+    parser.add_argument("--spot-interval-ms", type=float, default=250.0, help="0 pour désactiver les ticks")
+    parser.add_argument("--auto-close-ms", type=float, default=0.0, help="clôture chaque position après ce délai (0 = jamais)")
+    parser.add_argument("--account-id", type=int, default=1000001)
+    parser.add_argument("--balance-cents", type=int, default=1000000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    broker = FakeBroker(args)
+    tmpdir = tempfile.mkdtemp(prefix="fake_ctrader_")
+    reactor.listenSSL(args.port, FakeCTraderFactory(broker), _self_signed_context(tmpdir), interface="127.0.0.1")
+    print(f"[fake_ctrader] ✅ En écoute sur 127.0.0.1:{args.port} (latence {args.latency_ms} ms)", flush=True)
+    task.LoopingCall(
+        lambda: print(f"[fake_ctrader] requêtes={broker.requests} ordres={broker.orders}", flush=True)
+    ).start(10, now=False)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
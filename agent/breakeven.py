@@ -0,0 +1,318 @@
+"""
+Moteur de break-even (BE) : BE_DELAY_SECONDS après l'ouverture d'une
+position du bot, son stop loss est remonté au prix d'entrée
+(ProtoOAAmendPositionSLTPReq) si elle est toujours ouverte et en gain -
+sinon cTrader refuserait un SL au-delà du prix, et le BE est sans objet
+(même convention que replay) ; à sa clôture,
+le trade est journalisé avec le prix et le PnL réels.
+
+Principe :
+- un tas (heapq) de (échéance, séquence, clé) et UNE seule tâche asyncio
+  qui dort jusqu'à la prochaine échéance - pas une tâche par trade.
+  Ajout et retrait en O(log n) ; une annulation (position clôturée avant
+  l'échéance) laisse une entrée périmée dans le tas, ignorée au dépilage et
+  purgée quand elles deviennent majoritaires ;
+- les ProtoOAExecutionEvent poussés par cTrader (voir
+  ctrader_trading._on_message_received()) détectent les clôtures : statut
+  CLOSED_TP / CLOSED_SL / CLOSED_BE selon le niveau touché, CLOSED_MANUAL
+  pour toute autre clôture ; prix = executionPrice du deal, PnL = gross
+  profit + swap + commissions (closePositionDetail) ;
+- après un redémarrage ou une reconnexion, rebuild() reconstruit les
+  échéances à partir des positions de ProtoOAReconcileRes (openTimestamp).
+
+Tout s'exécute dans la boucle asyncio : pas de verrou.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+import event_log
+import metrics
+import spot_prices
+from ctrader_open_api.messages.OpenApiModelMessages_pb2 import (
+    ProtoOAOrderType,
+    ProtoOAPositionStatus,
+    ProtoOATradeSide,
+)
+from supabase_journal import enqueue_be_triggered, enqueue_trade_exit
+
+log = event_log.get_logger("breakeven")
+
+BE_ENABLED = os.environ.get("BE_ENABLED", "1") == "1"
+BE_DELAY_SECONDS = float(os.environ.get("BE_DELAY_SECONDS", "900"))
+BE_RETRY_SECONDS = float(os.environ.get("BE_RETRY_SECONDS", "5"))
+BE_MAX_ATTEMPTS = int(os.environ.get("BE_MAX_ATTEMPTS", "3"))
+
+_heap = []          # (échéance epoch, séquence, (account_id, position_id))
+_positions = {}     # (account_id, position_id) -> dict (voir track())
+_seq = itertools.count()
+_wakeup = None
+_timer_task = None
+_amend = None
+_stats = {"tracked": 0, "be_applied": 0, "be_failed": 0, "be_not_applicable": 0, "exits": 0, "stale_popped": 0}
+
+
+def start_breakeven_engine(amend) -> None:
+    """
+    A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup).
+    amend : coroutine amend(account_id, position_id, stop_loss, take_profit)
+    envoyant le ProtoOAAmendPositionSLTPReq.
+    """
+    global _amend, _wakeup, _timer_task
+    _amend = amend
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    if _timer_task is None or _timer_task.done():
+        _timer_task = asyncio.get_running_loop().create_task(_timer_loop())
+
+
+def track(
+    account_id: int,
+    position_id: int,
+    trade_id,
+    direction: str,          # "LONG" ou "SHORT"
+    entry_price: float,
+    sl_price: float | None,
+    tp_price: float | None,
+    opened_at: float | None = None,
+    be_done: bool = False,
+    symbol_id: int | None = None,
+) -> None:
+    """
+    Suit une position ouverte par le bot. trade_id : id de la ligne Supabase,
+    ou le Future d'enqueue_trade_entry(), ou None si inconnu. symbol_id sert
+    à lire le prix courant (spot_prices) à l'échéance du BE.
+    """
+    key = (account_id, position_id)
+    opened_at = time.time() if opened_at is None else opened_at
+    entry = _positions.get(key)
+    if entry is None:
+        _stats["tracked"] += 1
+    _positions[key] = {
+        "account_id": account_id,
+        "position_id": position_id,
+        "trade_id": trade_id if trade_id is not None else (entry or {}).get("trade_id"),
+        "direction": direction,
+        "entry_price": entry_price,
+        "sl_price": sl_price,
+        "tp_price": tp_price,
+        "opened_at": opened_at,
+        "be_done": be_done,
+        "symbol_id": symbol_id if symbol_id is not None else (entry or {}).get("symbol_id"),
+        "attempts": 0,
+        "seq": None,
+    }
+    if BE_ENABLED and not be_done:
+        _schedule(key, opened_at + BE_DELAY_SECONDS)
+    metrics.set_gauge("breakeven_tracked_positions", len(_positions))
+
+
+def _schedule(key, deadline: float) -> None:
+    seq = next(_seq)
+    _positions[key]["seq"] = seq
+    heapq.heappush(_heap, (deadline, seq, key))
+    # Purge des entrées périmées quand elles dominent le tas (O(n), amorti).
+    if len(_heap) > 64 and len(_heap) > 2 * len(_positions):
+        _heap[:] = [item for item in _heap if _is_live(item)]
+        heapq.heapify(_heap)
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _is_live(item) -> bool:
+    entry = _positions.get(item[2])
+    return entry is not None and entry["seq"] == item[1]
+
+
+def rebuild(account_id: int, positions, trade_ids: dict, as_of: float) -> None:
+    """
+    Reconstruit le suivi d'un compte depuis ProtoOAReconcileRes.position
+    (positions du bot uniquement, filtrées par l'appelant). trade_ids :
+    position_id -> id Supabase connu. Les positions suivies, ouvertes avant
+    as_of (envoi du reconcile) et absentes du reconcile ont été clôturées
+    pendant la coupure : elles sont oubliées ici, leur clôture est
+    journalisée par journal_reconcile (au démarrage, et après chaque
+    session restaurée - voir broker_ops).
+    """
+    live_ids = set()
+    for position in positions:
+        position_id = position.positionId
+        live_ids.add(position_id)
+        key = (account_id, position_id)
+        entry = _positions.get(key)
+        if entry is not None and entry["be_done"]:
+            continue
+        direction = "LONG" if position.tradeData.tradeSide == ProtoOATradeSide.BUY else "SHORT"
+        entry_price = position.price
+        stop_loss = position.stopLoss if position.HasField("stopLoss") else None
+        be_done = stop_loss is not None and (
+            stop_loss >= entry_price if direction == "LONG" else stop_loss <= entry_price
+        )
+        track(
+            account_id,
+            position_id,
+            trade_ids.get(position_id),
+            direction,
+            entry_price,
+            stop_loss,
+            position.takeProfit if position.HasField("takeProfit") else None,
+            opened_at=position.tradeData.openTimestamp / 1000.0,
+            be_done=be_done,
+            symbol_id=position.tradeData.symbolId,
+        )
+    for key in [
+        k for k, entry in _positions.items()
+        if k[0] == account_id and k[1] not in live_ids and entry["opened_at"] < as_of
+    ]:
+        _positions.pop(key)
+    metrics.set_gauge("breakeven_tracked_positions", len(_positions))
+    log.info(f"🔄 Compte {account_id} : {len(live_ids)} position(s) du bot suivie(s)")
+
+
+def forget(account_id: int, position_id: int) -> None:
+    """Arrête le suivi d'une position (clôture constatée hors des events, ex: réconciliation)."""
+    if _positions.pop((account_id, position_id), None) is not None:
+        metrics.set_gauge("breakeven_tracked_positions", len(_positions))
+
+
+def on_execution_event(event) -> None:
+    """
+    Applique un ProtoOAExecutionEvent (appelé dans la boucle asyncio) :
+    prix d'entrée réel au remplissage, SL/TP modifiés, clôture.
+    """
+    if not event.HasField("position"):
+        return
+    position = event.position
+    key = (event.ctidTraderAccountId, position.positionId)
+    entry = _positions.get(key)
+    if entry is None:
+        return
+
+    if position.positionStatus != ProtoOAPositionStatus.POSITION_STATUS_CLOSED:
+        if position.HasField("price") and position.price:
+            entry["entry_price"] = position.price
+        if position.HasField("stopLoss"):
+            entry["sl_price"] = position.stopLoss
+        if position.HasField("takeProfit"):
+            entry["tp_price"] = position.takeProfit
+        return
+
+    if not (event.HasField("deal") and event.deal.HasField("closePositionDetail")):
+        return
+    _positions.pop(key)
+    metrics.set_gauge("breakeven_tracked_positions", len(_positions))
+    deal = event.deal
+    detail = deal.closePositionDetail
+    money_digits = detail.moneyDigits if detail.HasField("moneyDigits") else 2
+    pnl = (detail.grossProfit + detail.swap + detail.commission) / (10 ** money_digits)
+    exit_price = deal.executionPrice
+    status = _exit_status(entry, exit_price, event)
+    _stats["exits"] += 1
+    metrics.inc("breakeven_exits_total", status=status)
+    log.info(f"🏁 Position {position.positionId} clôturée : {status} à {exit_price} (PnL {pnl:.2f})")
+    if entry["trade_id"] is None:
+        log.warning(f"⚠️ Clôture de la position {position.positionId} non journalisée : trade Supabase inconnu")
+        return
+    enqueue_trade_exit(entry["trade_id"], status, exit_price, pnl)
+
+
+def _exit_status(entry: dict, exit_price: float, event) -> str:
+    closed_by_stop = event.HasField("order") and event.order.orderType == ProtoOAOrderType.STOP_LOSS_TAKE_PROFIT
+    if not closed_by_stop:
+        return "CLOSED_MANUAL"
+    sl, tp = entry["sl_price"], entry["tp_price"]
+    if tp is not None and (sl is None or abs(exit_price - tp) < abs(exit_price - sl)):
+        return "CLOSED_TP"
+    return "CLOSED_BE" if entry["be_done"] else "CLOSED_SL"
+
+
+async def _timer_loop() -> None:
+    while True:
+        _wakeup.clear()
+        while _heap and not _is_live(_heap[0]):
+            heapq.heappop(_heap)
+            _stats["stale_popped"] += 1
+        if not _heap:
+            await _wakeup.wait()
+            continue
+        delay = _heap[0][0] - time.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        _, _, key = heapq.heappop(_heap)
+        _positions[key]["seq"] = None
+        # L'envoi ne bloque pas le tas : d'autres échéances peuvent tomber
+        # pendant l'aller-retour cTrader.
+        asyncio.ensure_future(_fire(key))
+
+
+async def _fire(key) -> None:
+    entry = _positions.get(key)
+    if entry is None or entry["be_done"]:
+        return
+    account_id, position_id = key
+    if not _in_profit(entry):
+        _stats["be_not_applicable"] += 1
+        metrics.inc("breakeven_not_applicable_total")
+        log.info(f"↪️ BE de la position {position_id} sans objet : pas en gain à l'échéance")
+        return
+    entry["attempts"] += 1
+    try:
+        await _amend(account_id, position_id, entry["entry_price"], entry["tp_price"])
+    except Exception as e:
+        # Tâche lancée sans attente (ensure_future) : toute erreur est
+        # traitée ici, sinon elle serait perdue et le BE jamais appliqué.
+        # Réessai tant que la position est suivie (une clôture la retire
+        # de _positions), au plus BE_MAX_ATTEMPTS fois.
+        if entry["attempts"] < BE_MAX_ATTEMPTS and key in _positions:
+            log.warning(f"⚠️ BE de la position {position_id} reporté : {type(e).__name__}: {e}")
+            _schedule(key, time.time() + BE_RETRY_SECONDS)
+            return
+        _stats["be_failed"] += 1
+        metrics.inc("breakeven_failed_total")
+        log.error(f"⛔ BE de la position {position_id} abandonné : {type(e).__name__}: {e}")
+        return
+
+    entry["be_done"] = True
+    entry["sl_price"] = entry["entry_price"]
+    _stats["be_applied"] += 1
+    metrics.inc("breakeven_applied_total")
+    log.info(f"🛡️ Position {position_id} passée à BE ({entry['entry_price']})")
+    if entry["trade_id"] is not None:
+        try:
+            enqueue_be_triggered(entry["trade_id"])
+        except Exception as e:
+            log.error(f"❌ BE de la position {position_id} non journalisé : {type(e).__name__}: {e}")
+
+
+def _in_profit(entry: dict) -> bool:
+    """
+    Position en gain au prix de clôture courant (bid pour un achat, ask pour
+    une vente). Sans tick récent, on tente le BE : cTrader tranchera.
+    """
+    if entry["symbol_id"] is None:
+        return True
+    long = entry["direction"] == "LONG"
+    price = spot_prices.current_price(entry["symbol_id"], "SELL" if long else "BUY")
+    if price is None:
+        return True
+    return price > entry["entry_price"] if long else price < entry["entry_price"]
+
+
+def stats() -> dict:
+    now = time.time()
+    next_deadline = min((item[0] for item in _heap if _is_live(item)), default=None)
+    return {
+        **_stats,
+        "enabled": BE_ENABLED,
+        "delay_seconds": BE_DELAY_SECONDS,
+        "open_positions": len(_positions),
+        "pending_timers": sum(1 for entry in _positions.values() if entry["seq"] is not None),
+        "heap_size": len(_heap),
+        "next_deadline_in_seconds": round(next_deadline - now, 1) if next_deadline is not None else None,
+    }
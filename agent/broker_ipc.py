@@ -0,0 +1,241 @@
+"""
+Mode multi-processus : UN processus "broker" possède le reactor Twisted, la
+connexion et la session cTrader et tous les états qui en dépendent
+(catalogue, account_state, prix, break-even, file de signaux, index de
+dé-duplication) ; N workers HTTP (uvicorn --workers N) lui transmettent
+l'exécution des signaux et les requêtes sur ces états par une socket Unix
+locale. Parsing HTTP, lecture du journal et notifications se répartissent
+ainsi sur plusieurs cœurs, avec toujours une seule session cTrader.
+
+BROKER_MODE :
+- embedded (défaut) : un seul processus, comme avant - call() appelle
+  directement la fonction enregistrée (voir broker_ops), sans sérialisation ;
+- server : le processus broker (python -m broker_server) - mêmes
+  fonctions, servies sur BROKER_SOCKET_PATH ;
+- client : un worker HTTP - ctrader_trading n'est jamais importé (pas de
+  crochet.setup(), pas de connexion cTrader), call() passe par la socket.
+
+Protocole : trames [longueur, 4 octets big-endian][JSON UTF-8]. Requête
+{"id", "op", "args", "cid"} (cid : identifiant de corrélation, voir
+event_log), réponse {"id", "result"} ou {"id", "error": {"type",
+"message"}}. Une seule connexion par worker, multiplexée par id : les
+appels concurrents ne s'attendent pas les uns les autres.
+
+Démarrage : en mode embedded/server, broker_ops (SDK cTrader, Twisted) est
+importé en tâche de fond après le démarrage de l'app (voir main) ; les
+appels arrivés entre-temps attendent mark_ready() au lieu d'échouer.
+
+Lancement (commande de démarrage Railway) :
+    python -m broker_server & BROKER_MODE=client uvicorn main:app --workers 4 --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import struct
+
+import event_log
+import metrics
+from signal_queue import SignalQueueFull
+
+log = event_log.get_logger("broker_ipc")
+
+BROKER_MODE = os.environ.get("BROKER_MODE", "embedded")
+IS_CLIENT = BROKER_MODE == "client"
+BROKER_SOCKET_PATH = os.environ.get("BROKER_SOCKET_PATH", "/tmp/nasdaq-bot-broker.sock")
+BROKER_CALL_TIMEOUT_SECONDS = float(os.environ.get("BROKER_CALL_TIMEOUT_SECONDS", "60"))
+# Délai laissé au broker pour ouvrir sa socket (démarrage simultané des processus).
+BROKER_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("BROKER_CONNECT_TIMEOUT_SECONDS", "15"))
+
+_MAX_FRAME_BYTES = 16 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+# Exceptions recréées telles quelles côté worker (les routes les distinguent).
+_EXCEPTIONS = {cls.__name__: cls for cls in (ValueError, RuntimeError, SignalQueueFull)}
+
+_ops = {}
+_ready = asyncio.Event()
+_start_error = None
+_server = None
+_connection = None
+_connect_lock = None
+
+
+def register(name: str, func) -> None:
+    """Expose func(**args) (fonction ou coroutine) sous le nom name - processus broker ou embarqué."""
+    _ops[name] = func
+
+
+async def call(name: str, **args):
+    """Appelle une opération du broker : en local, ou par la socket en mode client."""
+    if not IS_CLIENT:
+        return await _invoke(name, args)
+    connection = await _get_connection()
+    return await connection.request(name, args)
+
+
+def mark_ready(error: Exception | None = None) -> None:
+    """Opérations enregistrées (ou démarrage du broker en échec) : libère les appels en attente."""
+    global _start_error
+    _start_error = error
+    _ready.set()
+
+
+async def _wait_ready(name: str) -> None:
+    try:
+        await asyncio.wait_for(_ready.wait(), BROKER_CALL_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"Broker toujours en démarrage après {BROKER_CALL_TIMEOUT_SECONDS:.0f}s (op={name})")
+
+
+async def _invoke(name: str, args: dict):
+    if not _ready.is_set():
+        await _wait_ready(name)
+    if _start_error is not None:
+        raise RuntimeError(f"Broker non démarré : {type(_start_error).__name__}: {_start_error}")
+    result = _ops[name](**args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _send_frame(writer: asyncio.StreamWriter, message: dict) -> None:
+    body = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+    writer.write(_HEADER.pack(len(body)) + body)
+    await writer.drain()
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> dict:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > _MAX_FRAME_BYTES:
+        raise ConnectionError(f"Trame IPC de {size} octets refusée")
+    return json.loads(await reader.readexactly(size))
+
+
+# ---------------------------------------------------------------------------
+# Côté worker (BROKER_MODE=client)
+# ---------------------------------------------------------------------------
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.closed = False
+        self.reader_task = asyncio.ensure_future(self._read_loop())
+
+    async def request(self, op: str, args: dict):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            with metrics.timed("broker_ipc_seconds", op=op):
+                await _send_frame(self.writer, {"id": request_id, "op": op, "args": args, "cid": event_log.correlation_id()})
+                response = await asyncio.wait_for(future, BROKER_CALL_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Timeout IPC après {BROKER_CALL_TIMEOUT_SECONDS:.0f}s en attendant le broker (op={op})")
+        except (ConnectionError, OSError) as e:
+            metrics.inc("broker_ipc_failures_total", op=op)
+            raise RuntimeError(f"Broker injoignable (op={op}) : {e}")
+        finally:
+            self.pending.pop(request_id, None)
+        error = response.get("error")
+        if error is not None:
+            cls = _EXCEPTIONS.get(error["type"])
+            raise cls(error["message"]) if cls else RuntimeError(f"{error['type']}: {error['message']}")
+        return response.get("result")
+
+    async def _read_loop(self):
+        # Tâche créée pendant la première requête : elle n'en garde pas l'identifiant.
+        event_log.set_correlation_id(None)
+        try:
+            while True:
+                message = await _read_frame(self.reader)
+                future = self.pending.get(message.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self.closed = True
+            self.writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connexion au broker perdue"))
+            log.info("🔌 Connexion au broker fermée")
+
+
+async def _get_connection() -> _Connection:
+    global _connection, _connect_lock
+    if _connection is not None and not _connection.closed:
+        return _connection
+    if _connect_lock is None:
+        _connect_lock = asyncio.Lock()
+    async with _connect_lock:
+        if _connection is None or _connection.closed:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + BROKER_CONNECT_TIMEOUT_SECONDS
+            while True:
+                try:
+                    reader, writer = await asyncio.open_unix_connection(BROKER_SOCKET_PATH, limit=_MAX_FRAME_BYTES)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError) as e:
+                    if loop.time() >= deadline:
+                        raise RuntimeError(f"Broker injoignable sur {BROKER_SOCKET_PATH} : {e}")
+                    await asyncio.sleep(0.2)
+            _connection = _Connection(reader, writer)
+            metrics.inc("broker_ipc_connects_total")
+            log.info(f"✅ Worker {os.getpid()} connecté au broker ({BROKER_SOCKET_PATH})")
+    return _connection
+
+
+# ---------------------------------------------------------------------------
+# Côté broker (BROKER_MODE=server)
+# ---------------------------------------------------------------------------
+
+async def start_server() -> None:
+    """Ouvre la socket Unix des workers (hook startup de main en mode server)."""
+    global _server
+    if os.path.exists(BROKER_SOCKET_PATH):
+        os.unlink(BROKER_SOCKET_PATH)   # socket laissée par un processus précédent
+    _server = await asyncio.start_unix_server(_handle_connection, path=BROKER_SOCKET_PATH, limit=_MAX_FRAME_BYTES)
+    os.chmod(BROKER_SOCKET_PATH, 0o600)
+    log.info(f"🔌 Broker à l'écoute sur {BROKER_SOCKET_PATH}")
+
+
+async def stop_server() -> None:
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
+        if os.path.exists(BROKER_SOCKET_PATH):
+            os.unlink(BROKER_SOCKET_PATH)
+
+
+async def _handle_connection(reader, writer) -> None:
+    tasks = set()
+    try:
+        while True:
+            message = await _read_frame(reader)
+            task = asyncio.ensure_future(_serve(message, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, asyncio.CancelledError):
+        pass   # worker parti, ou arrêt du broker (asyncio.run annule les connexions ouvertes)
+    finally:
+        writer.close()
+
+
+async def _serve(message: dict, writer) -> None:
+    event_log.set_correlation_id(message.get("cid"))   # tâche propre à la requête
+    response = {"id": message.get("id")}
+    try:
+        response["result"] = await _invoke(message["op"], message.get("args") or {})
+    except Exception as e:
+        response["error"] = {"type": type(e).__name__, "message": str(e)}
+    try:
+        await _send_frame(writer, response)
+    except (ConnectionError, OSError):
+        pass
@@ -0,0 +1,157 @@
+"""
+Opérations du processus qui possède la connexion cTrader (BROKER_MODE
+embedded ou server), appelées via broker_ipc.call() : directement en mode
+embarqué, par la socket Unix depuis les workers HTTP en mode client.
+Toutes retournent des valeurs sérialisables en JSON.
+
+Importer ce module importe ctrader_trading et le SDK cTrader : main.py le
+fait en tâche de fond après le démarrage de l'app, et jamais en mode
+client.
+"""
+import asyncio
+
+import account_state
+import breakeven
+import event_log
+import journal_reconcile
+import journal_stats
+import metrics
+import request_scheduler
+import signal_dedup
+import signal_queue
+import spot_prices
+import startup_report
+import symbol_catalog
+import trendbar_cache
+import warmup
+from broker_ipc import register
+from ctrader_auth import load_tokens, start_token_refresher
+from ctrader_trading import (
+    CTRADER_ACCOUNT_IDS,
+    add_session_restored_listener,
+    amend_stop_loss,
+    ensure_connected,
+    execute_signal,
+    fetch_trendbars,
+    get_symbol_id,
+    get_symbol_specs,
+    list_accounts,
+    list_all_symbols,
+    reauthenticate_account,
+    start_client_service,
+)
+from supabase_journal import get_supabase
+
+dedup_log = event_log.get_logger("signal_dedup")
+reconcile_log = event_log.get_logger("journal_reconcile")
+
+
+def start_broker(process_signal) -> None:
+    """Démarre tout ce qui dépend de la connexion cTrader (hook startup de main)."""
+    start_client_service()
+    start_token_refresher(on_refreshed=reauthenticate_account)
+    signal_queue.start_signal_workers(process_signal)
+    breakeven.start_breakeven_engine(amend_stop_loss)
+    journal_stats.start_journal_stats()
+    if signal_dedup.SIGNAL_DEDUP_PERSIST:
+        asyncio.get_running_loop().create_task(_load_dedup_keys())
+    asyncio.get_running_loop().create_task(_reconcile_journal_on_startup())
+    # Clôtures (SL/TP) survenues pendant une coupure de la connexion.
+    add_session_restored_listener(journal_reconcile.reconcile_journal)
+    warmup.start_warmup_scheduler()
+
+
+async def _load_dedup_keys():
+    try:
+        count = await asyncio.to_thread(lambda: signal_dedup.load_recent_keys(get_supabase()))
+        dedup_log.info(f"✅ {count} clé(s) d'idempotence rechargée(s)")
+    except Exception as e:
+        dedup_log.warning(f"⚠️ Clés d'idempotence non rechargées : {type(e).__name__}: {e}")
+
+
+async def _reconcile_journal_on_startup():
+    """Met à jour les trades OPEN clôturés pendant l'arrêt (voir journal_reconcile)."""
+    try:
+        await ensure_connected()
+        await journal_reconcile.reconcile_journal()
+    except Exception as e:
+        reconcile_log.warning(f"⚠️ Réconciliation au démarrage impossible : {type(e).__name__}: {e}")
+
+
+async def _execute_signal(symbol: str, direction: str, entry_price, data: dict) -> list:
+    outcomes = await execute_signal(symbol=symbol, direction=direction, entry_price=entry_price, data=data)
+    # Le Future de l'insert Supabase reste dans ce processus.
+    for outcome in outcomes:
+        if outcome.get("result") is not None:
+            outcome["result"] = {k: v for k, v in outcome["result"].items() if k != "trade_id_future"}
+    return outcomes
+
+
+def _dedup_claim(keys: list, signal_ref: str | None = None) -> list:
+    return list(signal_dedup.claim(keys, signal_ref))
+
+
+def _dedup_release(key: str, signal_ref: str | None = None) -> bool:
+    return signal_dedup.release(key, signal_ref)
+
+
+def _signal_submit(data: dict) -> str:
+    signal_id = signal_queue.submit(data)
+    if data.get("idempotency_key"):
+        signal_dedup.set_signal_ref(data["idempotency_key"], signal_id)
+    return signal_id
+
+
+def _account_states() -> dict:
+    return {account_id: account_state.snapshot(account_id) for account_id in CTRADER_ACCOUNT_IDS}
+
+
+async def _list_symbols() -> dict:
+    names = await list_all_symbols()
+    return {"count": len(names), "symbols": names, "catalog": symbol_catalog.stats()}
+
+
+async def _symbol_specs(symbol: str) -> dict:
+    symbol_id, _ = await get_symbol_id(symbol)
+    return {"symbolId": symbol_id, "specs": await get_symbol_specs(symbol_id)}
+
+
+async def _trendbars_sync(symbol: str, days: float) -> dict:
+    symbol_id, _ = await get_symbol_id(symbol)
+    return await trendbar_cache.sync(symbol, symbol_id, days, fetch_trendbars)
+
+
+async def _reload_tokens() -> None:
+    # Nouveau passage par /oauth/login sur un worker : le cache de ce
+    # processus doit reprendre les tokens enregistrés dans Supabase.
+    await asyncio.to_thread(load_tokens)
+
+
+for _name, _func in {
+    "execute_signal": _execute_signal,
+    "dedup_claim": _dedup_claim,
+    "dedup_release": _dedup_release,
+    "dedup_stats": signal_dedup.stats,
+    "signal_submit": _signal_submit,
+    "signal_result": signal_queue.get_result,
+    "signal_queue_stats": signal_queue.stats,
+    "account_states": _account_states,
+    "spots_stats": spot_prices.stats,
+    "breakeven_stats": breakeven.stats,
+    "scheduler_stats": request_scheduler.stats,
+    "warmup_stats": warmup.stats,
+    "warmup_run": warmup.run_warmup,
+    "reconcile": journal_reconcile.reconcile_journal,
+    "last_reconcile": journal_reconcile.last_report,
+    "journal_stats": journal_stats.get_stats_if_changed,
+    "list_accounts": list_accounts,
+    "list_symbols": _list_symbols,
+    "symbol_specs": _symbol_specs,
+    "trendbars_sync": _trendbars_sync,
+    "reload_tokens": _reload_tokens,
+    "metrics_snapshot": metrics.snapshot,
+    "startup_report": startup_report.report,
+    "logging_stats": event_log.stats,
+    "logging_set_level": event_log.set_level,
+}.items():
+    register(_name, _func)
@@ -0,0 +1,33 @@
+"""
+Processus broker du mode multi-workers (voir broker_ipc) : démarre tout ce
+qui dépend de la connexion cTrader (hook startup de main) et sert les
+workers HTTP sur BROKER_SOCKET_PATH - sans serveur HTTP.
+
+Depuis le dossier agent/ :
+    python -m broker_server
+"""
+import asyncio
+import os
+import signal
+
+os.environ["BROKER_MODE"] = "server"
+
+import event_log  # noqa: E402
+import main  # noqa: E402 - BROKER_MODE doit être fixé avant l'import
+
+log = event_log.get_logger("broker_server")
+
+
+async def _serve() -> None:
+    await main.startup_event()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+    log.info("🛑 Arrêt du broker")
+    await main.shutdown_event()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve())
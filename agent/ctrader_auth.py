@@ -17,6 +17,17 @@ RAFRAICHISSEMENT AUTOMATIQUE :
   reconnexion manuelle via /oauth/login (sauf si le refresh_token lui-même
   a été révoqué, ce qui est rare).
 
+CACHE MÉMOIRE + RAFRAICHISSEMENT EN TÂCHE DE FOND :
+- après le premier chargement depuis Supabase, les tokens sont gardés en
+  mémoire (_tokens_cache) et mis à jour à chaque sauvegarde : sur le chemin
+  d'un trade, get_valid_tokens() n'est plus qu'une lecture mémoire ;
+- start_token_refresher() (lancé au démarrage de l'app) rafraîchit le token
+  AVANT qu'il n'entre dans la marge REFRESH_SAFETY_MARGIN_SECONDS, puis
+  appelle on_refreshed(tokens) - utilisé par main.py pour ré-authentifier
+  la session cTrader en cours avec le nouvel access token. Le
+  rafraîchissement synchrone de get_valid_tokens() ne sert plus que de
+  filet de sécurité (ex: tâche de fond pas encore démarrée).
+
 IMPORTANT - Colonne Supabase requise :
 La table ctrader_tokens doit avoir une colonne supplémentaire "issued_at"
 (type int8 / bigint) en plus des colonnes existantes (access_token,
@@ -31,30 +42,50 @@ Variables d'environnement requises (à définir sur Railway) :
     SUPABASE_URL
     SUPABASE_KEY
 """
+import asyncio
 import os
 import time
-from ctrader_open_api import Auth
-from supabase import create_client
+
+import event_log
+import startup_report
+from supabase_journal import get_supabase
+
+log = event_log.get_logger("ctrader_auth")
 
 CLIENT_ID = os.environ["CTRADER_CLIENT_ID"]
 CLIENT_SECRET = os.environ["CTRADER_CLIENT_SECRET"]
 REDIRECT_URI = os.environ["CTRADER_REDIRECT_URI"]
 
-SUPABASE_URL = os.environ["SUPABASE_URL"]
-SUPABASE_KEY = os.environ["SUPABASE_KEY"]
-
 # Marge de sécurité avant l'expiration réelle du token (en secondes) - on
 # rafraîchit un peu en avance plutôt que d'attendre l'expiration exacte,
 # pour éviter tout risque de requête cTrader échouant pile au mauvais moment.
 REFRESH_SAFETY_MARGIN_SECONDS = 300  # 5 minutes
 
-auth = Auth(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
-_supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Avance supplémentaire prise par la tâche de fond sur la marge ci-dessus :
+# le rafraîchissement proactif a lieu à expiration - (marge + avance), donc
+# bien avant que get_valid_tokens() ne considère le token comme expiré.
+BACKGROUND_REFRESH_LEAD_SECONDS = 3600  # 1 heure
+BACKGROUND_RETRY_SECONDS = 60
+
+_auth = None
+_tokens_cache: dict | None = None
+_refresher_task: asyncio.Task | None = None
+
+
+def get_auth():
+    """Client OAuth du SDK, créé au premier appel : importer ctrader_open_api
+    (Twisted, protobuf) coûte plus de 100 ms, inutile au démarrage."""
+    global _auth
+    if _auth is None:
+        with startup_report.phase("ctrader_auth"):
+            from ctrader_open_api import Auth
+            _auth = Auth(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
+    return _auth
 
 
 def get_authorization_url() -> str:
     """URL vers laquelle rediriger l'utilisateur pour qu'il autorise l'app sur son cTID."""
-    return auth.getAuthUri()
+    return get_auth().getAuthUri()
 
 
 def exchange_code_for_token(code: str) -> dict:
@@ -63,7 +94,7 @@ def exchange_code_for_token(code: str) -> dict:
     Attention : le code n'est valide qu'1 minute après réception du callback,
     cette fonction doit donc être appelée immédiatement.
     """
-    token_response = auth.getToken(code)
+    token_response = get_auth().getToken(code)
     _save_tokens(token_response)
     return token_response
 
@@ -78,10 +109,10 @@ def refresh_access_token() -> dict:
     if not tokens or "refreshToken" not in tokens:
         raise RuntimeError("Aucun refresh token disponible — il faut repasser par /oauth/login.")
 
-    print("[ctrader_auth] 🔄 Rafraîchissement automatique de l'access token...", flush=True)
-    token_response = auth.refreshToken(tokens["refreshToken"])
+    log.info("🔄 Rafraîchissement automatique de l'access token...")
+    token_response = get_auth().refreshToken(tokens["refreshToken"])
     _save_tokens(token_response)
-    print("[ctrader_auth] ✅ Access token rafraîchi et sauvegardé.", flush=True)
+    log.info("✅ Access token rafraîchi et sauvegardé.")
     return token_response
 
 
@@ -94,26 +125,33 @@ def _save_tokens(token_response: dict) -> None:
         "token_type": token_response.get("tokenType"),
         "issued_at": int(time.time()),
     }
-    _supabase.table("ctrader_tokens").upsert(row).execute()
+    get_supabase().table("ctrader_tokens").upsert(row).execute()
+    _set_cache(row)
+
+
+def _set_cache(row: dict) -> None:
+    global _tokens_cache
+    _tokens_cache = {
+        "accessToken": row.get("access_token"),
+        "refreshToken": row.get("refresh_token"),
+        "expiresIn": row.get("expires_in"),
+        "tokenType": row.get("token_type"),
+        "issuedAt": row.get("issued_at"),
+    }
 
 
 def load_tokens() -> dict | None:
     """Charge les tokens tels quels depuis Supabase, SANS vérifier ni rafraîchir
     s'ils sont expirés - utilisée en interne par refresh_access_token() et par
     get_valid_tokens(). Pour tout le reste, préférer get_valid_tokens()."""
-    result = _supabase.table("ctrader_tokens").select("*").eq("id", 1).execute()
+    result = get_supabase().table("ctrader_tokens").select("*").eq("id", 1).execute()
     if not result.data:
         return None
     row = result.data[0]
     if not row.get("access_token"):
         return None
-    return {
-        "accessToken": row.get("access_token"),
-        "refreshToken": row.get("refresh_token"),
-        "expiresIn": row.get("expires_in"),
-        "tokenType": row.get("token_type"),
-        "issuedAt": row.get("issued_at"),
-    }
+    _set_cache(row)
+    return dict(_tokens_cache)
 
 
 def is_token_expired(tokens: dict, safety_margin_seconds: int = REFRESH_SAFETY_MARGIN_SECONDS) -> bool:
@@ -139,13 +177,71 @@ def get_valid_tokens() -> dict:
     A utiliser PARTOUT à la place de load_tokens() dès qu'un accessToken
     valide est nécessaire pour parler à l'API cTrader (ensure_connected(),
     list_accounts(), etc. dans ctrader_trading.py).
+
+    Lecture mémoire une fois le cache chargé - Supabase n'est interrogé qu'au
+    premier appel (ou si aucun token n'était encore enregistré).
     """
-    tokens = load_tokens()
+    tokens = dict(_tokens_cache) if _tokens_cache else load_tokens()
     if not tokens:
         raise RuntimeError("Aucun token cTrader trouvé - passe par /oauth/login d'abord.")
 
     if is_token_expired(tokens):
         refresh_access_token()
-        tokens = load_tokens()
+        tokens = dict(_tokens_cache)
 
     return tokens
+
+
+def _seconds_until_background_refresh(tokens: dict) -> float:
+    if not tokens.get("issuedAt") or not tokens.get("expiresIn"):
+        return 0
+    refresh_at = (
+        tokens["issuedAt"] + tokens["expiresIn"]
+        - REFRESH_SAFETY_MARGIN_SECONDS - BACKGROUND_REFRESH_LEAD_SECONDS
+    )
+    return max(0.0, refresh_at - time.time())
+
+
+def start_token_refresher(on_refreshed=None) -> None:
+    """
+    A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup).
+    on_refreshed : coroutine facultative appelée avec les nouveaux tokens
+    après chaque rafraîchissement (ré-authentification de la session cTrader).
+    """
+    global _refresher_task
+    if _refresher_task is None or _refresher_task.done():
+        _refresher_task = asyncio.get_running_loop().create_task(_refresher_loop(on_refreshed))
+
+
+async def _refresher_loop(on_refreshed) -> None:
+    while True:
+        try:
+            tokens = dict(_tokens_cache) if _tokens_cache else await asyncio.to_thread(load_tokens)
+        except Exception as e:
+            log.warning(f"⚠️ Lecture des tokens impossible : {type(e).__name__}: {e}")
+            tokens = None
+
+        if not tokens:
+            # Pas encore de token (premier déploiement, /oauth/login pas fait).
+            await asyncio.sleep(BACKGROUND_RETRY_SECONDS)
+            continue
+
+        delay = _seconds_until_background_refresh(tokens)
+        if delay > 0:
+            # Réveil au plus tard toutes les heures : le cache peut avoir été
+            # renouvelé entre-temps (ex: nouveau passage par /oauth/login).
+            await asyncio.sleep(min(delay, 3600))
+            continue
+
+        try:
+            new_tokens = await asyncio.to_thread(refresh_access_token)
+        except Exception as e:
+            log.warning(f"⚠️ Rafraîchissement en tâche de fond échoué : {type(e).__name__}: {e}")
+            await asyncio.sleep(BACKGROUND_RETRY_SECONDS)
+            continue
+
+        if on_refreshed is not None:
+            try:
+                await on_refreshed(new_tokens)
+            except Exception as e:
+                log.warning(f"⚠️ Ré-authentification après rafraîchissement échouée : {type(e).__name__}: {e}")
@@ -20,21 +20,29 @@ ATTENTION - Points à vérifier avant de faire confiance à ce module :
    allégée ProtoOASymbolsListReq, voir get_symbol_id()).
 2. Le prix d'exécution réel n'est pas garanti égal à entry_price (slippage) -
    idéalement, il faudrait écouter l'event ProtoOAExecutionEvent plutôt que
-   de faire confiance au prix du signal TradingView.
-3. Variables d'environnement requises : CTRADER_ACCOUNT_ID, CTRADER_ENV.
-4. SYMBOL_ALIASES (ci-dessous) fait le pont entre le nom envoyé par le signal
+   de faire confiance au prix du signal TradingView. Le SL/TP est calculé à
+   partir du dernier tick reçu par abonnement (voir spot_prices) quand il
+   est récent, le prix du signal ne servant plus que de repli.
+3. Variables d'environnement requises : CTRADER_ACCOUNT_ID (ou
+   CTRADER_ACCOUNT_IDS en mode multi-comptes), CTRADER_ENV.
+4. SYMBOL_ALIASES (symbol_catalog) fait le pont entre le nom envoyé par le signal
    (ex: 'NAS100', nom générique utilisé côté TradingView/alerte) et le nom
    réel du symbole chez le broker connecté (IC Markets utilise 'USTEC',
    confirmé via la route de diagnostic GET /debug/symbols).
    Si le broker change ou si le nom exact diffère, corriger ici uniquement -
    aucune autre partie du code n'a besoin de changer.
+
+Le reactor n'est PAS démarré à l'import : start_client_service() (lifespan
+de l'app) appelle start_reactor() juste avant de lancer le client.
 """
 import crochet
-crochet.setup()  # démarre le reactor Twisted dans un thread dédié, une seule fois
-print("[ctrader] ✅ crochet.setup() - reactor Twisted démarré dans son propre thread", flush=True)
 
 import os
 import asyncio
+import random
+import time
+from twisted.application.internet import backoffPolicy
+from twisted.internet import defer, reactor
 from ctrader_open_api import Client, TcpProtocol, EndPoints, Protobuf
 from ctrader_open_api.messages.OpenApiMessages_pb2 import (
     ProtoOAApplicationAuthReq,
@@ -44,14 +52,38 @@ from ctrader_open_api.messages.OpenApiMessages_pb2 import (
     ProtoOANewOrderReq,
     ProtoOATraderReq,
     ProtoOAGetAccountListByAccessTokenReq,
+    ProtoOAReconcileReq,
+    ProtoOASubscribeSpotsReq,
+    ProtoOAVersionReq,
+    ProtoOAAmendPositionSLTPReq,
+    ProtoOADealListReq,
+    ProtoOAGetTrendbarsReq,
 )
 from ctrader_open_api.messages.OpenApiModelMessages_pb2 import (
     ProtoOAOrderType,
+    ProtoOAPayloadType,
     ProtoOATradeSide,
+    ProtoOATrendbarPeriod,
 )
 
+import account_state
+import breakeven
+import metrics
+import request_scheduler
+import signal_dedup
+import event_log
+import spot_prices
+import startup_report
+import symbol_catalog
+from symbol_catalog import SYMBOL_ALIASES
+
 from ctrader_auth import load_tokens, get_valid_tokens
-from supabase_journal import log_trade_entry
+from supabase_journal import enqueue_trade_entry, find_trade_ids_by_position
+
+log = event_log.get_logger("ctrader")
+send_log = event_log.get_logger("ctrader.send")        # chaque requête/réponse : debug
+message_log = event_log.get_logger("ctrader.message")  # events poussés par le serveur : debug
+spot_log = event_log.get_logger("ctrader.spot")        # ticks de prix : debug, échantillonnés
 
 CLIENT_ID = os.environ["CTRADER_CLIENT_ID"]
 CLIENT_SECRET = os.environ["CTRADER_CLIENT_SECRET"]
@@ -60,16 +92,22 @@ CLIENT_SECRET = os.environ["CTRADER_CLIENT_SECRET"]
 # moment d'exécuter un trade (voir _require_account_id() ci-dessous).
 _CTRADER_ACCOUNT_ID_RAW = os.environ.get("CTRADER_ACCOUNT_ID")
 CTRADER_ACCOUNT_ID = int(_CTRADER_ACCOUNT_ID_RAW) if _CTRADER_ACCOUNT_ID_RAW else None
-CTRADER_ENV = os.environ.get("CTRADER_ENV", "demo")
-
-# Alias de symboles : nom générique (côté signal/TradingView) -> nom exact
-# chez le broker connecté. IC Markets nomme le Nasdaq 100 "USTEC" (et non
-# "NAS100" comme d'autres brokers/plateformes, ni "US100" comme initialement
-# supposé - confirmé via GET /debug/symbols).
-SYMBOL_ALIASES = {
-    "NAS100": "USTEC",
-}
 
+# Mode multi-comptes (optionnel) : liste d'IDs séparés par des virgules.
+# Chaque signal est alors copié sur TOUS ces comptes, en parallèle, chacun
+# dimensionné sur son propre solde. Tous les comptes sont autorisés sur la
+# même connexion : ils doivent donc être du même type (démo OU réel, selon
+# CTRADER_ENV) et chez le même broker (les symbolIds du catalogue, résolus
+# sur le premier compte, sont partagés). Le premier ID sert de compte
+# principal (catalogue, abonnements aux prix, routes de diagnostic).
+_CTRADER_ACCOUNT_IDS_RAW = os.environ.get("CTRADER_ACCOUNT_IDS", "")
+CTRADER_ACCOUNT_IDS = [int(a) for a in _CTRADER_ACCOUNT_IDS_RAW.split(",") if a.strip()]
+if CTRADER_ACCOUNT_IDS:
+    CTRADER_ACCOUNT_ID = CTRADER_ACCOUNT_IDS[0]
+elif CTRADER_ACCOUNT_ID is not None:
+    CTRADER_ACCOUNT_IDS = [CTRADER_ACCOUNT_ID]
+MULTI_ACCOUNT = len(CTRADER_ACCOUNT_IDS) > 1
+CTRADER_ENV = os.environ.get("CTRADER_ENV", "demo")
 
 def _require_account_id() -> int:
     if CTRADER_ACCOUNT_ID is None:
@@ -79,28 +117,127 @@ def _require_account_id() -> int:
         )
     return CTRADER_ACCOUNT_ID
 
+
+def require_account_ids() -> list:
+    _require_account_id()
+    return CTRADER_ACCOUNT_IDS
+
 HOST = EndPoints.PROTOBUF_DEMO_HOST if CTRADER_ENV == "demo" else EndPoints.PROTOBUF_LIVE_HOST
+# Surcharges facultatives, pour pointer vers le faux serveur local des
+# benchmarks (bench/fake_ctrader_server.py) au lieu des serveurs Spotware.
+HOST = os.environ.get("CTRADER_HOST", HOST)
+PORT = int(os.environ.get("CTRADER_PORT", EndPoints.PROTOBUF_PORT))
 RISK_PERCENT = float(os.environ.get("RISK_PERCENT", "1.0"))
+# Commentaire posé sur chaque ordre du bot : il distingue ses positions des
+# positions manuelles (seules les premières sont suivies par breakeven).
+ORDER_COMMENT = "NASDAQ-Open-Reversal-Bot"
 
 _client = None
+_reactor_started = False
 _symbol_cache = {}
 _connected = False
 
+# Gestion "single-flight" de l'authentification : quand plusieurs webhooks
+# arrivent avant la fin de la première authentification, ils attendent tous
+# la MÊME tâche au lieu d'envoyer chacun leur ProtoOAApplicationAuthReq /
+# ProtoOAAccountAuthReq. _session_generation est incrémenté à chaque
+# déconnexion : une authentification lancée avant la coupure ne peut pas
+# marquer comme authentifiée la nouvelle connexion.
+_loop = None
+_auth_tasks = {"app": None, "account": None}
+_session_generation = 0
+
+# Supervision de la connexion (voir _supervise_connection()) :
+# - sans aucun message reçu depuis PING_IDLE_SECONDS, un ProtoOAVersionReq
+#   sert de ping ; sans réponse sous PING_TIMEOUT_SECONDS, la socket est
+#   jugée morte et fermée de force (reconnexion immédiate par ClientService,
+#   avec backoff exponentiel + jitter) ;
+# - après la reconnexion, la session est restaurée automatiquement
+#   (auth app + comptes, état des comptes, abonnements aux prix) sans
+#   attendre le prochain signal ;
+# - pendant la coupure, les requêtes en vol échouent IMMÉDIATEMENT (au lieu
+#   d'attendre leur timeout de 15 s) et les nouvelles attendent le retour de
+#   la connexion au plus RECONNECT_HOLD_SECONDS avant d'échouer.
+PING_IDLE_SECONDS = float(os.environ.get("CTRADER_PING_IDLE_SECONDS", "10"))
+PING_TIMEOUT_SECONDS = float(os.environ.get("CTRADER_PING_TIMEOUT_SECONDS", "5"))
+RECONNECT_HOLD_SECONDS = float(os.environ.get("CTRADER_RECONNECT_HOLD_SECONDS", "10"))
+
+_transport_up = None        # asyncio.Event, levé tant que la socket est connectée
+_last_received_at = time.monotonic()
+_pending_futures = set()
+_disconnected_at = None
+_supervisor_task = None
+_rebuild_tasks = set()          # reprises du suivi BE en cours (voir _rebuild_breakeven)
+_session_restored_listeners = []
+
+
+class ResponseTimeout(RuntimeError):
+    """Requête envoyée, mais pas de réponse cTrader dans le délai."""
+
+
+class _ImmediateTcpProtocol(TcpProtocol):
+    """
+    TcpProtocol du SDK, mais sans sa file d'envoi : le SDK ne vide celle-ci
+    qu'une fois par seconde (LoopingCall), ce qui ajoutait jusqu'à 1 s à
+    CHAQUE requête. Le débit est désormais limité en amont par
+    request_scheduler ; la LoopingCall ne sert plus qu'aux heartbeats.
+    """
+
+    def send(self, message, instant=False, clientMsgId=None, isCanceled=None):
+        if isCanceled is not None and isCanceled():
+            return
+        super().send(message, instant=True, clientMsgId=clientMsgId)
+
 
 def get_client():
     global _client
     if _client is None:
-        print(f"[ctrader] Création du client vers {HOST}:{EndPoints.PROTOBUF_PORT}", flush=True)
-        _client = Client(HOST, EndPoints.PROTOBUF_PORT, TcpProtocol)
+        log.info(f"Création du client vers {HOST}:{PORT}")
+        # Reconnexion rapide : 0.5 s puis x2 jusqu'à 30 s, avec jitter pour
+        # ne pas synchroniser les tentatives après une coupure générale.
+        _client = Client(
+            HOST, PORT, _ImmediateTcpProtocol,
+            retryPolicy=backoffPolicy(initialDelay=0.5, maxDelay=30.0, factor=2.0, jitter=random.random),
+        )
 
         def _on_connected(client):
-            print("[ctrader] ✅ _on_connected() déclenché - connexion établie", flush=True)
+            log.info("✅ _on_connected() déclenché - connexion établie")
+            if _loop is not None:
+                _loop.call_soon_threadsafe(_on_transport_up)
 
         def _on_disconnected(client, reason):
-            print(f"[ctrader] ❌ _on_disconnected() déclenché - reason={reason}", flush=True)
+            log.warning("❌ _on_disconnected() déclenché", reason=str(getattr(reason, "value", reason)))
+            # Callback exécuté dans le thread du reactor : la remise à zéro de
+            # l'état de session se fait dans la boucle asyncio.
+            if _loop is not None:
+                _loop.call_soon_threadsafe(_reset_session)
 
         def _on_message_received(client, message):
-            print(f"[ctrader] 📩 Message reçu - payloadType={message.payloadType}", flush=True)
+            global _last_received_at
+            _last_received_at = time.monotonic()
+            # Ticks de prix (plusieurs par seconde) : niveau debug et
+            # échantillonnés (LOG_SAMPLING, ctrader.spot=100 par défaut).
+            if message.payloadType == ProtoOAPayloadType.PROTO_OA_SPOT_EVENT:
+                try:
+                    event = Protobuf.extract(message)
+                    spot_prices.on_spot_event(event)
+                    spot_log.debug("Tick de prix", symbol_id=event.symbolId, bid=event.bid, ask=event.ask)
+                except Exception as e:
+                    spot_log.warning(f"⚠️ Tick de prix ignoré : {type(e).__name__}: {e}")
+                return
+            message_log.debug("📩 Message reçu", payload_type=message.payloadType)
+            # Events poussés par le serveur (pas des réponses à nos requêtes) :
+            # ils tiennent à jour l'état local du compte (voir account_state).
+            try:
+                if message.payloadType == ProtoOAPayloadType.PROTO_OA_EXECUTION_EVENT:
+                    event = Protobuf.extract(message)
+                    account_state.apply_execution_event(event)
+                    if _loop is not None:
+                        _loop.call_soon_threadsafe(breakeven.on_execution_event, event)
+                elif message.payloadType == ProtoOAPayloadType.PROTO_OA_TRADER_UPDATE_EVENT:
+                    account_state.apply_trader_updated_event(Protobuf.extract(message))
+            except Exception as e:
+                log.warning(f"⚠️ Event non appliqué à l'état du compte : {type(e).__name__}: {e}")
 
         _client.setConnectedCallback(_on_connected)
         _client.setDisconnectedCallback(_on_disconnected)
@@ -108,10 +245,25 @@ def get_client():
     return _client
 
 
+def start_reactor() -> None:
+    """Démarre le reactor Twisted dans un thread dédié (crochet) - sans effet au second appel."""
+    global _reactor_started
+    if not _reactor_started:
+        with startup_report.phase("reactor"):
+            crochet.setup()
+        _reactor_started = True
+        log.info("✅ crochet.setup() - reactor Twisted démarré dans son propre thread")
+
+
 def start_client_service():
-    """A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup)."""
-    print("[ctrader] Démarrage du client service (thread crochet)...", flush=True)
+    """A appeler UNE SEULE FOIS au démarrage de l'app (lifespan FastAPI)."""
+    global _loop, _transport_up, _supervisor_task
+    start_reactor()
+    log.info("Démarrage du client service (thread crochet)...")
+    _loop = asyncio.get_running_loop()
+    _transport_up = asyncio.Event()
     _start_service_in_reactor_thread()
+    _supervisor_task = _loop.create_task(_supervise_connection())
 
 
 @crochet.run_in_reactor
@@ -121,52 +273,267 @@ def _start_service_in_reactor_thread():
     get_client().startService()
 
 
-@crochet.run_in_reactor
-def _send_in_reactor_thread(request):
-    # client.send() doit être appelé depuis le thread du reactor - crochet
-    # s'en charge et renvoie un EventualResult qu'on peut attendre depuis
-    # n'importe quel autre thread (notamment le thread asyncio de FastAPI).
-    return get_client().send(request)
+def _send_in_reactor_thread(request, loop, future, timeout):
+    # S'exécute DANS le thread du reactor (planifié via reactor.callFromThread) :
+    # client.send() renvoie un Deferred Twisted, qu'on relie directement au
+    # Future asyncio de l'appelant. Aucun thread n'est bloqué pendant l'attente
+    # de la réponse - le Deferred résout le Future via call_soon_threadsafe
+    # sur la boucle d'Uvicorn dès que cTrader répond.
+    try:
+        deferred = get_client().send(request, responseTimeoutInSeconds=timeout)
+    except Exception as e:
+        loop.call_soon_threadsafe(_resolve_future, future, None, e)
+        return
+
+    def _on_result(message):
+        loop.call_soon_threadsafe(_resolve_future, future, message, None)
+
+    def _on_failure(failure):
+        loop.call_soon_threadsafe(_resolve_future, future, None, failure.value)
+
+    deferred.addCallbacks(_on_result, _on_failure)
 
 
-async def _send(request, timeout=15):
-    """Envoie une requête cTrader et attend la réponse, sans bloquer la boucle asyncio principale."""
+def _resolve_future(future, result, error):
+    # Exécuté dans la boucle asyncio : le Future a pu être annulé entre-temps
+    # (timeout côté asyncio), auquel cas la réponse tardive est ignorée.
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+async def _send(request, timeout=15, priority=None):
+    """
+    Envoie une requête cTrader et attend la réponse, sans bloquer la boucle asyncio principale.
+    L'envoi passe d'abord par request_scheduler (limite de débit + priorités) ;
+    priority force la classe (request_scheduler.ORDER / ACCOUNT / BACKGROUND).
+    """
     label = request.payloadType if hasattr(request, "payloadType") else "?"
-    print(f"[ctrader] ➡️ Envoi requête payloadType={label}", flush=True)
-    eventual_result = _send_in_reactor_thread(request)
+    deadline = time.perf_counter() + timeout
+    await _wait_transport_up(label)
+    await request_scheduler.acquire(label, max(0.0, deadline - time.perf_counter()), priority)
+    timeout = max(0.001, deadline - time.perf_counter())
+    send_log.debug("➡️ Envoi requête", payload_type=label)
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    started = time.perf_counter()
+    _pending_futures.add(future)
+    reactor.callFromThread(_send_in_reactor_thread, request, loop, future, timeout)
     try:
-        raw_result = await asyncio.to_thread(eventual_result.wait, timeout)
-        decoded = Protobuf.extract(raw_result)
-        # Détection par attributs plutôt que par import de classe exacte
-        # (le nom/emplacement exact de ProtoOAErrorRes varie selon la version
-        # du SDK installée - errorCode+description est la signature stable
-        # de toute réponse d'erreur cTrader).
-        if hasattr(decoded, "errorCode") and hasattr(decoded, "description"):
-            print(f"[ctrader] ⛔ Erreur cTrader : errorCode={decoded.errorCode} description={decoded.description}", flush=True)
-            raise RuntimeError(f"Erreur cTrader ({decoded.errorCode}) : {decoded.description}")
-        print("[ctrader] ⬅️ Réponse reçue", flush=True)
-        return decoded
-    except crochet.TimeoutError:
-        print(f"[ctrader] ⏱️ TIMEOUT après {timeout}s en attendant la réponse", flush=True)
-        raise RuntimeError(f"Timeout cTrader après {timeout}s en attendant la réponse à payloadType={label}")
+        raw_result = await asyncio.wait_for(future, timeout)
+    except ConnectionError as e:
+        metrics.inc("ctrader_disconnect_failures_total", payload_type=label)
+        raise RuntimeError(f"Connexion cTrader perdue avant la réponse à payloadType={label} : {e}")
+    except (asyncio.TimeoutError, defer.TimeoutError, defer.CancelledError):
+        # Le timeout est géré côté asyncio (wait_for), mais le Deferred du SDK
+        # porte aussi son propre délai (responseTimeoutInSeconds) pour libérer
+        # la requête en attente côté reactor - les deux cas sont équivalents.
+        metrics.inc("ctrader_timeouts_total", payload_type=label)
+        send_log.warning("⏱️ TIMEOUT en attendant la réponse", payload_type=label, timeout_seconds=round(timeout, 1))
+        raise ResponseTimeout(f"Timeout cTrader après {timeout:.1f}s en attendant la réponse à payloadType={label}")
+    finally:
+        _pending_futures.discard(future)
+    rtt = time.perf_counter() - started
+    metrics.observe("ctrader_rtt_seconds", rtt, payload_type=label)
+
+    decoded = Protobuf.extract(raw_result)
+    # Détection par attributs plutôt que par import de classe exacte
+    # (le nom/emplacement exact de ProtoOAErrorRes varie selon la version
+    # du SDK installée - errorCode+description est la signature stable
+    # de toute réponse d'erreur cTrader).
+    if hasattr(decoded, "errorCode") and hasattr(decoded, "description"):
+        metrics.inc("ctrader_errors_total", payload_type=label, error_code=decoded.errorCode)
+        send_log.error("⛔ Erreur cTrader", payload_type=label, error_code=decoded.errorCode, description=decoded.description)
+        raise RuntimeError(f"Erreur cTrader ({decoded.errorCode}) : {decoded.description}")
+    send_log.debug("⬅️ Réponse reçue", payload_type=label, rtt_ms=round(rtt * 1000, 2))
+    return decoded
 
 
 _app_authenticated = False
 
 
+def _reset_session():
+    """
+    Oublie l'authentification (app + compte) après une déconnexion : le
+    prochain appelant reconnecte et ré-authentifie, une seule fois pour tous.
+    """
+    global _connected, _app_authenticated, _session_generation, _disconnected_at
+    _session_generation += 1
+    _connected = False
+    _app_authenticated = False
+    _auth_tasks["app"] = None
+    _auth_tasks["account"] = None
+    account_state.reset()
+    symbol_catalog.mark_stale()
+    spot_prices.reset_subscriptions()
+
+    if _transport_up is not None:
+        _transport_up.clear()
+    if _disconnected_at is None:
+        _disconnected_at = time.monotonic()
+    metrics.set_gauge("ctrader_connected", 0)
+    # Le SDK oublie les requêtes en attente à la déconnexion (leurs Deferred
+    # ne seraient jamais résolus) : on les fait échouer tout de suite.
+    for future in list(_pending_futures):
+        if not future.done():
+            future.set_exception(ConnectionError("déconnexion du serveur cTrader"))
+
+
+def _on_transport_up():
+    """Socket (re)connectée : débloque les requêtes en attente et restaure la session."""
+    global _last_received_at
+    _last_received_at = time.monotonic()
+    if _transport_up is not None:
+        _transport_up.set()
+    metrics.set_gauge("ctrader_connected", 1)
+    if _disconnected_at is not None:
+        metrics.inc("ctrader_reconnects_total")
+        asyncio.ensure_future(_restore_session())
+
+
+def add_session_restored_listener(listener) -> None:
+    """
+    Coroutine appelée (sans argument) après chaque session restaurée suite à
+    une coupure, une fois le suivi BE des comptes repris - ex: la
+    réconciliation du journal, pour les positions clôturées pendant la
+    coupure (voir broker_ops).
+    """
+    _session_restored_listeners.append(listener)
+
+
+async def _restore_session():
+    """
+    Rejoue l'authentification app + comptes (et, via _connect_account,
+    l'état des comptes et les abonnements aux prix) dès la reconnexion,
+    pour que le prochain signal trouve une session prête.
+    """
+    global _disconnected_at
+    if CTRADER_ACCOUNT_ID is None:
+        _disconnected_at = None
+        return
+    try:
+        await ensure_connected()
+    except Exception as e:
+        log.warning(f"⚠️ Restauration de la session échouée : {type(e).__name__}: {e}")
+        return
+    if _disconnected_at is not None:
+        recovery = time.monotonic() - _disconnected_at
+        _disconnected_at = None
+        metrics.observe("ctrader_recovery_seconds", recovery)
+        log.info(f"🔁 Session restaurée {recovery:.2f}s après la coupure")
+    await asyncio.gather(*_rebuild_tasks, return_exceptions=True)
+    for listener in _session_restored_listeners:
+        try:
+            await listener()
+        except Exception as e:
+            log.warning(f"⚠️ {listener.__name__} après restauration en échec : {type(e).__name__}: {e}")
+
+
+async def _wait_transport_up(label) -> None:
+    """Pendant une coupure, attend la reconnexion au plus RECONNECT_HOLD_SECONDS."""
+    if _transport_up is None or _transport_up.is_set():
+        return
+    try:
+        await asyncio.wait_for(_transport_up.wait(), RECONNECT_HOLD_SECONDS)
+    except asyncio.TimeoutError:
+        metrics.inc("ctrader_disconnect_failures_total", payload_type=label)
+        raise RuntimeError(
+            f"Connexion cTrader indisponible depuis plus de {RECONNECT_HOLD_SECONDS}s "
+            f"(requête payloadType={label} non envoyée)"
+        )
+
+
+async def _supervise_connection():
+    """
+    Détection rapide d'une socket morte : ping applicatif (ProtoOAVersionReq)
+    quand la connexion est silencieuse, fermeture forcée s'il reste sans
+    réponse - ClientService se charge alors de la reconnexion. Seul un
+    ResponseTimeout (requête partie, rien reçu) condamne la socket : un ping
+    resté dans la file de request_scheduler ne dit rien de la connexion.
+    """
+    while True:
+        await asyncio.sleep(1.0)
+        if _transport_up is None or not _transport_up.is_set():
+            continue
+        if time.monotonic() - _last_received_at < PING_IDLE_SECONDS:
+            continue
+        try:
+            await ping()
+        except ResponseTimeout:
+            log.error("💀 Pas de réponse au ping - fermeture forcée de la socket")
+            metrics.inc("ctrader_dead_socket_total")
+            reactor.callFromThread(_abort_connection_in_reactor_thread)
+        except (request_scheduler.QueueTimeout, request_scheduler.RequestQueueFull) as e:
+            log.warning(f"⚠️ Ping non envoyé (file cTrader) : {e}")
+        except RuntimeError:
+            continue  # réponse reçue (même en erreur) ou coupure déjà détectée
+        except Exception as e:
+            log.error(f"❌ Supervision de la connexion : {type(e).__name__}: {e}")
+
+
+async def ping(timeout: float = PING_TIMEOUT_SECONDS) -> float:
+    """
+    Aller-retour applicatif (ProtoOAVersionReq) en secondes - contrôle de
+    latence du préchauffage et ping de supervision. Classe ORDER : le ping
+    ne doit pas attendre derrière un téléchargement d'historique.
+    """
+    started = time.perf_counter()
+    await _send(ProtoOAVersionReq(), timeout=timeout, priority=request_scheduler.ORDER)
+    return time.perf_counter() - started
+
+
+def _abort_connection_in_reactor_thread():
+    def _abort(protocol):
+        protocol.transport.abortConnection()
+
+    get_client().whenConnected(failAfterFailures=1).addCallbacks(_abort, lambda failure: None)
+
+
+async def _join_single_flight(key: str, factory):
+    """
+    Attend la tâche partagée _auth_tasks[key], en la créant si aucune n'est
+    en cours. En cas d'échec, la tâche est oubliée pour que l'appel suivant
+    puisse retenter.
+    """
+    global _loop
+    if _loop is None:
+        _loop = asyncio.get_running_loop()
+    task = _auth_tasks[key]
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _auth_tasks[key] = task
+    try:
+        # shield : l'annulation d'UN appelant (ex: requête HTTP abandonnée)
+        # n'annule pas l'authentification attendue par les autres.
+        await asyncio.shield(task)
+    except Exception:
+        if _auth_tasks[key] is task:
+            _auth_tasks[key] = None
+        raise
+
+
 async def _ensure_app_authenticated():
     """
     Authentifie uniquement l'APPLICATION (clientId/clientSecret) - étape
     préalable commune, qu'on connaisse déjà l'account ID ou pas encore.
     """
-    global _app_authenticated
     if _app_authenticated:
         return
+    await _join_single_flight("app", _authenticate_app)
+
+
+async def _authenticate_app():
+    global _app_authenticated
+    generation = _session_generation
     app_auth = ProtoOAApplicationAuthReq()
     app_auth.clientId = CLIENT_ID
     app_auth.clientSecret = CLIENT_SECRET
     await _send(app_auth)
-    _app_authenticated = True
+    if generation == _session_generation:
+        _app_authenticated = True
 
 
 async def list_accounts() -> list:
@@ -176,7 +543,9 @@ async def list_accounts() -> list:
     à mettre dans la variable Railway CTRADER_ACCOUNT_ID - ne nécessite pas de
     connaître cet ID à l'avance.
     """
-    tokens = get_valid_tokens()
+    # Hors de la boucle : premier appel (lecture Supabase) ou token expiré
+    # (rafraîchissement HTTP) sont bloquants.
+    tokens = await asyncio.to_thread(get_valid_tokens)
     if not tokens:
         raise RuntimeError("Aucun token cTrader trouvé - passe par /oauth/login d'abord.")
 
@@ -208,36 +577,203 @@ async def list_accounts() -> list:
 
 
 async def ensure_connected():
-    """Authentifie l'app PUIS le compte spécifique (nécessite CTRADER_ACCOUNT_ID)."""
-    global _connected
+    """
+    Authentifie l'app PUIS le(s) compte(s) (nécessite CTRADER_ACCOUNT_ID ou
+    CTRADER_ACCOUNT_IDS) - en mode multi-comptes, toutes les autorisations
+    partent en parallèle sur la connexion partagée.
+    """
     if _connected:
         return
+    await _join_single_flight("account", _connect_account)
+
+
+async def _connect_account():
+    global _connected
+    generation = _session_generation
 
-    tokens = get_valid_tokens()
+    tokens = await asyncio.to_thread(get_valid_tokens)
     if not tokens:
         raise RuntimeError("Aucun token cTrader trouvé - passe par /oauth/login d'abord.")
 
-    account_id = _require_account_id()
+    account_ids = require_account_ids()
 
     await _ensure_app_authenticated()
 
+    await asyncio.gather(*(_authenticate_account(a, tokens["accessToken"]) for a in account_ids))
+
+    if generation != _session_generation:
+        raise RuntimeError("Connexion cTrader perdue pendant l'authentification du compte")
+    _connected = True
+
+    results = await asyncio.gather(
+        *(_seed_account_state(a) for a in account_ids), return_exceptions=True
+    )
+    for account_id, result in zip(account_ids, results):
+        if isinstance(result, Exception):
+            # Non bloquant : sans état local, execute_trade() retombe sur un
+            # ProtoOATraderReq à chaque signal (comportement historique).
+            log.warning(f"⚠️ Amorçage de l'état du compte {account_id} impossible : {type(result).__name__}: {result}")
+
+    # Catalogue et abonnements aux prix : une fois par connexion, hors du
+    # chemin critique.
+    if symbol_catalog.is_loaded() and not symbol_catalog.is_fresh():
+        asyncio.ensure_future(_refresh_symbol_catalog_quietly())
+    asyncio.ensure_future(_subscribe_traded_spots())
+
+
+async def _authenticate_account(account_id: int, access_token: str) -> None:
     acc_auth = ProtoOAAccountAuthReq()
     acc_auth.ctidTraderAccountId = account_id
-    acc_auth.accessToken = tokens["accessToken"]
+    acc_auth.accessToken = access_token
     await _send(acc_auth)
 
-    _connected = True
+
+async def _subscribe_traded_spots():
+    """Abonne la connexion aux prix (ProtoOASubscribeSpotsReq) des TRADED_SYMBOLS."""
+    try:
+        await _ensure_symbol_catalog()
+        symbol_ids = []
+        for name in symbol_catalog.TRADED_SYMBOLS:
+            symbol_id = symbol_catalog.lookup(SYMBOL_ALIASES.get(name, name))
+            if symbol_id is not None and symbol_id not in spot_prices.subscribed():
+                symbol_ids.append(symbol_id)
+        if not symbol_ids:
+            return
+        req = ProtoOASubscribeSpotsReq()
+        req.ctidTraderAccountId = _require_account_id()
+        req.symbolId.extend(symbol_ids)
+        await _send(req)
+        spot_prices.mark_subscribed(symbol_ids)
+        log.info(f"📈 Abonnement aux prix : symbolIds={symbol_ids}")
+    except Exception as e:
+        log.warning(f"⚠️ Abonnement aux prix impossible : {type(e).__name__}: {e}")
+
+
+async def reauthenticate_account(tokens: dict) -> None:
+    """
+    Ré-authentifie la session cTrader en cours avec un access token tout
+    juste rafraîchi (appelée par la tâche de fond de ctrader_auth). Sans
+    session active, rien à faire : le prochain ensure_connected() utilisera
+    directement le nouveau token.
+    """
+    if not _connected:
+        return
+    for account_id in require_account_ids():
+        try:
+            await _authenticate_account(account_id, tokens["accessToken"])
+        except RuntimeError as e:
+            # Le compte est déjà autorisé sur cette connexion : la session reste
+            # valide, le nouveau token servira à la prochaine reconnexion.
+            if "ALREADY" not in str(e).upper():
+                raise
+    log.info("🔑 Session compte ré-authentifiée avec le nouveau token")
+
+
+async def _seed_account_state(account_id: int) -> None:
+    """
+    Amorce account_state avec le solde (ProtoOATraderReq) et les positions/
+    ordres ouverts (ProtoOAReconcileReq). Appelée une seule fois par session
+    authentifiée - ensuite l'état suit les ProtoOAExecutionEvent poussés.
+    """
+    trader_req = ProtoOATraderReq()
+    trader_req.ctidTraderAccountId = account_id
+    reconcile_req = ProtoOAReconcileReq()
+    reconcile_req.ctidTraderAccountId = account_id
+    as_of = time.time()
+    trader_res, reconcile_res = await asyncio.gather(_send(trader_req), _send(reconcile_req))
+    account_state.seed(account_id, trader_res.trader, reconcile_res)
+    task = asyncio.ensure_future(_rebuild_breakeven(account_id, reconcile_res.position, as_of))
+    _rebuild_tasks.add(task)
+    task.add_done_callback(_rebuild_tasks.discard)
+
+
+async def _rebuild_breakeven(account_id: int, positions, as_of: float) -> None:
+    """
+    Reprend le suivi BE des positions ouvertes du bot (ex: après un
+    redémarrage), en retrouvant leur ligne Supabase par position_id.
+    """
+    positions = [p for p in positions if p.tradeData.comment == ORDER_COMMENT]
+    trade_ids = {}
+    if positions:
+        try:
+            trade_ids = await asyncio.to_thread(find_trade_ids_by_position, [p.positionId for p in positions])
+        except Exception as e:
+            log.warning(f"⚠️ Trades Supabase des positions ouvertes introuvables : {type(e).__name__}: {e}")
+    breakeven.rebuild(account_id, positions, trade_ids, as_of)
+
+
+async def fetch_positions_and_deals(account_id: int, from_ms: int, to_ms: int):
+    """
+    Positions ouvertes (un ProtoOAReconcileReq) et deals exécutés entre
+    from_ms et to_ms (un ProtoOADealListReq, plus d'autres seulement si
+    cTrader signale hasMore), envoyés en parallèle.
+    Retourne (ProtoOAReconcileRes.position, liste de ProtoOADeal).
+    """
+    await ensure_connected()
+    reconcile_req = ProtoOAReconcileReq()
+    reconcile_req.ctidTraderAccountId = account_id
+    deal_req = ProtoOADealListReq()
+    deal_req.ctidTraderAccountId = account_id
+    deal_req.fromTimestamp = from_ms
+    deal_req.toTimestamp = to_ms
+    reconcile_res, deal_res = await asyncio.gather(_send(reconcile_req), _send(deal_req, timeout=30))
+    deals = list(deal_res.deal)
+    while deal_res.hasMore and len(deal_res.deal):
+        # Pages suivantes : cTrader renvoie les deals les plus récents d'abord.
+        deal_req.toTimestamp = min(d.executionTimestamp for d in deal_res.deal) - 1
+        deal_res = await _send(deal_req, timeout=30)
+        deals.extend(deal_res.deal)
+    return list(reconcile_res.position), deals
+
+
+async def fetch_trendbars(symbol_id: int, from_ms: int, to_ms: int) -> list:
+    """
+    Barres M1 de from_ms à to_ms (un ProtoOAGetTrendbarsReq, limité par la
+    classe historique de request_scheduler). Retourne les ProtoOATrendbar
+    bruts - voir trendbar_cache pour le découpage et le stockage.
+    """
+    await ensure_connected()
+    req = ProtoOAGetTrendbarsReq()
+    req.ctidTraderAccountId = _require_account_id()
+    req.symbolId = symbol_id
+    req.period = ProtoOATrendbarPeriod.M1
+    req.fromTimestamp = from_ms
+    req.toTimestamp = to_ms
+    res = await _send(req, timeout=60, priority=request_scheduler.BACKGROUND)
+    return list(res.trendbar)
+
+
+async def amend_stop_loss(account_id: int, position_id: int, stop_loss: float, take_profit: float | None) -> None:
+    """
+    Déplace le SL d'une position (ProtoOAAmendPositionSLTPReq). Le TP est
+    renvoyé tel quel : absent de la requête, cTrader le supprimerait.
+    """
+    req = ProtoOAAmendPositionSLTPReq()
+    req.ctidTraderAccountId = account_id
+    req.positionId = position_id
+    req.stopLoss = stop_loss
+    if take_profit is not None:
+        req.takeProfit = take_profit
+    await _send(req)
 
 
-async def get_account_balance() -> float:
+async def get_account_balance(account_id: int | None = None) -> float:
     """Solde actuel du compte démo, nécessaire pour le calcul du volume à 1% de risque."""
     await ensure_connected()
     req = ProtoOATraderReq()
-    req.ctidTraderAccountId = CTRADER_ACCOUNT_ID
+    req.ctidTraderAccountId = account_id or CTRADER_ACCOUNT_ID
     res = await _send(req)
     return res.trader.balance / 100.0  # cTrader retourne le solde en centimes
 
 
+async def current_balance(account_id: int) -> float:
+    """Solde tenu en mémoire par account_state, ou aller-retour cTrader en secours."""
+    balance = account_state.get_balance(account_id)
+    if balance is not None:
+        return balance
+    return await get_account_balance(account_id)
+
+
 async def get_symbol_id(symbol_name: str):
     """
     Résout le nom du symbole (ex: 'NAS100', 'US100') en symbolId cTrader.
@@ -245,7 +781,8 @@ async def get_symbol_id(symbol_name: str):
 
     Le nom reçu (souvent le nom générique utilisé côté signal/TradingView) est
     d'abord passé par SYMBOL_ALIASES pour obtenir le nom réel utilisé par le
-    broker connecté, avant recherche et mise en cache.
+    broker connecté, puis cherché dans l'index de symbol_catalog (O(1), sans
+    aller-retour une fois le catalogue chargé).
     """
     await ensure_connected()
 
@@ -254,26 +791,100 @@ async def get_symbol_id(symbol_name: str):
     if resolved_name in _symbol_cache:
         return _symbol_cache[resolved_name]
 
+    if not symbol_catalog.is_loaded():
+        await _ensure_symbol_catalog()
+
+    symbol_id = symbol_catalog.lookup(resolved_name)
+    if symbol_id is None and not symbol_catalog.is_fresh() and not symbol_catalog.is_known_missing(resolved_name):
+        # Catalogue issu d'un snapshot : le symbole a pu être ajouté depuis,
+        # on recharge la liste du broker avant de conclure.
+        await _refresh_symbol_catalog()
+        symbol_id = symbol_catalog.lookup(resolved_name)
+
+    if symbol_id is None:
+        symbol_catalog.mark_missing(resolved_name)
+        raise ValueError(
+            f"Symbole '{symbol_name}' (résolu en '{resolved_name}') introuvable sur ce compte cTrader."
+        )
+
+    # ProtoOASymbolsListReq renvoie des ProtoOALightSymbol, sans le champ
+    # 'digits' (réservé à la réponse détaillée ProtoOASymbolByIdReq) : on le
+    # prend dans les specs si elles sont déjà connues.
+    specs = symbol_catalog.get_specs(symbol_id)
+    info = {"symbolId": symbol_id, "digits": specs["digits"] if specs else None}
+    _symbol_cache[resolved_name] = (symbol_id, info)
+    return symbol_id, info
+
+
+_catalog_task = None
+
+
+async def _ensure_symbol_catalog():
+    """
+    Charge le catalogue une seule fois (single-flight) : snapshot Supabase si
+    disponible - le rafraîchissement depuis le broker part alors en tâche de
+    fond - sinon téléchargement direct depuis cTrader.
+    """
+    global _catalog_task
+    if symbol_catalog.is_loaded():
+        return
+    if _catalog_task is None or _catalog_task.done():
+        _catalog_task = asyncio.ensure_future(_load_symbol_catalog())
+    await asyncio.shield(_catalog_task)
+
+
+async def _load_symbol_catalog():
+    account_id = _require_account_id()
+    try:
+        if await asyncio.to_thread(symbol_catalog.load_snapshot, account_id, CTRADER_ENV):
+            log.info(f"📚 Catalogue de symboles chargé depuis le snapshot ({symbol_catalog.stats()['symbols']} symboles)")
+            asyncio.ensure_future(_refresh_symbol_catalog_quietly())
+            return
+    except Exception as e:
+        log.warning(f"⚠️ Snapshot du catalogue illisible : {type(e).__name__}: {e}")
+    await _refresh_symbol_catalog()
+
+
+async def _refresh_symbol_catalog():
+    """
+    Recharge la liste complète depuis le broker, précharge en UNE requête
+    les specs des TRADED_SYMBOLS, puis sauvegarde le snapshot.
+    """
+    account_id = _require_account_id()
     req = ProtoOASymbolsListReq()
-    req.ctidTraderAccountId = CTRADER_ACCOUNT_ID
+    req.ctidTraderAccountId = account_id
     res = await _send(req)
+    symbol_catalog.load_light_symbols(res.symbol)
+    _symbol_cache.clear()
 
-    for s in res.symbol:
-        if s.symbolName.upper() == resolved_name.upper():
-            # ProtoOASymbolsListReq renvoie des ProtoOALightSymbol, qui n'ont
-            # pas toujours le champ 'digits' (réservé à la réponse détaillée
-            # ProtoOASymbolByIdReq) - lecture tolérante, non bloquante.
-            digits = getattr(s, "digits", None)
-            info = {"symbolId": s.symbolId, "digits": digits}
-            _symbol_cache[resolved_name] = (s.symbolId, info)
-            return s.symbolId, info
-
-    raise ValueError(
-        f"Symbole '{symbol_name}' (résolu en '{resolved_name}') introuvable sur ce compte cTrader."
-    )
+    traded_ids = []
+    for name in symbol_catalog.TRADED_SYMBOLS:
+        symbol_id = symbol_catalog.lookup(SYMBOL_ALIASES.get(name, name))
+        if symbol_id is not None:
+            traded_ids.append(symbol_id)
+    if traded_ids:
+        await prefetch_symbol_specs(traded_ids)
 
+    try:
+        await asyncio.to_thread(symbol_catalog.save_snapshot, account_id, CTRADER_ENV)
+    except Exception as e:
+        log.warning(f"⚠️ Snapshot du catalogue non sauvegardé : {type(e).__name__}: {e}")
 
-_symbol_specs_cache = {}
+
+async def _refresh_symbol_catalog_quietly():
+    try:
+        await _refresh_symbol_catalog()
+    except Exception as e:
+        log.warning(f"⚠️ Rafraîchissement du catalogue échoué : {type(e).__name__}: {e}")
+
+
+async def prefetch_symbol_specs(symbol_ids: list) -> None:
+    """Récupère en un seul ProtoOASymbolByIdReq les specs de plusieurs symboles."""
+    req = ProtoOASymbolByIdReq()
+    req.ctidTraderAccountId = _require_account_id()
+    req.symbolId.extend(symbol_ids)
+    res = await _send(req)
+    symbol_catalog.set_specs_from_symbols(res.symbol)
 
 
 async def get_symbol_specs(symbol_id: int) -> dict:
@@ -289,26 +900,18 @@ async def get_symbol_specs(symbol_id: int) -> dict:
     plateforme chez le broker (confirmé : le minimum vu sur MT5 pour un
     symbole ne correspond pas forcément à celui du compte cTrader) - il ne
     faut donc jamais le coder en dur, toujours l'interroger dynamiquement.
-    """
-    if symbol_id in _symbol_specs_cache:
-        return _symbol_specs_cache[symbol_id]
 
-    req = ProtoOASymbolByIdReq()
-    req.ctidTraderAccountId = CTRADER_ACCOUNT_ID
-    req.symbolId.append(symbol_id)
-    res = await _send(req)
+    Les symboles de TRADED_SYMBOLS sont préchargés avec le catalogue : pour
+    eux, c'est une simple lecture mémoire.
+    """
+    specs = symbol_catalog.get_specs(symbol_id)
+    if specs is not None:
+        return specs
 
-    if not res.symbol:
+    await prefetch_symbol_specs([symbol_id])
+    specs = symbol_catalog.get_specs(symbol_id)
+    if specs is None:
         raise ValueError(f"Aucune spec détaillée trouvée pour symbolId={symbol_id}.")
-
-    s = res.symbol[0]
-    specs = {
-        "minVolume": getattr(s, "minVolume", 100),   # défaut prudent: 1.00 lot si absent
-        "maxVolume": getattr(s, "maxVolume", None),
-        "stepVolume": getattr(s, "stepVolume", 100),
-        "digits": getattr(s, "digits", None),
-    }
-    _symbol_specs_cache[symbol_id] = specs
     return specs
 
 
@@ -340,17 +943,43 @@ def calculate_volume(
     return volume_units
 
 
-async def execute_trade(symbol: str, direction: str, entry_price, data: dict) -> dict:
-    """Point d'entrée appelé par main.py à chaque signal reçu - exécution immédiate, sans validation."""
+async def execute_signal(symbol: str, direction: str, entry_price, data: dict) -> list:
+    """
+    Point d'entrée appelé par main.py à chaque signal reçu : exécute le
+    signal sur chaque compte de CTRADER_ACCOUNT_IDS, en parallèle (la
+    latence totale reste proche de celle d'un seul ordre). Retourne un
+    résultat par compte : {"account_id", "result"} ou {"account_id", "error"}.
+    """
+    with metrics.timed("signal_stage_seconds", stage="ensure_connected"):
+        await ensure_connected()
+    account_ids = require_account_ids()
+    results = await asyncio.gather(
+        *(execute_trade(symbol, direction, entry_price, data, account_id=a) for a in account_ids),
+        return_exceptions=True,
+    )
+    out = []
+    for account_id, result in zip(account_ids, results):
+        if isinstance(result, Exception):
+            out.append({"account_id": account_id, "error": f"{type(result).__name__}: {result}"})
+        else:
+            out.append({"account_id": account_id, "result": result})
+    return out
+
+
+async def execute_trade(symbol: str, direction: str, entry_price, data: dict, account_id: int | None = None) -> dict:
+    """Exécution immédiate, sans validation, sur un compte (par défaut le compte principal)."""
     await ensure_connected()
-    account_id = _require_account_id()
+    account_id = account_id or _require_account_id()
 
     sl_points = float(data.get("sl_points", 50))
     tp_points = float(data.get("tp_points", 100))
 
-    symbol_id, specs = await get_symbol_id(symbol)
-    symbol_specs = await get_symbol_specs(symbol_id)
-    balance = await get_account_balance()
+    with metrics.timed("signal_stage_seconds", stage="get_symbol_id"):
+        symbol_id, specs = await get_symbol_id(symbol)
+    with metrics.timed("signal_stage_seconds", stage="get_symbol_specs"):
+        symbol_specs = await get_symbol_specs(symbol_id)
+    with metrics.timed("signal_stage_seconds", stage="get_account_balance"):
+        balance = await current_balance(account_id)
     volume = calculate_volume(
         balance,
         sl_points,
@@ -358,7 +987,10 @@ async def execute_trade(symbol: str, direction: str, entry_price, data: dict) ->
         step_volume_units=symbol_specs["stepVolume"],
     )
 
-    entry_price_f = float(entry_price)
+    # Prix de référence : dernier tick reçu (ask à l'achat, bid à la vente)
+    # s'il est récent, sinon le prix du signal TradingView en repli.
+    live_price = spot_prices.current_price(symbol_id, direction.upper())
+    entry_price_f = live_price if live_price is not None else float(entry_price)
     trade_direction = "LONG" if direction.upper() == "BUY" else "SHORT"
     if direction.upper() == "BUY":
         trade_side = ProtoOATradeSide.BUY
@@ -377,15 +1009,25 @@ async def execute_trade(symbol: str, direction: str, entry_price, data: dict) ->
     order.volume = volume
     order.stopLoss = sl_price
     order.takeProfit = tp_price
-    order.comment = "NASDAQ-Open-Reversal-Bot"
-
-    res = await _send(order)
+    order.comment = ORDER_COMMENT
+
+    with metrics.timed("signal_stage_seconds", stage="order_send"):
+        res = await _send(order)
+    position_id = res.position.positionId if res.HasField("position") else None
+    log.info(
+        "✅ Ordre exécuté", symbol=symbol, direction=trade_direction, account_id=account_id,
+        position_id=position_id, volume=volume, sl=sl_price, tp=tp_price,
+    )
 
     # Journalisation automatique dans Supabase - ne doit jamais faire échouer
-    # le trade lui-même si l'écriture en base rencontre un problème.
-    trade_id = None
+    # le trade lui-même si l'écriture en base rencontre un problème. L'insert
+    # est seulement mis en file (voir supabase_journal.enqueue_trade_entry) :
+    # la réponse au webhook n'attend pas l'aller-retour vers Supabase.
+    trade_id_future = None
     try:
-        trade_id = log_trade_entry(
+        # Seule la mise en file est sur le chemin du signal ; l'écriture
+        # réelle est mesurée par le worker (stage="journal_write").
+        trade_id_future = enqueue_trade_entry(
             symbol=symbol,
             direction=trade_direction,
             entry_price=entry_price_f,
@@ -397,19 +1039,51 @@ async def execute_trade(symbol: str, direction: str, entry_price, data: dict) ->
             risk_percent=RISK_PERCENT,
             account_balance_before=balance,
             source="auto",
+            idempotency_key=(
+                signal_dedup.account_scoped_key(data.get("idempotency_key"), account_id if MULTI_ACCOUNT else None)
+                if signal_dedup.SIGNAL_DEDUP_PERSIST else None
+            ),
+            account_id=account_id if MULTI_ACCOUNT else None,
+            position_id=position_id,
         )
     except Exception as e:
-        print(f"[supabase_journal] Échec de l'enregistrement du trade : {e}")
+        log.warning(f"⚠️ Échec de l'enregistrement du trade : {type(e).__name__}: {e}")
+
+    if position_id is not None:
+        filled_price = res.position.price if res.position.HasField("price") and res.position.price else entry_price_f
+        breakeven.track(
+            account_id, position_id, trade_id_future, trade_direction, filled_price, sl_price, tp_price,
+            symbol_id=symbol_id,
+        )
 
     return {
         "executed_price": entry_price_f,  # approximatif - voir note en tête de fichier
+        "price_source": "spot" if live_price is not None else "signal",
         "volume": volume,
         "sl": sl_price,
         "tp": tp_price,
-        "trade_id": trade_id,
+        "trade_id_future": trade_id_future,  # Future -> id de la ligne Supabase
     }
 
 
+async def warm_up() -> None:
+    """
+    Remplit les caches du chemin critique d'un signal (voir warmup) :
+    catalogue, specs et résolution des TRADED_SYMBOLS, abonnements aux prix.
+    """
+    await _ensure_symbol_catalog()
+    traded_ids = []
+    for name in symbol_catalog.TRADED_SYMBOLS:
+        symbol_id = symbol_catalog.lookup(SYMBOL_ALIASES.get(name, name))
+        if symbol_id is not None and symbol_catalog.get_specs(symbol_id) is None:
+            traded_ids.append(symbol_id)
+    if traded_ids:
+        await prefetch_symbol_specs(traded_ids)
+    for name in symbol_catalog.TRADED_SYMBOLS:
+        await get_symbol_id(name)
+    await _subscribe_traded_spots()
+
+
 async def list_all_symbols() -> list:
     """
     Liste tous les symboles disponibles sur ce compte cTrader, triés par nom.
@@ -417,10 +1091,5 @@ async def list_all_symbols() -> list:
     identifier le nom exact utilisé par le broker pour un instrument donné.
     """
     await ensure_connected()
-
-    req = ProtoOASymbolsListReq()
-    req.ctidTraderAccountId = CTRADER_ACCOUNT_ID
-    res = await _send(req)
-
-    names = sorted(s.symbolName for s in res.symbol)
-    return names
+    await _ensure_symbol_catalog()
+    return symbol_catalog.names()
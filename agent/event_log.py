@@ -0,0 +1,234 @@
+"""
+Journalisation structurée, hors du chemin critique.
+
+Avant : chaque message cTrader (envoi, réponse, event poussé) faisait un
+print(..., flush=True) synchrone - un appel système par message, depuis le
+thread du reactor ou depuis la boucle asyncio. Ici :
+- log.info("message", champ=valeur) dépose un tuple dans une file en
+  mémoire (deque, sans verrou, utilisable depuis n'importe quel thread) et
+  rend la main ; un thread d'écriture la vide toutes les
+  LOG_FLUSH_INTERVAL_SECONDS en UN write + flush par lot (tout de suite
+  pour un warning, une erreur ou une file à moitié pleine) ;
+- un niveau par catégorie, hérité par préfixe : LOG_LEVELS="ctrader=debug"
+  vaut aussi pour ctrader.send et ctrader.spot. Un message sous le niveau
+  est écarté avant toute mise en forme - passer les valeurs en champs
+  plutôt qu'en f-string sur les chemins chauds ;
+- échantillonnage 1 sur N par catégorie (LOG_SAMPLING="ctrader.spot=100") :
+  chaque événement gardé porte "sampled": N ;
+- un identifiant de corrélation par signal (contextvars), posé par
+  receive_signal() et ajouté à chaque événement : webhook -> ordre ->
+  journal Supabase -> Telegram, y compris à travers broker_ipc et
+  signal_queue ;
+- sortie JSON, une ligne par événement (LOG_FORMAT=json, défaut), ou texte
+  lisible "[catégorie] message champ=valeur" (LOG_FORMAT=text).
+
+Si la file est pleine (LOG_QUEUE_MAX), les événements les plus anciens
+sont perdus et comptés (stats()["dropped"]) - le code appelant n'attend
+jamais. Les champs doivent être des valeurs simples : ils ne sont mis en
+forme qu'au moment de l'écriture.
+
+Variables d'environnement :
+    LOG_LEVEL      (défaut info)
+    LOG_LEVELS     ex: "ctrader=debug,supabase_journal=warning"
+    LOG_SAMPLING   ex: "ctrader.spot=100" (défaut)
+    LOG_FORMAT     json | text
+"""
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+_LEVEL_NAMES = {value: name for name, value in _LEVELS.items()}
+
+
+def _parse_pairs(raw: str) -> dict:
+    pairs = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            pairs[name.strip()] = value.strip().lower()
+    return pairs
+
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info").lower()
+LOG_LEVELS = {name: _LEVELS[value] for name, value in _parse_pairs(os.environ.get("LOG_LEVELS", "")).items()}
+LOG_SAMPLING = {name: int(value) for name, value in _parse_pairs(os.environ.get("LOG_SAMPLING", "ctrader.spot=100")).items()}
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+LOG_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LOG_FLUSH_INTERVAL_SECONDS", "0.2"))
+LOG_QUEUE_MAX = int(os.environ.get("LOG_QUEUE_MAX", "10000"))
+_WAKE_DEPTH = LOG_QUEUE_MAX // 2   # rafale : écriture sans attendre l'intervalle
+
+_correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+_queue = deque(maxlen=LOG_QUEUE_MAX)
+_wake = threading.Event()
+_write_lock = threading.Lock()
+_writer = None
+_loggers = {}
+_stats = {"emitted": 0, "written": 0, "dropped": 0, "sampled_out": 0, "batches": 0, "write_errors": 0}
+
+
+class Logger:
+    __slots__ = ("category", "level", "every", "_counter")
+
+    def __init__(self, category: str):
+        self.category = category
+        self._counter = itertools.count()
+        self._configure()
+
+    def _configure(self) -> None:
+        self.level = _resolve(LOG_LEVELS, self.category, _LEVELS.get(LOG_LEVEL, INFO))
+        self.every = max(1, _resolve(LOG_SAMPLING, self.category, 1))
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def debug(self, msg: str, **fields) -> None:
+        if DEBUG >= self.level:
+            self._emit(DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields) -> None:
+        if INFO >= self.level:
+            self._emit(INFO, msg, fields)
+
+    def warning(self, msg: str, **fields) -> None:
+        if WARNING >= self.level:
+            self._emit(WARNING, msg, fields)
+
+    def error(self, msg: str, **fields) -> None:
+        if ERROR >= self.level:
+            self._emit(ERROR, msg, fields)
+
+    def _emit(self, level: int, msg: str, fields: dict) -> None:
+        if self.every > 1:
+            if next(self._counter) % self.every:
+                _stats["sampled_out"] += 1
+                return
+            fields["sampled"] = self.every
+        if len(_queue) >= LOG_QUEUE_MAX:
+            _stats["dropped"] += 1
+        _queue.append((time.time(), level, self.category, msg, fields, _correlation_id.get()))
+        _stats["emitted"] += 1
+        if _writer is None:
+            _start_writer()
+        if level >= WARNING or len(_queue) >= _WAKE_DEPTH:
+            _wake.set()
+
+
+def _resolve(table: dict, category: str, default):
+    """Valeur de la catégorie, ou de son plus proche parent ("a.b" -> "a")."""
+    name = category
+    while True:
+        if name in table:
+            return table[name]
+        if "." not in name:
+            return default
+        name = name.rsplit(".", 1)[0]
+
+
+def get_logger(category: str) -> Logger:
+    logger = _loggers.get(category)
+    if logger is None:
+        logger = _loggers[category] = Logger(category)
+    return logger
+
+
+def set_level(category: str, level: str) -> None:
+    """Change à chaud le niveau d'une catégorie (et de ses sous-catégories sans niveau propre)."""
+    if level.lower() not in _LEVELS:
+        raise ValueError(f"Niveau inconnu : {level} (attendu : {', '.join(_LEVELS)})")
+    LOG_LEVELS[category] = _LEVELS[level.lower()]
+    for logger in _loggers.values():
+        logger._configure()
+
+
+# ---------------------------------------------------------------------------
+# Corrélation
+# ---------------------------------------------------------------------------
+
+def correlation_id() -> str | None:
+    return _correlation_id.get()
+
+
+def set_correlation_id(value: str | None) -> None:
+    """Identifiant ajouté aux événements du contexte courant (tâche asyncio ou thread)."""
+    _correlation_id.set(value)
+
+
+# ---------------------------------------------------------------------------
+# Ecriture
+# ---------------------------------------------------------------------------
+
+def _start_writer() -> None:
+    global _writer
+    with _write_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name="event-log", daemon=True)
+            _writer.start()
+
+
+def _writer_loop() -> None:
+    while True:
+        _wake.wait(LOG_FLUSH_INTERVAL_SECONDS)
+        _wake.clear()
+        flush()
+
+
+def flush() -> None:
+    """Ecrit tout ce qui est en file (thread d'écriture, arrêt de l'app, atexit)."""
+    with _write_lock:
+        lines = []
+        while _queue:
+            try:
+                lines.append(_format(*_queue.popleft()))
+            except IndexError:
+                break
+        if not lines:
+            return
+        try:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+            _stats["written"] += len(lines)
+            _stats["batches"] += 1
+        except Exception:
+            _stats["write_errors"] += 1
+
+
+def _format(ts, level, category, msg, fields, cid) -> str:
+    if LOG_FORMAT == "text":
+        extra = "".join(f" {key}={value}" for key, value in fields.items())
+        suffix = f" cid={cid}" if cid else ""
+        return f"[{category}] {msg}{extra}{suffix}\n"
+    event = {
+        "ts": datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": _LEVEL_NAMES[level],
+        "cat": category,
+        "msg": msg,
+    }
+    if cid:
+        event["cid"] = cid
+    event.update(fields)
+    return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+
+atexit.register(flush)
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "queue_depth": len(_queue),
+        "format": LOG_FORMAT,
+        "default_level": LOG_LEVEL,
+        "levels": {name: _LEVEL_NAMES[value] for name, value in LOG_LEVELS.items()},
+        "sampling": dict(LOG_SAMPLING),
+        "categories": {name: _LEVEL_NAMES[logger.level] for name, logger in sorted(_loggers.items())},
+    }
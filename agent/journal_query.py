@@ -0,0 +1,190 @@
+"""
+Lecture paginée de la table trades (GET /journal/trades et
+GET /journal/trades/export dans main.py).
+
+Le dashboard et les outils lisaient la table entière (select *, sans
+limite) : taille de réponse et durée de requête croissaient avec le
+journal. Ici :
+
+- pagination par clé (keyset) sur (entry_time, id), du plus récent au plus
+  ancien : chaque page est une requête bornée par un index, sans OFFSET,
+  donc à coût constant quelle que soit la profondeur. Le curseur renvoyé
+  (next_cursor) est opaque pour le client. Les trades sans entry_time
+  (saisies manuelles incomplètes) viennent en dernier (nullslast), par id
+  décroissant ;
+- projection : seules les colonnes demandées (fields=...) sont lues,
+  parmi TRADE_COLUMNS ;
+- filtres symbol, status, source et plage de dates sur entry_time ;
+- export NDJSON ou CSV en streaming : les pages sont lues et envoyées au
+  fil de l'eau, la mémoire reste bornée à une page ;
+- lectures avec leurs propres tentatives (read_with_retry) : courtes, sans
+  rejouer une requête refusée (4xx : colonne, filtre ou curseur invalide),
+  et sans toucher aux statistiques de la file d'écriture.
+
+Index Supabase recommandé :
+    create index trades_entry_time_id_idx on trades (entry_time desc nulls last, id desc);
+"""
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+
+from postgrest.exceptions import APIError
+
+import event_log
+from supabase_journal import get_supabase
+
+log = event_log.get_logger("journal_query")
+
+JOURNAL_PAGE_MAX = int(os.environ.get("JOURNAL_PAGE_MAX", "500"))
+JOURNAL_EXPORT_PAGE_SIZE = int(os.environ.get("JOURNAL_EXPORT_PAGE_SIZE", "1000"))
+JOURNAL_READ_RETRIES = int(os.environ.get("JOURNAL_READ_RETRIES", "2"))
+JOURNAL_READ_RETRY_BASE_SECONDS = 0.2
+
+TRADE_COLUMNS = (
+    "id", "symbol", "direction", "source", "entry_time", "entry_price", "sl_price", "tp_price",
+    "sl_points", "tp_points", "volume", "risk_percent", "account_balance_before", "status",
+    "be_triggered", "be_time", "exit_time", "exit_price", "pnl", "comment",
+    "account_id", "position_id", "idempotency_key",
+)
+DEFAULT_COLUMNS = (
+    "id", "symbol", "direction", "source", "entry_time", "entry_price", "sl_price", "tp_price",
+    "volume", "status", "be_triggered", "exit_time", "exit_price", "pnl",
+)
+
+
+class InvalidQuery(ValueError):
+    """Paramètre de requête invalide - la route répond 400."""
+
+
+def parse_fields(fields: str | None) -> list:
+    if not fields:
+        return list(DEFAULT_COLUMNS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in TRADE_COLUMNS]
+    if unknown:
+        raise InvalidQuery(f"Colonne(s) inconnue(s) : {', '.join(unknown)}")
+    # La clé de pagination est toujours lue (nécessaire au curseur).
+    for key in ("entry_time", "id"):
+        if key not in requested:
+            requested.append(key)
+    return requested
+
+
+def encode_cursor(row: dict) -> str:
+    raw = json.dumps([row["entry_time"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(entry_time, id) ; entry_time vaut None pour un trade sans date d'entrée."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        entry_time, trade_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (None if entry_time is None else str(entry_time)), int(trade_id)
+    except Exception:
+        raise InvalidQuery("Curseur invalide")
+
+
+def _is_client_error(e: Exception) -> bool:
+    """Requête refusée par PostgREST (4xx) : la rejouer donnerait la même erreur."""
+    if not isinstance(e, APIError):
+        return False
+    code = str(e.code or "")
+    # Codes HTTP bruts (réponse non JSON), erreurs de requête/schéma
+    # PostgREST (PGRST1xx, PGRST2xx), SQLSTATE données invalides (22) et
+    # syntaxe/colonne inconnue (42).
+    return code.startswith(("4", "PGRST1", "PGRST2", "22", "42"))
+
+
+async def read_with_retry(call):
+    """Exécute une lecture Supabase (synchrone) hors de la boucle, avec quelques tentatives courtes."""
+    for attempt in range(JOURNAL_READ_RETRIES + 1):
+        try:
+            return await asyncio.to_thread(call)
+        except Exception as e:
+            if _is_client_error(e) or attempt == JOURNAL_READ_RETRIES:
+                log.warning(f"⚠️ Lecture du journal en échec : {type(e).__name__}: {e}")
+                raise
+            await asyncio.sleep(JOURNAL_READ_RETRY_BASE_SECONDS * (2 ** attempt))
+
+
+def _build_query(columns: list, filters: dict, cursor: tuple | None, limit: int):
+    query = get_supabase().table("trades").select(",".join(columns))
+    if filters.get("symbol"):
+        query = query.eq("symbol", filters["symbol"])
+    if filters.get("status"):
+        statuses = [s.strip() for s in filters["status"].split(",") if s.strip()]
+        query = query.in_("status", statuses)
+    if filters.get("source"):
+        query = query.eq("source", filters["source"])
+    if filters.get("date_from"):
+        query = query.gte("entry_time", filters["date_from"])
+    if filters.get("date_to"):
+        query = query.lt("entry_time", filters["date_to"])
+    if cursor is not None:
+        entry_time, trade_id = cursor
+        if entry_time is None:
+            # Déjà dans la queue sans entry_time : seul l'id départage.
+            query = query.is_("entry_time", "null").lt("id", trade_id)
+        else:
+            # (entry_time, id) < (curseur) en ordre décroissant, puis les
+            # lignes sans entry_time (classées après toutes les autres).
+            query = query.or_(
+                f'entry_time.lt."{entry_time}",and(entry_time.eq."{entry_time}",id.lt.{trade_id}),'
+                f'entry_time.is.null'
+            )
+    return query.order("entry_time", desc=True, nullsfirst=False).order("id", desc=True).limit(limit)
+
+
+async def fetch_page(columns: list, filters: dict, cursor: str | None, limit: int) -> dict:
+    """Une page de trades et le curseur de la suivante (None en fin de journal)."""
+    limit = max(1, min(limit, JOURNAL_PAGE_MAX))
+    position = decode_cursor(cursor) if cursor else None
+    # Une ligne de plus que demandé : indique s'il reste une page sans
+    # requête de comptage.
+    rows = (await read_with_retry(lambda: _build_query(columns, filters, position, limit + 1).execute())).data
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "trades": rows,
+        "count": len(rows),
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+    }
+
+
+async def iter_rows(columns: list, filters: dict):
+    """Parcourt tout l'intervalle filtré, page par page (générateur asynchrone de lignes)."""
+    position = None
+    while True:
+        rows = (await read_with_retry(
+            lambda: _build_query(columns, filters, position, JOURNAL_EXPORT_PAGE_SIZE).execute()
+        )).data
+        for row in rows:
+            yield row
+        if len(rows) < JOURNAL_EXPORT_PAGE_SIZE:
+            return
+        position = (rows[-1]["entry_time"], rows[-1]["id"])
+
+
+async def stream_ndjson(columns: list, filters: dict):
+    async for row in iter_rows(columns, filters):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+async def stream_csv(columns: list, filters: dict):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    async for row in iter_rows(columns, filters):
+        writer.writerow(row)
+        count += 1
+        # Envoi par blocs plutôt que ligne par ligne.
+        if count % 200 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
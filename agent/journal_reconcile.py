@@ -0,0 +1,169 @@
+"""
+Réconciliation entre les positions réelles chez cTrader et les lignes
+status = 'OPEN' de la table trades.
+
+Après un redéploiement sur Railway, le processus ne sait pas lesquelles de
+ces lignes correspondent encore à une position ouverte : les clôtures
+survenues pendant l'arrêt n'ont été vues par personne (voir breakeven).
+
+Une passe (au démarrage, et à la demande via POST /journal/reconcile)
+coûte quelques allers-retours, quel que soit le nombre de trades :
+- UNE requête Supabase pour toutes les lignes OPEN ;
+- par compte, UN ProtoOAReconcileReq (positions ouvertes) et UN
+  ProtoOADealListReq (deals depuis l'entrée la plus ancienne, au plus
+  RECONCILE_MAX_LOOKBACK_DAYS jours), en parallèle ;
+- jointure en mémoire sur trades.position_id ;
+- les clôtures trouvées passent par la file d'écriture du journal
+  (supabase_journal.enqueue_trade_update) : seules les colonnes de clôture
+  sont envoyées, dans l'ordre des autres écritures de la ligne - une mise à
+  jour BE ou une clôture concurrente n'est jamais écrasée.
+
+Une ligne sans position_id (antérieure à cette colonne), ou dont la
+position n'est plus ouverte mais sans deal de clôture dans la fenêtre, est
+laissée telle quelle et comptée dans le rapport.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import breakeven
+import event_log
+from ctrader_trading import CTRADER_ACCOUNT_ID, MULTI_ACCOUNT, fetch_positions_and_deals, require_account_ids
+from journal_query import read_with_retry
+from supabase_journal import enqueue_trade_update, flush_journal, get_supabase
+
+log = event_log.get_logger("journal_reconcile")
+
+RECONCILE_MAX_LOOKBACK_DAYS = float(os.environ.get("RECONCILE_MAX_LOOKBACK_DAYS", "7"))
+# Ecart max entre le prix de clôture et le SL/TP, en fraction de la
+# distance SL-TP, pour attribuer la clôture à l'un des deux niveaux.
+RECONCILE_LEVEL_TOLERANCE = float(os.environ.get("RECONCILE_LEVEL_TOLERANCE", "0.1"))
+
+# trades.account_id n'existe qu'en mode multi-comptes (voir supabase_journal).
+_COLUMNS = ", ".join(
+    ["id", "position_id", "entry_time", "entry_price", "sl_price", "tp_price", "be_triggered"]
+    + (["account_id"] if MULTI_ACCOUNT else [])
+)
+
+_lock = asyncio.Lock()
+_last_report = None
+
+
+async def reconcile_journal() -> dict:
+    """Exécute une passe de réconciliation (une seule à la fois) et retourne son rapport."""
+    global _last_report
+    async with _lock:
+        started = time.perf_counter()
+        report = await _reconcile()
+        report["duration_seconds"] = round(time.perf_counter() - started, 3)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        _last_report = report
+    log.info(f"✅ {report}")
+    return report
+
+
+def last_report() -> dict | None:
+    return _last_report
+
+
+async def _reconcile() -> dict:
+    open_rows = (await read_with_retry(
+        lambda: get_supabase().table("trades").select(_COLUMNS).eq("status", "OPEN").execute()
+    )).data
+    report = {"open_rows": len(open_rows), "still_open": 0, "closed": 0, "unmatched": 0, "accounts": {}}
+    if not open_rows:
+        return report
+
+    rows_by_account = defaultdict(list)
+    for row in open_rows:
+        if row.get("position_id") is None:
+            report["unmatched"] += 1
+            continue
+        account_id = row.get("account_id") if MULTI_ACCOUNT else CTRADER_ACCOUNT_ID
+        rows_by_account[account_id].append(row)
+
+    now_ms = int(time.time() * 1000)
+    floor_ms = now_ms - int(RECONCILE_MAX_LOOKBACK_DAYS * 86400 * 1000)
+    account_ids = [a for a in require_account_ids() if a in rows_by_account]
+    fetched = await asyncio.gather(
+        *(
+            fetch_positions_and_deals(account_id, max(floor_ms, _oldest_entry_ms(rows_by_account[account_id])), now_ms)
+            for account_id in account_ids
+        ),
+        return_exceptions=True,
+    )
+
+    closed_rows = []
+    for account_id, result in zip(account_ids, fetched):
+        rows = rows_by_account[account_id]
+        if isinstance(result, Exception):
+            report["accounts"][account_id] = f"{type(result).__name__}: {result}"
+            report["unmatched"] += len(rows)
+            continue
+        positions, deals = result
+        open_ids = {p.positionId for p in positions}
+        closing = defaultdict(list)
+        for deal in deals:
+            if deal.HasField("closePositionDetail"):
+                closing[deal.positionId].append(deal)
+
+        for row in rows:
+            position_id = row["position_id"]
+            if position_id in open_ids:
+                report["still_open"] += 1
+            elif position_id in closing:
+                closed_rows.append((row, _exit_fields(row, closing[position_id])))
+            else:
+                report["unmatched"] += 1
+        report["accounts"][account_id] = {"positions": len(open_ids), "deals": len(deals)}
+
+    for row, exit_fields in closed_rows:
+        enqueue_trade_update(row["id"], exit_fields)
+        account_id = row.get("account_id") if MULTI_ACCOUNT else CTRADER_ACCOUNT_ID
+        breakeven.forget(account_id, row["position_id"])
+    report["closed"] = len(closed_rows)
+    if closed_rows:
+        try:
+            await flush_journal()
+        except asyncio.TimeoutError:
+            log.warning("⚠️ Clôtures encore en file d'écriture (rejouées via journal_wal si besoin)")
+    return report
+
+
+def _oldest_entry_ms(rows: list) -> int:
+    oldest = min(datetime.fromisoformat(row["entry_time"]) for row in rows)
+    return int(oldest.timestamp() * 1000)
+
+
+def _exit_fields(row: dict, deals: list) -> dict:
+    """Champs de clôture d'une ligne à partir de ses deals de clôture (clôtures partielles cumulées)."""
+    deals = sorted(deals, key=lambda d: d.executionTimestamp)
+    last = deals[-1]
+    pnl = 0.0
+    for deal in deals:
+        detail = deal.closePositionDetail
+        money_digits = detail.moneyDigits if detail.HasField("moneyDigits") else 2
+        pnl += (detail.grossProfit + detail.swap + detail.commission) / (10 ** money_digits)
+    exit_price = last.executionPrice
+    return {
+        "status": _exit_status(row, exit_price),
+        "exit_time": datetime.fromtimestamp(last.executionTimestamp / 1000, timezone.utc).isoformat(),
+        "exit_price": exit_price,
+        "pnl": round(pnl, 2),
+    }
+
+
+def _exit_status(row: dict, exit_price: float) -> str:
+    sl, tp = row.get("sl_price"), row.get("tp_price")
+    if sl is None or tp is None or sl == tp:
+        return "CLOSED_MANUAL"
+    tolerance = abs(tp - sl) * RECONCILE_LEVEL_TOLERANCE
+    if abs(exit_price - tp) <= tolerance:
+        return "CLOSED_TP"
+    if row.get("be_triggered") and abs(exit_price - row["entry_price"]) <= tolerance:
+        return "CLOSED_BE"
+    if abs(exit_price - sl) <= tolerance:
+        return "CLOSED_SL"
+    return "CLOSED_MANUAL"
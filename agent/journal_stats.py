@@ -0,0 +1,347 @@
+"""
+Statistiques du journal calculées côté agent (GET /journal/stats).
+
+Le dashboard (src/App.jsx) télécharge toute la table trades à chaque
+affichage et recalcule PnL, win rate et stats mensuelles dans le
+navigateur : de plus en plus lent à chaque trade. Ici :
+
+- les colonnes utiles (temps d'entrée/sortie, statut, PnL, risque) sont
+  tenues en mémoire dans des tableaux NumPy ; chargées une fois au
+  démarrage (pages de JOURNAL_STATS_PAGE_SIZE lignes, par id croissant),
+  puis mises à jour ligne par ligne à chaque écriture réussie du journal
+  (supabase_journal.add_write_listener) - sans relire la table ;
+- un rechargement complet a lieu toutes les JOURNAL_STATS_RELOAD_SECONDS,
+  pour intégrer les trades saisis à la main depuis le dashboard (écrits
+  directement dans Supabase, sans passer par l'agent) ;
+- les statistiques (courbe d'equity, drawdown, win rate, R-multiples,
+  ventilation par mois et par session) sont calculées en quelques passes
+  vectorisées sur ces colonnes, puis mises en cache jusqu'à la prochaine
+  modification ; une empreinte des colonnes sert d'ETag (réponse 304 si le
+  dashboard a déjà la bonne version) - inchangée après un rechargement qui
+  n'apporte rien, ou après un redémarrage.
+
+Ces colonnes ne vivent que dans le processus qui écrit le journal (mode
+embedded ou broker, voir broker_ops) : les workers HTTP du mode client
+n'en ont pas de copie, ils demandent les statistiques au broker.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import event_log
+from journal_query import read_with_retry
+from supabase_journal import add_write_listener, get_supabase
+
+log = event_log.get_logger("journal_stats")
+
+JOURNAL_STATS_RELOAD_SECONDS = float(os.environ.get("JOURNAL_STATS_RELOAD_SECONDS", "300"))
+JOURNAL_STATS_PAGE_SIZE = int(os.environ.get("JOURNAL_STATS_PAGE_SIZE", "1000"))
+JOURNAL_STATS_MAX_CURVE_POINTS = int(os.environ.get("JOURNAL_STATS_MAX_CURVE_POINTS", "500"))
+
+_COLUMNS = "id, entry_time, exit_time, status, pnl, risk_percent, account_balance_before"
+_STATUSES = ("OPEN", "CLOSED_TP", "CLOSED_SL", "CLOSED_BE", "CLOSED_MANUAL")
+_STATUS_CODES = {name: code for code, name in enumerate(_STATUSES)}
+_OTHER_STATUS = len(_STATUSES)
+# Sessions de marché par heure d'entrée UTC : [début, fin[.
+_SESSIONS = (("Asie", 0), ("Londres", 7), ("New York", 13), ("Hors session", 21))
+
+
+def _parse_ts(value) -> float:
+    if not value:
+        return np.nan
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value) if value is not None and value != "" else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class _TradeColumns:
+    """Colonnes NumPy d'un trade par ligne, avec index id -> ligne et croissance par doublement."""
+
+    _FIELDS = ("entry_ts", "exit_ts", "pnl", "risk")
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.index = {}
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        for field in self._FIELDS:
+            setattr(self, field, np.full(capacity, np.nan))
+
+    def _grow(self) -> None:
+        capacity = len(self.ids) * 2
+        self.ids = np.resize(self.ids, capacity)
+        self.status = np.resize(self.status, capacity)
+        for field in self._FIELDS:
+            column = np.full(capacity, np.nan)
+            column[:self.size] = getattr(self, field)[:self.size]
+            setattr(self, field, column)
+
+    def upsert(self, trade_id: int, fields: dict) -> None:
+        i = self.index.get(trade_id)
+        if i is None:
+            if self.size == len(self.ids):
+                self._grow()
+            i = self.index[trade_id] = self.size
+            self.size += 1
+            self.ids[i] = trade_id
+            self.status[i] = 0
+            for field in self._FIELDS:
+                getattr(self, field)[i] = np.nan
+        if "entry_time" in fields:
+            self.entry_ts[i] = _parse_ts(fields["entry_time"])
+        if "exit_time" in fields:
+            self.exit_ts[i] = _parse_ts(fields["exit_time"])
+        if "status" in fields:
+            self.status[i] = _STATUS_CODES.get(fields["status"], _OTHER_STATUS)
+        if "pnl" in fields:
+            self.pnl[i] = _to_float(fields["pnl"])
+        if "risk_percent" in fields or "account_balance_before" in fields:
+            risk_percent = _to_float(fields.get("risk_percent"))
+            balance = _to_float(fields.get("account_balance_before"))
+            self.risk[i] = balance * risk_percent / 100.0
+
+    def view(self) -> dict:
+        n = self.size
+        return {
+            "ids": self.ids[:n].copy(),
+            "status": self.status[:n].copy(),
+            **{field: getattr(self, field)[:n].copy() for field in self._FIELDS},
+        }
+
+
+_lock = threading.Lock()
+_columns = _TradeColumns()
+_version = 0
+_generation = 0                     # change à chaque rechargement complet
+_start_capital = 0.0
+_cache = None                       # ((génération, version), etag, résultat)
+_pending = None                     # écritures reçues pendant un reload(), sinon None
+_loaded_at = None
+_task = None
+
+
+def start_journal_stats() -> None:
+    """A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup)."""
+    global _task
+    add_write_listener(_on_journal_write)
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_reload_loop())
+
+
+def _on_journal_write(kind: str, trade_id, fields: dict) -> None:
+    global _version
+    with _lock:
+        _columns.upsert(trade_id, fields)
+        _version += 1
+        if _pending is not None:
+            # Rechargement en cours : rejouée sur les nouvelles colonnes
+            # avant leur mise en service (voir reload()).
+            _pending.append((kind, trade_id, fields))
+
+
+async def _reload_loop() -> None:
+    while True:
+        try:
+            await reload()
+        except Exception as e:
+            log.warning(f"⚠️ Chargement du journal impossible : {type(e).__name__}: {e}")
+        await asyncio.sleep(JOURNAL_STATS_RELOAD_SECONDS)
+
+
+async def reload() -> int:
+    """
+    Recharge toutes les lignes (pagination par id) et le capital de départ.
+    Les écritures du journal reçues pendant la pagination sont rejouées sur
+    les nouvelles colonnes juste avant la bascule : une insertion déjà lue
+    par la pagination (même id) est ignorée, une mise à jour est toujours
+    appliquée (ses valeurs sont les dernières écrites).
+    """
+    global _pending
+    with _lock:
+        _pending = []
+    try:
+        return await _reload_columns()
+    finally:
+        with _lock:
+            _pending = None
+
+
+async def _reload_columns() -> int:
+    global _columns, _version, _generation, _start_capital, _loaded_at
+    columns = _TradeColumns()
+    last_id = 0
+    while True:
+        page = (await read_with_retry(
+            lambda: get_supabase().table("trades").select(_COLUMNS)
+            .gt("id", last_id).order("id").limit(JOURNAL_STATS_PAGE_SIZE).execute()
+        )).data
+        for row in page:
+            columns.upsert(row["id"], row)
+        if len(page) < JOURNAL_STATS_PAGE_SIZE:
+            break
+        last_id = page[-1]["id"]
+    capital = (await read_with_retry(
+        lambda: get_supabase().table("capital").select("capital_depart").order("id", desc=True).limit(1).execute()
+    )).data
+    with _lock:
+        for kind, trade_id, fields in _pending:
+            if kind == "insert" and trade_id in columns.index:
+                continue
+            columns.upsert(trade_id, fields)
+        _columns = columns
+        _start_capital = _to_float(capital[0]["capital_depart"]) if capital else 0.0
+        if np.isnan(_start_capital):
+            _start_capital = 0.0
+        _generation += 1
+        _version = 0
+        _loaded_at = time.time()
+    log.info(f"✅ {columns.size} trade(s) chargé(s)")
+    return columns.size
+
+
+def _etag(data: dict, start_capital: float) -> str:
+    """Empreinte des colonnes (par id croissant) et du capital de départ."""
+    order = np.argsort(data["ids"], kind="stable")
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(np.float64(start_capital).tobytes())
+    for name in ("ids", "status", *_TradeColumns._FIELDS):
+        digest.update(np.ascontiguousarray(data[name][order]).tobytes())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def get_stats() -> tuple:
+    """Retourne (etag, stats), recalculées seulement si le journal a changé."""
+    global _cache
+    with _lock:
+        version = (_generation, _version)
+        if _cache is not None and _cache[0] == version:
+            return _cache[1], _cache[2]
+        data = _columns.view()
+        start_capital = _start_capital
+        loaded_at = _loaded_at
+    tag = _etag(data, start_capital)
+    if _cache is not None and _cache[1] == tag:
+        result = _cache[2]
+    else:
+        result = _compute(data, start_capital)
+    result["loaded_at"] = loaded_at
+    _cache = (version, tag, result)
+    return tag, result
+
+
+def get_stats_if_changed(if_none_match: str | None = None) -> dict:
+    """Pour broker_ipc : n'envoie pas les statistiques si le client a déjà cet ETag."""
+    tag, result = get_stats()
+    return {"etag": tag, "stats": None if tag == if_none_match else result}
+
+
+def _group(keys: np.ndarray, pnl: np.ndarray, wins: np.ndarray) -> tuple:
+    labels, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(labels))
+    sums = np.bincount(inverse, weights=pnl, minlength=len(labels))
+    win_counts = np.bincount(inverse, weights=wins, minlength=len(labels))
+    return labels, counts, sums, win_counts
+
+
+def _rows(labels, counts, sums, win_counts, key: str) -> list:
+    return [
+        {
+            key: str(label),
+            "trades": int(count),
+            "wins": int(won),
+            "win_rate": round(float(won) / count * 100, 1) if count else None,
+            "pnl": round(float(total), 2),
+        }
+        for label, count, total, won in zip(labels, counts, sums, win_counts)
+    ]
+
+
+def _compute(data: dict, start_capital: float) -> dict:
+    status = data["status"]
+    closed = (status != _STATUS_CODES["OPEN"]) & ~np.isnan(data["pnl"])
+
+    # Trades clôturés, dans l'ordre de sortie (entrée si la sortie manque).
+    sort_ts = np.where(np.isnan(data["exit_ts"]), data["entry_ts"], data["exit_ts"])[closed]
+    order = np.argsort(sort_ts, kind="stable")
+    pnl = data["pnl"][closed][order]
+    exit_ts = sort_ts[order]
+    entry_ts = data["entry_ts"][closed][order]
+    risk = data["risk"][closed][order]
+
+    wins = pnl > 0
+    losses = pnl < 0
+    n = len(pnl)
+    gross_win = float(pnl[wins].sum())
+    gross_loss = float(-pnl[losses].sum())
+
+    equity = start_capital + np.cumsum(pnl)
+    peaks = np.maximum.accumulate(np.concatenate(([start_capital], equity)))[1:] if n else equity
+    drawdown = equity - peaks
+    dd_index = int(np.argmin(drawdown)) if n else None
+    # En % seulement avec un capital de départ connu (sinon les premiers
+    # pics, proches de 0, donnent des pourcentages absurdes).
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown_pct = np.where(peaks > 0, drawdown / peaks * 100, np.nan) if start_capital > 0 else np.full(n, np.nan)
+
+    valid_r = ~np.isnan(risk) & (risk > 0)
+    r_multiples = pnl[valid_r] / risk[valid_r]
+
+    curve_index = np.unique(np.linspace(0, n - 1, min(n, JOURNAL_STATS_MAX_CURVE_POINTS)).astype(np.int64)) if n else []
+    months = exit_ts.astype("datetime64[s]").astype("datetime64[M]").astype(str) if n else np.array([], dtype=str)
+    hours = np.floor((entry_ts % 86400) / 3600)
+    session_bounds = np.array([start for _, start in _SESSIONS[1:]])
+    session_names = np.array([name for name, _ in _SESSIONS])
+    sessions = np.where(np.isnan(hours), "Inconnue", session_names[np.digitize(np.nan_to_num(hours), session_bounds)])
+
+    return {
+        "trades": int(len(status)),
+        "open": int((status == _STATUS_CODES["OPEN"]).sum()),
+        "closed": n,
+        "wins": int(wins.sum()),
+        "losses": int(losses.sum()),
+        "breakeven": int(n - wins.sum() - losses.sum()),
+        "win_rate": round(float(wins.sum()) / n * 100, 1) if n else None,
+        "by_status": {
+            name: int((status == code).sum()) for name, code in _STATUS_CODES.items()
+        },
+        "start_capital": start_capital,
+        "pnl_total": round(float(pnl.sum()), 2),
+        "avg_win": round(gross_win / wins.sum(), 2) if wins.any() else None,
+        "avg_loss": round(-gross_loss / losses.sum(), 2) if losses.any() else None,
+        "profit_factor": round(gross_win / gross_loss, 2) if gross_loss > 0 else None,
+        "expectancy": round(float(pnl.mean()), 2) if n else None,
+        "max_drawdown": round(float(drawdown[dd_index]), 2) if n else 0.0,
+        "max_drawdown_pct": round(float(np.nanmin(drawdown_pct)), 2) if n and not np.isnan(drawdown_pct).all() else None,
+        "max_drawdown_at": _iso(exit_ts[dd_index]) if n else None,
+        "r_multiples": {
+            "count": int(len(r_multiples)),
+            "mean": round(float(r_multiples.mean()), 2) if len(r_multiples) else None,
+            "median": round(float(np.median(r_multiples)), 2) if len(r_multiples) else None,
+            "total": round(float(r_multiples.sum()), 2),
+            "best": round(float(r_multiples.max()), 2) if len(r_multiples) else None,
+            "worst": round(float(r_multiples.min()), 2) if len(r_multiples) else None,
+        },
+        "equity_curve": [
+            {"time": _iso(exit_ts[i]), "equity": round(float(equity[i]), 2), "drawdown": round(float(drawdown[i]), 2)}
+            for i in curve_index
+        ],
+        "by_month": _rows(*_group(months, pnl, wins), key="month"),
+        "by_session": _rows(*_group(sessions, pnl, wins), key="session"),
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _iso(ts: float) -> str | None:
+    if np.isnan(ts):
+        return None
+    return datetime.fromtimestamp(float(ts), timezone.utc).isoformat()
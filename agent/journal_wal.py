@@ -0,0 +1,149 @@
+"""
+Journal local à écriture anticipée (write-ahead log) des écritures Supabase.
+
+Chaque événement du journal (entrée, passage à BE, clôture) est d'abord
+ajouté ici, AVANT toute requête réseau ; il n'est marqué acquitté qu'une
+fois écrit dans Supabase (voir supabase_journal). Si Supabase est lent ou
+indisponible, rien n'est perdu : le rejoueur de supabase_journal renvoie
+par lots les entrées non acquittées dès que Supabase répond, y compris
+celles laissées par un processus précédent.
+
+Stockage : SQLite en mode WAL avec synchronous=NORMAL - un ajout est une
+simple écriture séquentielle dans le fichier -wal, sans fsync par
+transaction ; les fsync sont groupés aux checkpoints. Un crash du
+processus ne perd rien ; seule une coupure de courant peut perdre les
+toutes dernières transactions.
+
+ATTENTION (Railway) : le système de fichiers est effacé à chaque
+redéploiement. Monter un volume et y faire pointer JOURNAL_WAL_PATH pour
+que le journal survive aussi aux redéploiements.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import event_log
+
+log = event_log.get_logger("journal_wal")
+
+JOURNAL_WAL_PATH = os.environ.get("JOURNAL_WAL_PATH", "journal_wal.sqlite3")
+# Au-delà, une entrée qui échoue encore est abandonnée (ex: mise à jour
+# d'une ligne supprimée entre-temps depuis le dashboard).
+JOURNAL_WAL_MAX_ATTEMPTS = int(os.environ.get("JOURNAL_WAL_MAX_ATTEMPTS", "50"))
+
+PENDING, ACKED, ABANDONED = 0, 1, 2
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(JOURNAL_WAL_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal_wal (
+                seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind       TEXT    NOT NULL,
+                trade_key  TEXT    NOT NULL,
+                payload    TEXT    NOT NULL,
+                created_at REAL    NOT NULL,
+                attempts   INTEGER NOT NULL DEFAULT 0,
+                state      INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS journal_wal_pending ON journal_wal (state, seq)")
+    return _conn
+
+
+def append(kind: str, trade_key: str, payload: dict) -> int:
+    """Ajoute un événement ("insert" ou "update") et retourne son numéro de séquence."""
+    with _lock:
+        cursor = _connection().execute(
+            "INSERT INTO journal_wal (kind, trade_key, payload, created_at) VALUES (?, ?, ?, ?)",
+            (kind, trade_key, json.dumps(payload), time.time()),
+        )
+        return cursor.lastrowid
+
+
+def append_many(entries: list) -> list:
+    """Ajoute des événements [(kind, trade_key, payload)] en UNE transaction ; retourne leurs numéros."""
+    with _lock:
+        conn = _connection()
+        conn.execute("BEGIN")
+        now = time.time()
+        seqs = [
+            conn.execute(
+                "INSERT INTO journal_wal (kind, trade_key, payload, created_at) VALUES (?, ?, ?, ?)",
+                (kind, trade_key, json.dumps(payload), now),
+            ).lastrowid
+            for kind, trade_key, payload in entries
+        ]
+        conn.execute("COMMIT")
+    return seqs
+
+
+def ack(seqs: list) -> None:
+    """Marque des entrées comme écrites dans Supabase."""
+    if not seqs:
+        return
+    with _lock:
+        conn = _connection()
+        conn.execute("BEGIN")
+        conn.executemany("UPDATE journal_wal SET state = ? WHERE seq = ?", [(ACKED, seq) for seq in seqs])
+        conn.execute("COMMIT")
+
+
+def pending(limit: int, created_before: float) -> list:
+    """
+    Entrées non acquittées écrites avant created_before, dans l'ordre
+    d'écriture : [(seq, kind, trade_key, payload)]. Compte une tentative
+    pour chacune et abandonne celles qui ont dépassé
+    JOURNAL_WAL_MAX_ATTEMPTS.
+    """
+    with _lock:
+        conn = _connection()
+        conn.execute("BEGIN")
+        rows = conn.execute(
+            "SELECT seq, kind, trade_key, payload, attempts FROM journal_wal "
+            "WHERE state = ? AND created_at <= ? ORDER BY seq LIMIT ?",
+            (PENDING, created_before, limit),
+        ).fetchall()
+        abandoned = [row[0] for row in rows if row[4] >= JOURNAL_WAL_MAX_ATTEMPTS]
+        conn.executemany("UPDATE journal_wal SET attempts = attempts + 1 WHERE seq = ?", [(row[0],) for row in rows])
+        conn.executemany("UPDATE journal_wal SET state = ? WHERE seq = ?", [(ABANDONED, seq) for seq in abandoned])
+        conn.execute("COMMIT")
+    if abandoned:
+        log.error(f"⛔ {len(abandoned)} entrée(s) abandonnée(s) après {JOURNAL_WAL_MAX_ATTEMPTS} tentatives : {abandoned}")
+    return [(seq, kind, key, json.loads(payload)) for seq, kind, key, payload, attempts in rows if seq not in abandoned]
+
+
+def purge_acked(older_than_seconds: float) -> int:
+    """Supprime les entrées acquittées plus anciennes que le délai donné."""
+    with _lock:
+        cursor = _connection().execute(
+            "DELETE FROM journal_wal WHERE state = ? AND created_at < ?",
+            (ACKED, time.time() - older_than_seconds),
+        )
+        return cursor.rowcount
+
+
+def stats() -> dict:
+    with _lock:
+        counts = dict(_connection().execute("SELECT state, COUNT(*) FROM journal_wal GROUP BY state").fetchall())
+        oldest = _connection().execute(
+            "SELECT MIN(created_at) FROM journal_wal WHERE state = ?", (PENDING,)
+        ).fetchone()[0]
+    return {
+        "path": JOURNAL_WAL_PATH,
+        "pending": counts.get(PENDING, 0),
+        "acked": counts.get(ACKED, 0),
+        "abandoned": counts.get(ABANDONED, 0),
+        "oldest_pending_age_seconds": round(time.time() - oldest, 1) if oldest else None,
+    }
@@ -1,14 +1,40 @@
-from fastapi import FastAPI, Request
+import startup_report
+startup_report.install_import_timer()   # avant tout autre import (voir /debug/startup)
+
+import asyncio
+import importlib
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
 import os
 
+import broker_ipc
+import event_log
+import journal_query
+import metrics
+import signal_dedup
+import signal_queue
 from oauth_routes import router as oauth_router
-from ctrader_trading import execute_trade, start_client_service
-from ctrader_trading import list_all_symbols
+from supabase_journal import start_journal_writer, get_journal_writer_stats
+from telegram_notifier import start_notifier, stop_notifier, notify, get_notifier_stats
+
+log = event_log.get_logger("main")
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    await startup_event()
+    yield
+    await shutdown_event()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,32 +46,67 @@ app.add_middleware(
 app.include_router(oauth_router)
 
 
-@app.on_event("startup")
+_broker_task = None
+
+
 async def startup_event():
-    """Démarre la connexion persistante au client cTrader au lancement de l'app."""
-    start_client_service()
+    """
+    Démarre la connexion persistante au client cTrader au lancement de l'app
+    (sauf sur un worker HTTP du mode multi-processus, voir broker_ipc).
+
+    Le SDK cTrader n'est importé qu'ici, en tâche de fond (_start_broker) :
+    l'app répond dès la fin de cette fonction, sans attendre Twisted.
+    """
+    global _broker_task
+    start_notifier()
+    if not broker_ipc.IS_CLIENT:
+        # Les trades sont journalisés par le processus qui les exécute.
+        start_journal_writer()
+        _broker_task = asyncio.get_running_loop().create_task(_start_broker())
+    if broker_ipc.BROKER_MODE == "server":
+        await broker_ipc.start_server()
+    if broker_ipc.IS_CLIENT:
+        startup_report.stop_import_timer()
+    startup_report.mark("app_ready")
+
+
+async def _start_broker():
+    """Importe broker_ops (ctrader_trading, Twisted, protobuf) hors de la boucle, puis le démarre."""
+    try:
+        with startup_report.phase("broker_import"):
+            broker_ops = await asyncio.to_thread(importlib.import_module, "broker_ops")
+        with startup_report.phase("broker_start"):
+            broker_ops.start_broker(process_signal)
+    except Exception as e:
+        log.error(f"❌ Démarrage du broker impossible : {type(e).__name__}: {e}")
+        broker_ipc.mark_ready(error=e)
+        notify(f"❌ <b>Bot non démarré</b>\n{type(e).__name__}: {e}")
+    else:
+        broker_ipc.mark_ready()
+    finally:
+        startup_report.stop_import_timer()
+        startup_report.mark("broker_ready")
 
 
-TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
-TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
+async def shutdown_event():
+    await broker_ipc.stop_server()
+    await stop_notifier()
+    event_log.flush()
 
 
-async def send_telegram(text: str):
+def send_telegram(text: str):
     """Notification passive uniquement -- le trade est déjà exécuté (ou a échoué)
-    au moment où ce message part, pas de bouton ACCEPTER/REFUSER."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": text,
-        "parse_mode": "HTML"
-    }
-    async with httpx.AsyncClient() as client:
-        await client.post(url, json=payload)
+    au moment où ce message part, pas de bouton ACCEPTER/REFUSER. L'envoi
+    réel est fait en tâche de fond (voir telegram_notifier)."""
+    notify(text)
 
 
-@app.post("/webhook/signal")
-async def receive_signal(request: Request):
-    data = await request.json()
+async def process_signal(data: dict) -> dict:
+    """
+    Exécute un signal (ordre + notification Telegram) et retourne un résumé
+    sérialisable - utilisée telle quelle par le webhook en mode synchrone,
+    et par les workers de signal_queue en mode asynchrone.
+    """
     symbol = data.get("symbol", "?")
     direction = data.get("direction", "?")   # "BUY" ou "SELL"
     niveau = data.get("niveau", "?")
@@ -56,15 +117,46 @@ async def receive_signal(request: Request):
     emoji = "🟢" if direction == "BUY" else "🔴"
 
     try:
-        result = await execute_trade(
+        outcomes = await broker_ipc.call(
+            "execute_signal",
             symbol=symbol,
             direction=direction,
             entry_price=prix,
             data=data,
         )
-        statut = f"✅ Trade exécuté automatiquement (SL {result['sl']} / TP {result['tp']})"
     except Exception as e:
-        statut = f"❌ Échec d'exécution : {type(e).__name__}: {e}"
+        # Échec commun à tous les comptes (connexion, authentification...).
+        outcomes = [{"account_id": None, "error": f"{type(e).__name__}: {e}"}]
+
+    accounts = []
+    lines = []
+    for outcome in outcomes:
+        result = outcome.get("result")
+        if result is not None:
+            statut = f"✅ Trade exécuté automatiquement (SL {result['sl']} / TP {result['tp']})"
+            metrics.inc("signals_total", outcome="executed")
+            accounts.append({
+                "account_id": outcome["account_id"],
+                "executed": True,
+                "executed_price": result["executed_price"],
+                "price_source": result["price_source"],
+                "volume": result["volume"],
+                "sl": result["sl"],
+                "tp": result["tp"],
+            })
+        else:
+            statut = f"❌ Échec d'exécution : {outcome['error']}"
+            metrics.inc("signals_total", outcome="failed")
+            accounts.append({"account_id": outcome["account_id"], "executed": False, "error": outcome["error"]})
+        if len(outcomes) > 1:
+            statut = f"Compte {outcome['account_id']} : {statut}"
+        lines.append(statut)
+    statut = "\n".join(lines)
+
+    summary = dict(accounts[0]) if len(accounts) == 1 else {
+        "executed": any(a["executed"] for a in accounts),
+        "accounts": accounts,
+    }
 
     message = (
         f"{emoji} <b>SIGNAL {symbol}</b>\n"
@@ -76,12 +168,115 @@ async def receive_signal(request: Request):
         f"Session : {session}"
     )
 
-    await send_telegram(message)
-    return {"status": "signal reçu et traité"}
+    send_telegram(message)
+    return summary
+
+
+def _validate_signal(data) -> str | None:
+    """Contrôle minimal avant mise en file : message d'erreur, ou None si valide."""
+    if not isinstance(data, dict):
+        return "Le corps du webhook doit être un objet JSON."
+    if not data.get("symbol"):
+        return "Champ 'symbol' manquant."
+    if str(data.get("direction", "")).upper() not in ("BUY", "SELL"):
+        return "Champ 'direction' invalide (attendu : BUY ou SELL)."
+    return None
+
+
+@app.post("/webhook/signal")
+async def receive_signal(request: Request, mode: str | None = None):
+    started = time.perf_counter()
+    # Identifiant de corrélation : suit le signal dans tous les logs (ordre,
+    # journal, Telegram), jusque dans le broker et les workers de signal_queue.
+    correlation_id = request.headers.get("X-Correlation-Id") or uuid.uuid4().hex[:16]
+    event_log.set_correlation_id(correlation_id)
+    with metrics.timed("signal_stage_seconds", stage="json_parse"):
+        data = json.loads(await request.body())
+    if isinstance(data, dict):
+        data["correlation_id"] = correlation_id
+        log.info("📨 Signal reçu", symbol=data.get("symbol"), direction=data.get("direction"), mode=mode)
+
+    # Mode asynchrone (opt-in) : accusé de réception immédiat, exécution par
+    # les workers de signal_queue, résultat sur GET /signals/{signal_id}.
+    # Un signal invalide est rejeté avant la dé-duplication : sa clé reste
+    # libre pour le renvoi corrigé.
+    async_mode = mode == "async" or (mode is None and signal_queue.SIGNAL_ASYNC_MODE)
+    if async_mode:
+        error = _validate_signal(data)
+        if error:
+            return JSONResponse({"status": "signal rejeté", "error": error}, status_code=400)
+
+    # Dé-duplication AVANT toute requête broker : un renvoi de TradingView
+    # (timeout, alerte en double) ne doit jamais produire un second ordre.
+    # Référence de l'original : l'identifiant de corrélation (remplacé par le
+    # signal_id en mode asynchrone).
+    if isinstance(data, dict):
+        keys = signal_dedup.signal_keys(data, request.headers.get("Idempotency-Key"))
+        is_new, original = await broker_ipc.call("dedup_claim", keys=keys, signal_ref=correlation_id)
+        if not is_new:
+            metrics.inc("signals_total", outcome="duplicate")
+            log.info("🔁 Signal en double ignoré", duplicate_of=original)
+            return {"status": "signal en double ignoré", "duplicate_of": original, "correlation_id": correlation_id}
+        data["idempotency_key"] = keys[0]
+
+    if async_mode:
+        try:
+            signal_id = await broker_ipc.call("signal_submit", data=data)
+        except Exception as e:
+            # Signal non accepté : sa clé est libérée pour que le renvoi de
+            # TradingView soit exécuté au lieu d'être écarté comme doublon.
+            await _release_dedup_key(data, correlation_id)
+            if isinstance(e, signal_queue.SignalQueueFull):
+                return JSONResponse({"status": "signal rejeté", "error": str(e)}, status_code=503)
+            raise
+        metrics.observe("signal_stage_seconds", time.perf_counter() - started, stage="ack")
+        return JSONResponse(
+            {"status": "signal reçu", "signal_id": signal_id, "result_url": f"/signals/{signal_id}", "correlation_id": correlation_id},
+            status_code=202,
+        )
+
+    await process_signal(data)
+    metrics.observe("signal_stage_seconds", time.perf_counter() - started, stage="total")
+    return {"status": "signal reçu et traité", "correlation_id": correlation_id}
+
+
+async def _release_dedup_key(data, correlation_id: str) -> None:
+    if not isinstance(data, dict) or not data.get("idempotency_key"):
+        return
+    try:
+        await broker_ipc.call("dedup_release", key=data["idempotency_key"], signal_ref=correlation_id)
+    except Exception as e:
+        log.warning(f"⚠️ Clé d'idempotence non libérée : {type(e).__name__}: {e}")
+
+
+@app.get("/signals/{signal_id}")
+async def get_signal(signal_id: str):
+    """Suivi d'un signal accepté en mode asynchrone (queued/running/done/failed)."""
+    entry = await broker_ipc.call("signal_result", signal_id=signal_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Signal inconnu (ou trop ancien).")
+    return entry
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Métriques de latence au format Prometheus (voir metrics.py). Sur un
+    worker du mode multi-processus : ses séries et celles du broker,
+    distinguées par le label process.
+    """
+    sources = None
+    if broker_ipc.IS_CLIENT:
+        sources = [
+            ((("process", f"worker-{os.getpid()}"),), metrics.snapshot()),
+            ((("process", "broker"),), await broker_ipc.call("metrics_snapshot")),
+        ]
+    return PlainTextResponse(metrics.render(sources), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
 async def root():
+    startup_report.mark("first_response")
     return {"status": "NASDAQ Open Reversal Bot actif"}
 
 
@@ -108,6 +303,253 @@ async def network_test():
     return results
 
 
+@app.get("/debug/account")
+async def debug_account():
+    """
+    Route de diagnostic : état du compte tenu en mémoire (solde, positions,
+    ordres en attente), alimenté par les events cTrader - aucun appel broker.
+    """
+    states = await broker_ipc.call("account_states")
+    return {
+        "accounts": {
+            account_id: {"seeded": state is not None, "state": state}
+            for account_id, state in states.items()
+        }
+    }
+
+
+@app.get("/debug/journal")
+async def debug_journal():
+    """Route de diagnostic : état de la file d'écriture du journal Supabase."""
+    return {**get_journal_writer_stats(), "last_reconcile": await broker_ipc.call("last_reconcile")}
+
+
+@app.get("/journal/stats")
+async def journal_stats_route(request: Request):
+    """
+    Statistiques du journal (equity, drawdown, win rate, R-multiples, par
+    mois et par session), mises en cache avec ETag : 304 si inchangées.
+    Calculées par le processus qui écrit le journal (voir journal_stats).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    try:
+        answer = await broker_ipc.call("journal_stats", if_none_match=if_none_match)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=f"Statistiques indisponibles : {e}")
+    headers = {"ETag": answer["etag"], "Cache-Control": "private, no-cache"}
+    if answer["stats"] is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(answer["stats"], headers=headers)
+
+
+def _journal_filters(symbol, status, source, date_from, date_to) -> dict:
+    return {"symbol": symbol, "status": status, "source": source, "date_from": date_from, "date_to": date_to}
+
+
+@app.get("/journal/trades")
+async def journal_trades(
+    fields: str | None = None,
+    symbol: str | None = None,
+    status: str | None = None,
+    source: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
+):
+    """
+    Trades du plus récent au plus ancien, pagination par curseur (renvoyer
+    next_cursor tel quel pour la page suivante) - voir journal_query.
+    """
+    try:
+        columns = journal_query.parse_fields(fields)
+        filters = _journal_filters(symbol, status, source, date_from, date_to)
+        return await journal_query.fetch_page(columns, filters, cursor, limit)
+    except journal_query.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/journal/trades/export")
+async def journal_trades_export(
+    format: str = "ndjson",
+    fields: str | None = None,
+    symbol: str | None = None,
+    status: str | None = None,
+    source: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+):
+    """Export en streaming (NDJSON ou CSV) de tous les trades filtrés."""
+    try:
+        columns = journal_query.parse_fields(fields)
+    except journal_query.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = _journal_filters(symbol, status, source, date_from, date_to)
+    if format == "csv":
+        return StreamingResponse(
+            journal_query.stream_csv(columns, filters),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="trades.csv"'},
+        )
+    if format == "ndjson":
+        return StreamingResponse(journal_query.stream_ndjson(columns, filters), media_type="application/x-ndjson")
+    raise HTTPException(status_code=400, detail="format doit valoir 'ndjson' ou 'csv'")
+
+
+@app.post("/journal/reconcile")
+async def journal_reconcile_now():
+    """Réconcilie à la demande les trades OPEN avec les positions et deals cTrader."""
+    try:
+        return await broker_ipc.call("reconcile")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Réconciliation impossible : {type(e).__name__}: {e}")
+
+
+@app.post("/backtest/trendbars/sync")
+async def backtest_trendbars_sync(symbol: str = "NAS100", days: float = 30):
+    """Complète le cache local des barres M1 du symbole (seules les barres manquantes sont téléchargées)."""
+    try:
+        return await broker_ipc.call("trendbars_sync", symbol=symbol, days=days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=f"Téléchargement des barres impossible : {e}")
+
+
+@app.post("/backtest/replay")
+async def backtest_replay(request: Request):
+    """
+    Rejoue des signaux sur le cache de barres M1 pour une grille de
+    paramètres (voir replay). Corps JSON :
+        {"symbol": "NAS100", "sl_points": [30, 50], "tp_points": [60, 100],
+         "be_delay_minutes": [null, 15], "top": 20,
+         "signals": [...]}                      # facultatif
+    Sans "signals", les trades du journal du symbole sont rejoués (filtres
+    facultatifs source, date_from, date_to).
+    """
+    # NumPy (replay, trendbar_cache) : importé à la première utilisation,
+    # pas au démarrage de chaque worker.
+    import replay
+    import trendbar_cache
+
+    body = await request.json()
+    symbol = body.get("symbol", "NAS100")
+    bars = trendbar_cache.load(symbol)
+    if bars is None:
+        raise HTTPException(status_code=404, detail=f"Aucune barre en cache pour {symbol} - POST /backtest/trendbars/sync d'abord")
+    rows = body.get("signals")
+    if rows is None:
+        filters = _journal_filters(symbol, None, body.get("source"), body.get("date_from"), body.get("date_to"))
+        rows = [row async for row in journal_query.iter_rows(["id", "entry_time", "direction", "entry_price"], filters)]
+    try:
+        max_bars = int(body.get("max_bars", replay.REPLAY_MAX_BARS))
+        return await asyncio.to_thread(
+            replay.replay,
+            bars,
+            replay.signals_from_rows(rows),
+            body.get("sl_points", [50]),
+            body.get("tp_points", [100]),
+            body.get("be_delay_minutes", [None]),
+            max_bars,
+            body.get("top", 20),
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/debug/trendbars")
+async def debug_trendbars():
+    """Route de diagnostic : symboles et plages de dates du cache de barres M1."""
+    import trendbar_cache
+    return trendbar_cache.stats()
+
+
+@app.get("/debug/telegram")
+async def debug_telegram():
+    """Route de diagnostic : état de la file de notifications Telegram."""
+    return get_notifier_stats()
+
+
+@app.get("/debug/spots")
+async def debug_spots():
+    """
+    Route de diagnostic : cadence (ticks/s sur 60 s) et fraîcheur du dernier
+    prix reçu pour chaque symbole abonné.
+    """
+    return await broker_ipc.call("spots_stats")
+
+
+@app.get("/debug/signal-queue")
+async def debug_signal_queue():
+    """Route de diagnostic : état de la file d'exécution des signaux (mode asynchrone)."""
+    return await broker_ipc.call("signal_queue_stats")
+
+
+@app.get("/debug/breakeven")
+async def debug_breakeven():
+    """Route de diagnostic : positions suivies et échéances du moteur de break-even."""
+    return await broker_ipc.call("breakeven_stats")
+
+
+@app.get("/debug/scheduler")
+async def debug_scheduler():
+    """Route de diagnostic : jetons et files de l'ordonnanceur des requêtes cTrader."""
+    return await broker_ipc.call("scheduler_stats")
+
+
+@app.get("/debug/warmup")
+async def debug_warmup():
+    """Route de diagnostic : calendrier des sessions et dernier rapport de préchauffage."""
+    return await broker_ipc.call("warmup_stats")
+
+
+@app.post("/debug/warmup")
+async def debug_warmup_run():
+    """Lance immédiatement un préchauffage complet et retourne son rapport."""
+    return await broker_ipc.call("warmup_run")
+
+
+@app.get("/debug/startup")
+async def debug_startup():
+    """
+    Route de diagnostic : coût du dernier cold start - jalons (app_ready,
+    first_response, broker_ready), étapes d'initialisation et temps d'import
+    par module (voir startup_report).
+    """
+    if not broker_ipc.IS_CLIENT:
+        return startup_report.report()
+    return {"worker": startup_report.report(), "broker": await broker_ipc.call("startup_report")}
+
+
+@app.get("/debug/logging")
+async def debug_logging():
+    """Route de diagnostic : niveaux, échantillonnage et file d'écriture des logs (voir event_log)."""
+    if not broker_ipc.IS_CLIENT:
+        return event_log.stats()
+    return {"worker": event_log.stats(), "broker": await broker_ipc.call("logging_stats")}
+
+
+@app.post("/debug/logging")
+async def debug_logging_set_level(category: str, level: str):
+    """
+    Change à chaud le niveau d'une catégorie, ex: ?category=ctrader.send&level=debug
+    pour suivre chaque requête cTrader sans redéployer (ce processus et le broker).
+    """
+    try:
+        event_log.set_level(category, level)
+        if broker_ipc.IS_CLIENT:
+            await broker_ipc.call("logging_set_level", category=category, level=level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"category": category, "level": level.lower()}
+
+
+@app.get("/debug/dedup")
+async def debug_dedup():
+    """Route de diagnostic : index de dé-duplication des signaux."""
+    return await broker_ipc.call("dedup_stats")
+
+
 @app.get("/debug/symbols")
 async def debug_symbols():
     """
@@ -115,8 +557,7 @@ async def debug_symbols():
     sur ce compte cTrader pour identifier le nom exact utilisé par le
     broker (ex: retrouver le vrai nom du Nasdaq 100 chez IC Markets).
     """
-    names = await list_all_symbols()
-    return {"count": len(names), "symbols": names}
+    return await broker_ipc.call("list_symbols")
 
 
 @app.get("/debug/symbol-specs")
@@ -127,11 +568,11 @@ async def debug_symbol_specs(symbol: str = "USTEC"):
     10 = 0.10 lot) pour un symbole donné, SANS passer d'ordre. Fonctionne
     même marché fermé, contrairement à un vrai trade test.
     """
-    symbol_id, _ = await get_symbol_id(symbol)
-    specs = await get_symbol_specs(symbol_id)
+    found = await broker_ipc.call("symbol_specs", symbol=symbol)
+    specs = found["specs"]
     return {
         "symbol": symbol,
-        "symbolId": symbol_id,
+        "symbolId": found["symbolId"],
         "minVolume_units": specs["minVolume"],
         "minVolume_lots": specs["minVolume"] / 100,
         "maxVolume_units": specs["maxVolume"],
@@ -0,0 +1,166 @@
+"""
+Métriques de latence du chemin signal -> ordre, exposées au format texte
+Prometheus sur GET /metrics (voir main.py).
+
+Volontairement minimal (pas de dépendance prometheus_client) :
+- histogrammes à buckets fixes, mesurés avec time.perf_counter()
+  (horloge monotone) ;
+- compteurs et jauges ;
+- chaque série est identifiée par son nom + ses labels.
+
+Usage :
+    with metrics.timed("signal_stage_seconds", stage="get_symbol_id"):
+        symbol_id, _ = await get_symbol_id(symbol)
+
+    metrics.inc("ctrader_timeouts_total", payload_type=2105)
+
+Les mesures peuvent venir du thread du reactor comme de la boucle asyncio :
+tout passe par un verrou unique (sections critiques de quelques
+additions).
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets en secondes : de 1 ms à 30 s, adaptés aussi bien à une lecture
+# mémoire qu'à un aller-retour broker lent ou un timeout.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0,
+)
+
+_HELP = {
+    "signal_stage_seconds": "Durée de chaque étape du traitement d'un signal",
+    "ctrader_rtt_seconds": "Aller-retour requête/réponse cTrader par payloadType",
+    "ctrader_timeouts_total": "Requêtes cTrader sans réponse dans le délai imparti",
+    "ctrader_errors_total": "Réponses d'erreur cTrader (ProtoOAErrorRes)",
+    "signals_total": "Signaux reçus sur /webhook/signal, par issue",
+    "ctrader_connected": "1 si la socket cTrader est connectée, 0 sinon",
+    "ctrader_reconnects_total": "Reconnexions au serveur cTrader",
+    "ctrader_recovery_seconds": "Délai entre une coupure et la restauration complète de la session",
+    "ctrader_dead_socket_total": "Sockets jugées mortes (ping sans réponse) et fermées de force",
+    "ctrader_disconnect_failures_total": "Requêtes échouées à cause d'une coupure de connexion",
+    "ctrader_scheduler_wait_seconds": "Attente d'un jeton d'envoi cTrader, par classe de priorité",
+    "ctrader_scheduler_depth": "Requêtes cTrader en attente d'un jeton d'envoi, par classe de priorité",
+    "ctrader_scheduler_rejected_total": "Requêtes cTrader refusées car la file de leur classe était pleine",
+    "breakeven_tracked_positions": "Positions du bot suivies par le moteur de break-even",
+    "breakeven_applied_total": "Stop loss remontés au prix d'entrée (BE)",
+    "breakeven_failed_total": "Passages à BE abandonnés (refus broker ou échecs répétés)",
+    "breakeven_exits_total": "Clôtures de positions journalisées, par statut",
+    "signal_queue_wait_seconds": "Attente d'un signal dans la file d'exécution (mode asynchrone)",
+    "signal_queue_depth": "Signaux en attente dans la file d'exécution (mode asynchrone)",
+    "signal_queue_rejected_total": "Signaux refusés car la file d'exécution était pleine",
+}
+
+_lock = threading.Lock()
+_histograms = {}   # (name, labels) -> [bucket_counts, sum, count]
+_counters = {}     # (name, labels) -> value
+_gauges = {}       # (name, labels) -> value
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+        buckets = hist[0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+                break
+        hist[1] += value
+        hist[2] += 1
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """Mesure la durée du bloc (y compris les await qu'il contient)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _format_labels(labels, extra=None) -> str:
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def snapshot() -> dict:
+    """Copie sérialisable en JSON de toutes les séries (métriques d'un autre processus, voir broker_ipc)."""
+    with _lock:
+        return {
+            "histograms": [[name, labels, list(v[0]), v[1], v[2]] for (name, labels), v in _histograms.items()],
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "gauges": [[name, labels, value] for (name, labels), value in _gauges.items()],
+        }
+
+
+def render(sources=None) -> str:
+    """
+    Export au format d'exposition texte Prometheus. sources : liste de
+    (labels ajoutés, snapshot()) exportés ensemble ; par défaut, les séries
+    de ce processus.
+    """
+    if sources is None:
+        sources = [((), snapshot())]
+    lines = []
+    histograms, counters, gauges = {}, {}, {}
+    for extra, snap in sources:
+        extra = tuple(tuple(item) for item in extra)
+        for name, labels, buckets, total, count in snap["histograms"]:
+            histograms[(name, tuple(tuple(item) for item in labels) + extra)] = (buckets, total, count)
+        for name, labels, value in snap["counters"]:
+            counters[(name, tuple(tuple(item) for item in labels) + extra)] = value
+        for name, labels, value in snap["gauges"]:
+            gauges[(name, tuple(tuple(item) for item in labels) + extra)] = value
+
+    seen = set()
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip(DEFAULT_BUCKETS, buckets):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -5,9 +5,12 @@ A inclure dans l'app principale avec :
     from oauth_routes import router as oauth_router
     app.include_router(oauth_router)
 """
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse
 
+import broker_ipc
 from ctrader_auth import get_authorization_url, exchange_code_for_token
 
 router = APIRouter()
@@ -23,7 +26,7 @@ def oauth_login():
 
 
 @router.get("/oauth/callback")
-def oauth_callback(code: str | None = None, error: str | None = None):
+async def oauth_callback(code: str | None = None, error: str | None = None):
     """
     Callback appelé par cTrader après que l'utilisateur ait autorisé l'app.
     Doit correspondre EXACTEMENT à CTRADER_REDIRECT_URI et à l'URL déclarée
@@ -36,13 +39,17 @@ def oauth_callback(code: str | None = None, error: str | None = None):
         raise HTTPException(status_code=400, detail="Paramètre 'code' manquant dans le callback.")
 
     try:
-        tokens = exchange_code_for_token(code)
+        tokens = await asyncio.to_thread(exchange_code_for_token, code)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Échec de l'échange du code d'autorisation : {e}")
 
     if tokens.get("errorCode"):
         raise HTTPException(status_code=400, detail=f"Erreur cTrader : {tokens.get('description')}")
 
+    if broker_ipc.IS_CLIENT:
+        # Le processus broker relit les tokens tout juste enregistrés.
+        await broker_ipc.call("reload_tokens")
+
     return HTMLResponse("""
         <html>
             <body style="font-family: sans-serif; text-align: center; margin-top: 4rem;">
@@ -75,9 +82,8 @@ async def oauth_accounts():
     A appeler une seule fois pour trouver l'ID du compte démo à mettre ensuite
     dans la variable Railway CTRADER_ACCOUNT_ID.
     """
-    from ctrader_trading import list_accounts
     try:
-        accounts = await list_accounts()
+        accounts = await broker_ipc.call("list_accounts")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des comptes : {e}")
     return {"accounts": accounts}
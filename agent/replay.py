@@ -0,0 +1,312 @@
+"""
+Rejeu vectorisé de signaux historiques sur les barres M1 de trendbar_cache,
+pour évaluer les règles de execute_trade() (SL à sl_points, TP à tp_points)
+et du moteur de break-even (SL remonté à l'entrée après BE_DELAY_SECONDS)
+sans trader en réel.
+
+Principe : pour chaque signal, une fenêtre de max_bars barres après
+l'entrée est extraite en une seule indexation NumPy (matrice signaux x
+barres). Les excursions favorable et défavorable sont cumulées
+(np.maximum.accumulate), puis la PREMIÈRE barre atteignant chaque niveau
+de TP et de SL de la grille est trouvée pour tous les signaux en un seul
+np.searchsorted (chaque ligne décalée dans sa propre bande de valeurs).
+Le résultat de chaque combinaison (sl, tp, délai BE) s'obtient ensuite par
+diffusion (broadcasting) sur un tableau signaux x sl x tp - des milliers de
+combinaisons en quelques secondes.
+
+Conventions (volontairement prudentes) :
+- l'entrée se fait au prix du signal (ou, à défaut, à la clôture de la
+  barre de l'entrée) ; le rejeu commence à la barre suivante ;
+- si SL et TP sont touchés dans la même barre, le SL est retenu ;
+- le BE n'est appliqué que si la position est en gain à l'échéance (à la
+  clôture de la barre précédente) : cTrader refuse un SL au-delà du prix ;
+- une position ni stoppée ni au TP à la fin de la fenêtre est clôturée à
+  la dernière clôture ("open") ;
+- ni spread ni commissions.
+
+Résultats en R (multiples du risque sl_points) : TP = tp/sl, SL = -1,
+BE = 0.
+
+Utilisable hors ligne sur un fichier de signaux (export CSV ou NDJSON de
+/journal/trades/export), depuis le dossier agent/ :
+    python -m replay --symbol NAS100 --signals trades.ndjson --sl 30,50,80 --tp 60,100,150 --be none,15
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import trendbar_cache
+
+# 390 barres M1 = une séance NASDAQ complète.
+REPLAY_MAX_BARS = int(os.environ.get("REPLAY_MAX_BARS", "390"))
+# Garde-fou mémoire : signaux x sl x tp par délai BE.
+REPLAY_MAX_CELLS = int(os.environ.get("REPLAY_MAX_CELLS", "20000000"))
+
+
+def signals_from_rows(rows) -> dict:
+    """
+    Lignes du journal (ou d'un fichier) -> colonnes entry_ms, direction
+    (+1 achat, -1 vente), entry_price (NaN si absent). Les lignes sans heure
+    ou sens exploitable sont comptées dans "skipped".
+    """
+    entry_ms, direction, entry_price = [], [], []
+    skipped = 0
+    for row in rows:
+        side = str(row.get("direction") or "").upper()
+        sign = 1 if side in ("LONG", "BUY") else -1 if side in ("SHORT", "SELL") else 0
+        moment = _parse_time(row.get("entry_time"))
+        if not sign or moment is None:
+            skipped += 1
+            continue
+        price = row.get("entry_price")
+        entry_ms.append(moment)
+        direction.append(sign)
+        entry_price.append(float(price) if price not in (None, "") else np.nan)
+    return {
+        "entry_ms": np.array(entry_ms, dtype=np.int64),
+        "direction": np.array(direction, dtype=np.int8),
+        "entry_price": np.array(entry_price, dtype=np.float64),
+        "skipped": skipped,
+    }
+
+
+def _parse_time(value) -> int | None:
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def parse_levels(values, allow_none: bool = False) -> np.ndarray:
+    """Niveaux de la grille ("30,50" ou liste) ; None/"none" = BE désactivé (inf)."""
+    if isinstance(values, str):
+        values = [v for v in values.split(",") if v.strip()]
+    levels = []
+    for value in [] if values is None else values:
+        if allow_none and (value is None or str(value).strip().lower() == "none"):
+            levels.append(np.inf)
+            continue
+        level = float(value)
+        if level < 0 or (not allow_none and level == 0):
+            raise ValueError(f"Niveau invalide : {value}")
+        levels.append(level)
+    if not levels:
+        raise ValueError("Grille vide")
+    return np.array(sorted(set(levels)), dtype=np.float64)
+
+
+def _windows(bars: dict, signals: dict, max_bars: int) -> dict | None:
+    """Matrices signaux x barres (excursions, minutes écoulées, clôtures) après chaque entrée."""
+    times = np.asarray(bars["time"])
+    n_bars = len(times)
+    order = np.argsort(signals["entry_ms"], kind="stable")
+    entry_ms = signals["entry_ms"][order]
+    sign = signals["direction"][order].astype(np.float64)
+    entry_price = signals["entry_price"][order]
+
+    # Première barre entièrement postérieure à l'entrée ; le signal doit
+    # tomber dans l'historique en cache (barre de l'entrée connue).
+    start = np.searchsorted(times, entry_ms, side="right")
+    covered = (start > 0) & (start < n_bars)
+    if not covered.any():
+        return None
+    start, entry_ms, sign, entry_price = start[covered], entry_ms[covered], sign[covered], entry_price[covered]
+
+    close = np.asarray(bars["close"])
+    price = np.where(np.isnan(entry_price), close[start - 1], entry_price)
+    index = start[:, None] + np.arange(max_bars)
+    valid = index < n_bars
+    index = np.minimum(index, n_bars - 1)
+    high = np.asarray(bars["high"])[index]
+    low = np.asarray(bars["low"])[index]
+
+    p, s = price[:, None], sign[:, None]
+    favorable = np.where(s > 0, high - p, p - low)
+    adverse = np.where(s > 0, p - low, high - p)
+    minutes = (times[index] - entry_ms[:, None]) / 60000.0
+    close_rel = (close[index] - p) * s
+    for matrix in (favorable, adverse, minutes):
+        matrix[~valid] = -np.inf
+
+    rows = np.arange(len(start))
+    return {
+        "n": len(start),
+        "skipped": int((~covered).sum()),
+        "favorable": favorable,
+        "adverse": adverse,
+        "minutes": minutes,
+        "close_rel": close_rel,
+        "close_before": (close[start - 1] - price) * sign,
+        "close_last": close_rel[rows, valid.sum(axis=1) - 1],
+    }
+
+
+def _first_reach(values: np.ndarray, levels: np.ndarray) -> np.ndarray:
+    """
+    Pour chaque ligne de values (n, W) et chaque niveau (m,), indice de la
+    première colonne où values >= niveau (W si jamais) -> (n, m).
+
+    Les maxima cumulés sont croissants par ligne ; chaque ligne est décalée
+    dans sa propre bande [i*span, (i+1)*span), ce qui rend le tableau aplati
+    globalement trié : un seul searchsorted pour n x m requêtes.
+    """
+    running = np.maximum.accumulate(values, axis=1)
+    n, width = running.shape
+    finite = running[np.isfinite(running)]
+    lo = min(finite.min() if finite.size else 0.0, levels.min()) - 1.0
+    hi = max(finite.max() if finite.size else 0.0, levels.max()) + 1.0
+    span = hi - lo
+    band = np.arange(n, dtype=np.float64)[:, None] * span
+    flat = (np.maximum(running, lo) - lo + band).ravel()
+    queries = (levels[None, :] - lo) + band
+    found = np.searchsorted(flat, queries.ravel(), side="left").reshape(n, len(levels))
+    return np.minimum(found - np.arange(n)[:, None] * width, width)
+
+
+def replay(bars: dict, signals: dict, sl_points, tp_points, be_delay_minutes=(None,), max_bars: int = REPLAY_MAX_BARS, top: int | None = 20) -> dict:
+    """
+    Rejoue signals (voir signals_from_rows) sur bars (trendbar_cache.load)
+    pour toutes les combinaisons sl_points x tp_points x be_delay_minutes
+    (None = sans BE). Retourne les `top` meilleures par R total (toutes si
+    top est None).
+    """
+    started = time.perf_counter()
+    sl = parse_levels(sl_points)
+    tp = parse_levels(tp_points)
+    delays = parse_levels(be_delay_minutes, allow_none=True)
+    window = _windows(bars, signals, max_bars) if len(signals["entry_ms"]) else None
+    report = {
+        "signals": window["n"] if window else 0,
+        "skipped": signals.get("skipped", 0) + (window["skipped"] if window else len(signals["entry_ms"])),
+        "bars_per_signal": max_bars,
+        "combinations": len(sl) * len(tp) * len(delays),
+    }
+    if window is None:
+        return {**report, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1), "results": []}
+    n = window["n"]
+    if n * len(sl) * len(tp) > REPLAY_MAX_CELLS:
+        raise ValueError(f"Grille trop grande : {n} signaux x {len(sl)} SL x {len(tp)} TP > REPLAY_MAX_CELLS={REPLAY_MAX_CELLS}")
+
+    t_tp = _first_reach(window["favorable"], tp)[:, None, :]        # (n, 1, n_tp)
+    t_sl = _first_reach(window["adverse"], sl)[:, :, None]          # (n, n_sl, 1)
+    # Pour chaque barre, prochaine barre (incluse) qui revient au prix
+    # d'entrée : sortie d'une position passée à BE.
+    rows = np.arange(n)
+    at_entry = np.where(window["adverse"] >= 0, np.arange(max_bars), max_bars)
+    next_at_entry = np.minimum.accumulate(at_entry[:, ::-1], axis=1)[:, ::-1]
+    ratio = tp[None, None, :] / sl[None, :, None]
+    open_r = window["close_last"][:, None, None] / sl[None, :, None]
+
+    blocks = []
+    for delay in delays:
+        if np.isinf(delay):
+            applied = np.zeros((n, 1, 1), dtype=bool)
+            be_exit = np.full((n, 1, 1), max_bars)
+        else:
+            k = _first_reach(window["minutes"], np.array([delay]))[:, 0]
+            k_bar = np.minimum(k, max_bars - 1)
+            in_profit = np.where(k == 0, window["close_before"], window["close_rel"][rows, np.maximum(k_bar - 1, 0)]) > 0
+            eligible = ((k < max_bars) & in_profit)[:, None, None]
+            k = k[:, None, None]
+            applied = eligible & (k <= t_tp) & (k <= t_sl)
+            be_exit = next_at_entry[rows, k_bar][:, None, None]
+        t_stop = np.where(applied, be_exit, t_sl)
+        tp_first = t_tp < t_stop
+        stopped = ~tp_first & (t_stop < max_bars)
+        r = np.where(tp_first, ratio, np.where(stopped, np.where(applied, 0.0, -1.0), open_r))
+        blocks.append(_aggregate(r, tp_first, stopped & applied, stopped & ~applied, delay, sl, tp))
+
+    results = {key: np.concatenate([b[key] for b in blocks]) for key in blocks[0]}
+    order = np.argsort(-results["total_r"], kind="stable")
+    if top is not None:
+        order = order[:top]
+    report["results"] = [
+        {
+            "sl_points": float(results["sl_points"][i]),
+            "tp_points": float(results["tp_points"][i]),
+            "be_delay_minutes": None if np.isinf(results["be_delay_minutes"][i]) else float(results["be_delay_minutes"][i]),
+            "trades": n,
+            "win_rate": round(float(results["win_rate"][i]), 4),
+            "total_r": round(float(results["total_r"][i]), 2),
+            "avg_r": round(float(results["total_r"][i]) / n, 4),
+            "profit_factor": None if np.isinf(results["profit_factor"][i]) else round(float(results["profit_factor"][i]), 3),
+            "max_drawdown_r": round(float(results["max_drawdown_r"][i]), 2),
+            "tp": int(results["tp"][i]),
+            "sl": int(results["sl"][i]),
+            "be": int(results["be"][i]),
+            "open": int(results["open"][i]),
+        }
+        for i in order
+    ]
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def _aggregate(r, tp_hits, be_hits, sl_hits, delay, sl, tp) -> dict:
+    """Statistiques par combinaison (axe 0 = signaux, dans l'ordre chronologique), aplaties."""
+    shape = (len(sl), len(tp))
+    r = np.broadcast_to(r, (r.shape[0],) + shape)
+    gains = np.where(r > 0, r, 0.0).sum(axis=0)
+    losses = -np.where(r < 0, r, 0.0).sum(axis=0)
+    equity = np.cumsum(r, axis=0)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0), axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_factor = np.where(losses > 0, gains / losses, np.inf)
+    counts = [np.broadcast_to(h, r.shape).sum(axis=0) for h in (tp_hits, be_hits, sl_hits)]
+    grid_sl, grid_tp = np.meshgrid(sl, tp, indexing="ij")
+    block = {
+        "sl_points": grid_sl,
+        "tp_points": grid_tp,
+        "be_delay_minutes": np.full(shape, delay),
+        "win_rate": (r > 0).mean(axis=0),
+        "total_r": r.sum(axis=0),
+        "profit_factor": profit_factor,
+        "max_drawdown_r": (peak - equity).max(axis=0),
+        "tp": counts[0],
+        "be": counts[1],
+        "sl": counts[2],
+        "open": r.shape[0] - counts[0] - counts[1] - counts[2],
+    }
+    return {key: value.ravel() for key, value in block.items()}
+
+
+def _read_signals_file(path: str) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            return list(csv.DictReader(f))
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rejeu de signaux sur le cache de barres M1")
+    parser.add_argument("--symbol", default="NAS100")
+    parser.add_argument("--signals", required=True, help="fichier CSV, NDJSON ou JSON (export de /journal/trades/export)")
+    parser.add_argument("--sl", default="50", help="sl_points, séparés par des virgules")
+    parser.add_argument("--tp", default="100", help="tp_points, séparés par des virgules")
+    parser.add_argument("--be", default="none,15", help="délais BE en minutes ('none' = sans BE)")
+    parser.add_argument("--max-bars", type=int, default=REPLAY_MAX_BARS)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    bars = trendbar_cache.load(args.symbol)
+    if bars is None:
+        raise SystemExit(f"Aucune barre en cache pour {args.symbol} (POST /backtest/trendbars/sync d'abord)")
+    signals = signals_from_rows(_read_signals_file(args.signals))
+    report = replay(bars, signals, args.sl, args.tp, args.be.split(","), max_bars=args.max_bars, top=args.top)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
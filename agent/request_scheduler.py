@@ -0,0 +1,227 @@
+"""
+Ordonnanceur des requêtes sortantes vers cTrader (une seule connexion).
+
+L'Open API limite le débit de requêtes par connexion (50 req/s, dont 5 req/s
+pour les données historiques) et rejette le surplus. Sans ordonnancement,
+un /debug/symbols ou un téléchargement d'historique peut passer devant un
+ProtoOANewOrderReq, voire consommer la marge qui le ferait rejeter.
+
+_send() (ctrader_trading.py) obtient donc un jeton ici avant chaque envoi :
+- un seau à jetons global (CTRADER_MAX_REQUESTS_PER_SECOND, un peu sous la
+  limite broker) et un second pour les requêtes historiques
+  (CTRADER_MAX_HISTORICAL_PER_SECOND) ;
+- trois classes de priorité servies strictement dans l'ordre :
+  ORDER (ordres, amendements SL/TP, clôtures), ACCOUNT (auth, état du
+  compte, symboles tradés, ping), BACKGROUND (diagnostics, historique) ;
+- BACKGROUND ne peut pas prendre les CTRADER_ORDER_RESERVED_TOKENS derniers
+  jetons, gardés pour un ordre qui arriverait juste après (réserve ramenée
+  à capacité - 1 si besoin, sinon BACKGROUND ne passerait jamais) ;
+- une file bornée par classe (CTRADER_SCHEDULER_QUEUE_MAX) : au-delà, la
+  requête échoue tout de suite (RequestQueueFull) plutôt que de s'accumuler ;
+  restée en file au-delà de son délai, elle échoue en QueueTimeout - à ne pas
+  confondre avec un timeout de réponse cTrader : la socket n'y est pour rien.
+
+Tout s'exécute dans la boucle asyncio : pas de verrou.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+import metrics
+from ctrader_open_api.messages.OpenApiMessages_pb2 import (
+    ProtoOAAmendOrderReq,
+    ProtoOAAmendPositionSLTPReq,
+    ProtoOACancelOrderReq,
+    ProtoOACashFlowHistoryListReq,
+    ProtoOAClosePositionReq,
+    ProtoOADealListReq,
+    ProtoOAGetTickDataReq,
+    ProtoOAGetTrendbarsReq,
+    ProtoOANewOrderReq,
+    ProtoOAOrderListReq,
+    ProtoOASymbolsListReq,
+)
+
+MAX_REQUESTS_PER_SECOND = float(os.environ.get("CTRADER_MAX_REQUESTS_PER_SECOND", "45"))
+MAX_HISTORICAL_PER_SECOND = float(os.environ.get("CTRADER_MAX_HISTORICAL_PER_SECOND", "4"))
+ORDER_RESERVED_TOKENS = float(os.environ.get("CTRADER_ORDER_RESERVED_TOKENS", "5"))
+SCHEDULER_QUEUE_MAX = int(os.environ.get("CTRADER_SCHEDULER_QUEUE_MAX", "200"))
+
+ORDER, ACCOUNT, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ("order", "account", "background")
+
+_ORDER_TYPES = {
+    cls().payloadType
+    for cls in (
+        ProtoOANewOrderReq, ProtoOAAmendPositionSLTPReq, ProtoOAClosePositionReq,
+        ProtoOACancelOrderReq, ProtoOAAmendOrderReq,
+    )
+}
+_HISTORICAL_TYPES = {
+    cls().payloadType
+    for cls in (
+        ProtoOAGetTrendbarsReq, ProtoOAGetTickDataReq, ProtoOADealListReq,
+        ProtoOACashFlowHistoryListReq, ProtoOAOrderListReq,
+    )
+}
+_BACKGROUND_TYPES = _HISTORICAL_TYPES | {ProtoOASymbolsListReq().payloadType}
+
+
+class RequestQueueFull(RuntimeError):
+    """La file de la classe de priorité est pleine - la requête n'est pas envoyée."""
+
+
+class QueueTimeout(RuntimeError):
+    """Délai écoulé avant d'obtenir un jeton - la requête n'a pas été envoyée."""
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)   # rafale max : une seconde de débit
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, needed: float) -> float:
+        """Délai avant d'avoir `needed` jetons (0 s'ils sont déjà là)."""
+        return max(0.0, (needed - self.tokens) / self.rate)
+
+
+_bucket = _TokenBucket(MAX_REQUESTS_PER_SECOND)
+if ORDER_RESERVED_TOKENS > _bucket.capacity - 1:
+    ORDER_RESERVED_TOKENS = max(0.0, _bucket.capacity - 1)
+_historical_bucket = _TokenBucket(MAX_HISTORICAL_PER_SECOND)
+_queues = tuple(deque() for _ in PRIORITY_NAMES)   # (future, historical, enqueued)
+_wakeup = None
+_dispatcher_task = None
+_stats = {"granted": [0, 0, 0], "rejected": [0, 0, 0]}
+
+
+def classify(payload_type) -> int:
+    if payload_type in _ORDER_TYPES:
+        return ORDER
+    if payload_type in _BACKGROUND_TYPES:
+        return BACKGROUND
+    return ACCOUNT
+
+
+async def acquire(payload_type, timeout: float, priority: int | None = None) -> None:
+    """
+    Attend le droit d'envoyer une requête de ce payloadType, au plus
+    `timeout` secondes (QueueTimeout au-delà). Lève RequestQueueFull si la
+    file de sa classe est pleine.
+    """
+    global _wakeup, _dispatcher_task
+    if priority is None:
+        priority = classify(payload_type)
+    queue = _queues[priority]
+    if len(queue) >= SCHEDULER_QUEUE_MAX:
+        _stats["rejected"][priority] += 1
+        metrics.inc("ctrader_scheduler_rejected_total", priority=PRIORITY_NAMES[priority])
+        raise RequestQueueFull(
+            f"File cTrader '{PRIORITY_NAMES[priority]}' pleine ({SCHEDULER_QUEUE_MAX} requêtes) : "
+            f"payloadType={payload_type} non envoyé"
+        )
+
+    loop = asyncio.get_running_loop()
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    if _dispatcher_task is None or _dispatcher_task.done():
+        _dispatcher_task = loop.create_task(_dispatch())
+
+    future = loop.create_future()
+    enqueued = time.perf_counter()
+    queue.append((future, payload_type in _HISTORICAL_TYPES, enqueued))
+    metrics.set_gauge("ctrader_scheduler_depth", len(queue), priority=PRIORITY_NAMES[priority])
+    _wakeup.set()
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        # Le répartiteur ignore les Future annulés restés dans la file.
+        raise QueueTimeout(
+            f"Timeout cTrader après {timeout}s : payloadType={payload_type} toujours en file "
+            f"'{PRIORITY_NAMES[priority]}' (limite de débit)"
+        )
+    metrics.observe(
+        "ctrader_scheduler_wait_seconds", time.perf_counter() - enqueued, priority=PRIORITY_NAMES[priority]
+    )
+
+
+def _next_grant(now: float):
+    """
+    Choisit la prochaine requête servable. Retourne (priorité, 0) si un jeton
+    est accordable tout de suite, sinon (None, délai d'attente minimal).
+    """
+    delay = None
+    for priority, queue in enumerate(_queues):
+        while queue and queue[0][0].done():
+            queue.popleft()   # appelant parti (timeout)
+        if not queue:
+            continue
+        historical = queue[0][1]
+        needed = 1.0 + (ORDER_RESERVED_TOKENS if priority == BACKGROUND else 0.0)
+        wait = _bucket.wait_for(needed)
+        if historical:
+            wait = max(wait, _historical_bucket.wait_for(1.0))
+        if wait == 0.0:
+            return priority, 0.0
+        delay = wait if delay is None else min(delay, wait)
+        if priority != BACKGROUND and not historical:
+            # Une classe prioritaire bloquée par le seau global : ne pas
+            # laisser une classe inférieure passer devant.
+            return None, delay
+    return None, delay
+
+
+async def _dispatch() -> None:
+    while True:
+        now = time.monotonic()
+        _bucket.refill(now)
+        _historical_bucket.refill(now)
+        priority, delay = _next_grant(now)
+        if priority is not None:
+            future, historical, _ = _queues[priority].popleft()
+            _bucket.tokens -= 1.0
+            if historical:
+                _historical_bucket.tokens -= 1.0
+            _stats["granted"][priority] += 1
+            metrics.set_gauge("ctrader_scheduler_depth", len(_queues[priority]), priority=PRIORITY_NAMES[priority])
+            future.set_result(None)
+            continue
+        _wakeup.clear()
+        if delay is None:
+            await _wakeup.wait()
+        else:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+def stats() -> dict:
+    now = time.monotonic()
+    _bucket.refill(now)
+    _historical_bucket.refill(now)
+    return {
+        "max_requests_per_second": MAX_REQUESTS_PER_SECOND,
+        "max_historical_per_second": MAX_HISTORICAL_PER_SECOND,
+        "order_reserved_tokens": ORDER_RESERVED_TOKENS,
+        "queue_max": SCHEDULER_QUEUE_MAX,
+        "tokens": round(_bucket.tokens, 2),
+        "historical_tokens": round(_historical_bucket.tokens, 2),
+        "queues": {
+            name: {
+                "depth": len(_queues[i]),
+                "granted": _stats["granted"][i],
+                "rejected": _stats["rejected"][i],
+            }
+            for i, name in enumerate(PRIORITY_NAMES)
+        },
+    }
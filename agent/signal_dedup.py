@@ -0,0 +1,151 @@
+"""
+Dé-duplication des signaux avant toute requête broker.
+
+TradingView renvoie une alerte quand le webhook met trop de temps à
+répondre, et une alerte mal configurée peut partir plusieurs fois :
+execute_trade() passerait alors un second ProtoOANewOrderReq identique.
+
+Chaque signal reçoit une clé d'idempotence :
+- explicite : champ "idempotency_key" du payload, ou en-tête HTTP
+  Idempotency-Key ;
+- sinon dérivée : hash de (symbol, direction, prix, niveau, session) et
+  d'une tranche de temps de SIGNAL_DEDUP_BUCKET_SECONDS. La tranche
+  précédente est aussi vérifiée, pour qu'un renvoi à cheval sur deux
+  tranches soit tout de même reconnu.
+
+L'index est un OrderedDict borné (SIGNAL_DEDUP_MAX_KEYS) à expiration
+(SIGNAL_DEDUP_TTL_SECONDS) : vérification et insertion en O(1), éviction
+des plus anciennes clés en tête.
+
+Une clé reste acquise même si l'exécution échoue : un échec peut survenir
+APRÈS l'envoi de l'ordre (ex: timeout de la réponse) et un renvoi
+provoquerait alors un doublon. Mieux vaut un signal manqué (visible dans
+Telegram) qu'une position doublée.
+
+Persistance (SIGNAL_DEDUP_PERSIST=1) : la clé est écrite dans la colonne
+trades.idempotency_key (contrainte UNIQUE recommandée) et les clés récentes
+sont rechargées au démarrage via load_recent_keys(), pour survivre à un
+redéploiement.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+SIGNAL_DEDUP_TTL_SECONDS = float(os.environ.get("SIGNAL_DEDUP_TTL_SECONDS", "600"))
+SIGNAL_DEDUP_BUCKET_SECONDS = int(os.environ.get("SIGNAL_DEDUP_BUCKET_SECONDS", "60"))
+SIGNAL_DEDUP_MAX_KEYS = int(os.environ.get("SIGNAL_DEDUP_MAX_KEYS", "10000"))
+SIGNAL_DEDUP_PERSIST = os.environ.get("SIGNAL_DEDUP_PERSIST", "0") == "1"
+
+_FIELDS = ("symbol", "direction", "prix", "niveau", "session")
+_ACCOUNT_SUFFIX = "|acct="
+
+_index = OrderedDict()   # clé -> (expire_at, signal_ref)
+_stats = {"accepted": 0, "duplicates": 0, "evicted": 0, "released": 0}
+
+
+def _derived_key(data: dict, bucket: int) -> str:
+    parts = [str(data.get(field, "")).strip().upper() for field in _FIELDS]
+    parts.append(str(bucket))
+    return "h:" + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+def signal_keys(data: dict, header_key: str | None = None, now: float | None = None) -> list:
+    """
+    Clés à vérifier pour ce signal ; la première est celle à enregistrer.
+    Une clé explicite remplace complètement la clé dérivée.
+    """
+    explicit = data.get("idempotency_key") or header_key
+    if explicit:
+        return [f"k:{explicit}"]
+    now = time.time() if now is None else now
+    bucket = int(now // SIGNAL_DEDUP_BUCKET_SECONDS)
+    return [_derived_key(data, bucket), _derived_key(data, bucket - 1)]
+
+
+def _evict(now: float) -> None:
+    while _index:
+        key, (expire_at, _) = next(iter(_index.items()))
+        if expire_at > now and len(_index) <= SIGNAL_DEDUP_MAX_KEYS:
+            break
+        _index.popitem(last=False)
+        _stats["evicted"] += 1
+
+
+def claim(keys: list, signal_ref: str | None = None, now: float | None = None):
+    """
+    Tente d'acquérir le signal. Retourne (True, None) s'il est nouveau
+    (keys[0] est alors enregistrée), ou (False, signal_ref d'origine) si
+    l'une des clés a déjà été vue dans la fenêtre TTL.
+    """
+    now = time.time() if now is None else now
+    _evict(now)
+    for key in keys:
+        entry = _index.get(key)
+        if entry is not None and entry[0] > now:
+            _stats["duplicates"] += 1
+            return False, entry[1]
+    _index[keys[0]] = (now + SIGNAL_DEDUP_TTL_SECONDS, signal_ref)
+    _index.move_to_end(keys[0])
+    _stats["accepted"] += 1
+    return True, None
+
+
+def set_signal_ref(key: str, signal_ref: str) -> None:
+    """Associe après coup une référence (ex: signal_id du mode asynchrone) à une clé acquise."""
+    entry = _index.get(key)
+    if entry is not None:
+        _index[key] = (entry[0], signal_ref)
+
+
+def release(key: str, signal_ref: str | None = None) -> bool:
+    """
+    Libère une clé acquise dont le signal n'a finalement pas été accepté
+    (file pleine, broker injoignable) : le renvoi ne sera pas écarté comme
+    doublon. Avec signal_ref, seulement si la clé porte encore cette
+    référence - une clé déjà associée à un signal_id reste acquise.
+    """
+    entry = _index.get(key)
+    if entry is None or (signal_ref is not None and entry[1] != signal_ref):
+        return False
+    del _index[key]
+    _stats["released"] += 1
+    return True
+
+
+def account_scoped_key(key: str | None, account_id: int | None) -> str | None:
+    """
+    Clé écrite dans trades.idempotency_key : en mode multi-comptes, un même
+    signal produit une ligne par compte, la clé est donc suffixée du compte.
+    """
+    if key is None or account_id is None:
+        return key
+    return f"{key}{_ACCOUNT_SUFFIX}{account_id}"
+
+
+def stats() -> dict:
+    return {**_stats, "keys": len(_index), "persist": SIGNAL_DEDUP_PERSIST}
+
+
+def load_recent_keys(supabase_client) -> int:
+    """
+    Recharge (synchrone) les clés des trades récents depuis Supabase, pour
+    que la protection survive à un redéploiement. Retourne le nombre de clés.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(seconds=SIGNAL_DEDUP_TTL_SECONDS)).isoformat()
+    result = (
+        supabase_client.table("trades")
+        .select("id, idempotency_key, entry_time")
+        .gte("entry_time", since)
+        .not_.is_("idempotency_key", "null")
+        .order("entry_time")
+        .execute()
+    )
+    now = time.time()
+    for row in result.data:
+        entry_ts = datetime.fromisoformat(row["entry_time"]).timestamp()
+        key = row["idempotency_key"].split(_ACCOUNT_SUFFIX, 1)[0]
+        _index[key] = (entry_ts + SIGNAL_DEDUP_TTL_SECONDS, f"trade:{row['id']}")
+    _evict(now)
+    return len(result.data)
@@ -0,0 +1,120 @@
+"""
+Mode "accusé de réception puis exécution" pour /webhook/signal.
+
+Par défaut, receive_signal() garde la requête HTTP ouverte pendant toute
+l'exécution (auth, symbole, ordre, journal, Telegram). L'émetteur de
+webhooks de TradingView abandonne au bout de quelques secondes et
+RÉESSAIE - avec un risque d'ordre en double sous charge.
+
+Avec SIGNAL_ASYNC_MODE=1 (ou ?mode=async sur la requête), le webhook se
+contente de valider le payload, de le déposer dans une file bornée et de
+répondre 202 avec un identifiant de signal ; un pool de SIGNAL_WORKERS
+tâches exécute les signaux en arrière-plan. Le résultat se consulte sur
+GET /signals/{signal_id}.
+
+Les résultats sont gardés en mémoire (SIGNAL_RESULTS_MAX derniers
+signaux) : c'est un outil de suivi, le journal Supabase reste la source de
+vérité des trades.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+import event_log
+import metrics
+
+SIGNAL_ASYNC_MODE = os.environ.get("SIGNAL_ASYNC_MODE", "0") == "1"
+SIGNAL_QUEUE_MAX = int(os.environ.get("SIGNAL_QUEUE_MAX", "100"))
+SIGNAL_WORKERS = int(os.environ.get("SIGNAL_WORKERS", "4"))
+SIGNAL_RESULTS_MAX = int(os.environ.get("SIGNAL_RESULTS_MAX", "1000"))
+
+
+class SignalQueueFull(Exception):
+    """La file d'exécution est pleine - le webhook répond 503."""
+
+
+_queue: asyncio.Queue | None = None
+_workers = []
+_results = OrderedDict()   # signal_id -> dict (ordre d'insertion = ancienneté)
+
+
+def start_signal_workers(handler) -> None:
+    """
+    A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup).
+    handler : coroutine handler(data) -> dict exécutant réellement le signal.
+    """
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=SIGNAL_QUEUE_MAX)
+    loop = asyncio.get_running_loop()
+    while len(_workers) < SIGNAL_WORKERS:
+        _workers.append(loop.create_task(_worker(handler)))
+
+
+def submit(data: dict) -> str:
+    """Met le signal en file et retourne son identifiant (lève SignalQueueFull)."""
+    signal_id = uuid.uuid4().hex
+    entry = {
+        "signal_id": signal_id,
+        "status": "queued",
+        "symbol": data.get("symbol"),
+        "direction": data.get("direction"),
+        "queued_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+    try:
+        _queue.put_nowait((signal_id, data, time.perf_counter()))
+    except asyncio.QueueFull:
+        metrics.inc("signal_queue_rejected_total")
+        raise SignalQueueFull(f"File d'exécution pleine ({SIGNAL_QUEUE_MAX} signaux en attente)")
+    _remember(signal_id, entry)
+    metrics.set_gauge("signal_queue_depth", _queue.qsize())
+    return signal_id
+
+
+def get_result(signal_id: str) -> dict | None:
+    entry = _results.get(signal_id)
+    return dict(entry) if entry is not None else None
+
+
+def stats() -> dict:
+    return {
+        "async_mode_default": SIGNAL_ASYNC_MODE,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "queue_max": SIGNAL_QUEUE_MAX,
+        "workers": len(_workers),
+        "tracked_results": len(_results),
+    }
+
+
+def _remember(signal_id: str, entry: dict) -> None:
+    _results[signal_id] = entry
+    while len(_results) > SIGNAL_RESULTS_MAX:
+        _results.popitem(last=False)
+
+
+async def _worker(handler) -> None:
+    while True:
+        signal_id, data, enqueued = await _queue.get()
+        metrics.set_gauge("signal_queue_depth", _queue.qsize())
+        metrics.observe("signal_queue_wait_seconds", time.perf_counter() - enqueued)
+        # Le worker sert tous les signaux : l'identifiant de corrélation
+        # posé par receive_signal() voyage avec le signal.
+        event_log.set_correlation_id(data.get("correlation_id"))
+        entry = _results.get(signal_id, {})
+        entry["status"] = "running"
+        entry["started_at"] = time.time()
+        try:
+            entry["result"] = await handler(data)
+            entry["status"] = "done"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            entry["finished_at"] = time.time()
+            _queue.task_done()
@@ -0,0 +1,150 @@
+"""
+Derniers prix bid/ask des symboles tradés, alimentés par les
+ProtoOASpotEvent de l'abonnement ProtoOASubscribeSpotsReq (voir
+ctrader_trading._subscribe_spots()).
+
+Avant : le SL/TP était calculé à partir du champ "prix" du signal
+TradingView, qui peut avoir plusieurs secondes de retard au moment où
+l'ordre part. Ici, execute_trade() lit le prix courant en mémoire.
+
+Stockage : pour chaque symbole, un buffer circulaire de taille fixe
+(SPOT_BUFFER_SIZE derniers ticks) sur des array('d') pré-alloués - aucune
+allocation par tick, lecture du dernier prix en O(1). Les ticks arrivent
+depuis le thread du reactor Twisted, les lectures se font depuis la boucle
+asyncio : verrou court par symbole.
+
+Les prix des ProtoOASpotEvent sont des entiers à l'échelle 10^5 ; un event
+peut ne contenir que le côté qui a changé (bid OU ask), l'autre côté est
+alors reporté depuis le tick précédent.
+"""
+import os
+import threading
+import time
+from array import array
+
+SPOT_BUFFER_SIZE = int(os.environ.get("SPOT_BUFFER_SIZE", "512"))
+SPOT_PRICE_SCALE = 100000
+# Au-delà de cet âge, le dernier tick n'est plus jugé fiable pour construire
+# un ordre (marché fermé, abonnement perdu...) : on retombe sur le prix du signal.
+SPOT_MAX_AGE_SECONDS = float(os.environ.get("SPOT_MAX_AGE_SECONDS", "5"))
+
+
+class TickRingBuffer:
+    """Buffer circulaire (bid, ask, horodatage local) de taille fixe pour un symbole."""
+
+    __slots__ = ("size", "bids", "asks", "times", "count", "head", "lock")
+
+    def __init__(self, size: int = SPOT_BUFFER_SIZE):
+        self.size = size
+        self.bids = array("d", [0.0]) * size
+        self.asks = array("d", [0.0]) * size
+        self.times = array("d", [0.0]) * size
+        self.count = 0   # nombre total de ticks reçus
+        self.head = -1   # index du dernier tick écrit
+        self.lock = threading.Lock()
+
+    def append(self, bid: float | None, ask: float | None, ts: float) -> None:
+        with self.lock:
+            if self.head >= 0:
+                if bid is None:
+                    bid = self.bids[self.head]
+                if ask is None:
+                    ask = self.asks[self.head]
+            head = (self.head + 1) % self.size
+            self.bids[head] = bid if bid is not None else 0.0
+            self.asks[head] = ask if ask is not None else 0.0
+            self.times[head] = ts
+            self.head = head
+            self.count += 1
+
+    def last(self):
+        """(bid, ask, horodatage) du dernier tick, ou None."""
+        with self.lock:
+            if self.head < 0:
+                return None
+            return self.bids[self.head], self.asks[self.head], self.times[self.head]
+
+    def recent(self, n: int) -> list:
+        """Les n derniers ticks, du plus ancien au plus récent."""
+        with self.lock:
+            n = min(n, self.count, self.size)
+            out = []
+            for i in range(n - 1, -1, -1):
+                idx = (self.head - i) % self.size
+                out.append((self.bids[idx], self.asks[idx], self.times[idx]))
+            return out
+
+    def rate(self, window_seconds: float, now: float) -> float:
+        """Ticks par seconde sur la fenêtre (bornée par la taille du buffer)."""
+        with self.lock:
+            n = min(self.count, self.size)
+            threshold = now - window_seconds
+            hits = 0
+            for i in range(n):
+                if self.times[(self.head - i) % self.size] < threshold:
+                    break
+                hits += 1
+            return hits / window_seconds
+
+
+_buffers = {}   # symbolId -> TickRingBuffer
+_subscribed = set()
+
+
+def on_spot_event(event) -> None:
+    """Appelée depuis _on_message_received() (thread du reactor) pour chaque ProtoOASpotEvent."""
+    buffer = _buffers.get(event.symbolId)
+    if buffer is None:
+        buffer = _buffers.setdefault(event.symbolId, TickRingBuffer())
+    bid = event.bid / SPOT_PRICE_SCALE if event.HasField("bid") else None
+    ask = event.ask / SPOT_PRICE_SCALE if event.HasField("ask") else None
+    buffer.append(bid, ask, time.time())
+
+
+def mark_subscribed(symbol_ids) -> None:
+    _subscribed.update(symbol_ids)
+
+
+def reset_subscriptions() -> None:
+    """Après une déconnexion : les abonnements sont perdus côté serveur."""
+    _subscribed.clear()
+
+
+def subscribed() -> set:
+    return set(_subscribed)
+
+
+def current_price(symbol_id: int, side: str, max_age_seconds: float = SPOT_MAX_AGE_SECONDS) -> float | None:
+    """
+    Prix d'exécution attendu pour un ordre marché : ask pour un achat, bid
+    pour une vente. None si aucun tick récent (l'appelant garde alors son
+    prix de repli).
+    """
+    buffer = _buffers.get(symbol_id)
+    if buffer is None:
+        return None
+    last = buffer.last()
+    if last is None:
+        return None
+    bid, ask, ts = last
+    if time.time() - ts > max_age_seconds:
+        return None
+    price = ask if side == "BUY" else bid
+    return price or None
+
+
+def stats() -> dict:
+    """Cadence et fraîcheur des ticks par symbole, pour GET /debug/spots."""
+    now = time.time()
+    out = {}
+    for symbol_id, buffer in _buffers.items():
+        last = buffer.last()
+        out[symbol_id] = {
+            "subscribed": symbol_id in _subscribed,
+            "ticks_total": buffer.count,
+            "ticks_per_second_60s": round(buffer.rate(60.0, now), 3),
+            "last_bid": last[0] if last else None,
+            "last_ask": last[1] if last else None,
+            "staleness_seconds": round(now - last[2], 3) if last else None,
+        }
+    return out
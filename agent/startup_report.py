@@ -0,0 +1,99 @@
+"""
+Rapport de démarrage (/debug/startup) : ce que coûte un cold start - à
+chaque redéploiement Railway, le bot ne répond pas tant que l'app n'est pas
+importée et que le lifespan FastAPI n'a pas rendu la main.
+
+- install_import_timer() (tout en haut de main.py) chronomètre le premier
+  import de chaque module de premier niveau (fastapi, supabase,
+  ctrader_open_api, ctrader_trading...) : temps inclusif, et temps propre
+  hors sous-imports chronométrés. Seuls les modules pas encore chargés
+  passent par le chronomètre, qui est retiré une fois le démarrage fini
+  (stop_import_timer()) : aucun coût ensuite ;
+- phase(name) chronomètre une étape d'initialisation (client Supabase,
+  reactor Twisted, démarrage du broker...) ;
+- mark(name) note l'instant d'un jalon (app_ready, first_response,
+  broker_ready), mesuré depuis l'import de ce module - c'est-à-dire depuis
+  le tout début de l'import de main.py.
+"""
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import event_log
+
+log = event_log.get_logger("startup")
+
+_T0 = time.perf_counter()
+_STARTED_AT = time.time()
+
+_imports = {}
+_phases = {}
+_marks = {}
+_local = threading.local()
+_builtin_import = builtins.__import__
+
+
+def _elapsed_ms(since: float = _T0) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    top = name.partition(".")[0]
+    if level or top in sys.modules or top in _imports:
+        return _builtin_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)   # temps des sous-imports chronométrés
+    started = time.perf_counter()
+    try:
+        return _builtin_import(name, globals, locals, fromlist, level)
+    finally:
+        inclusive = time.perf_counter() - started
+        children = stack.pop()
+        if stack:
+            stack[-1] += inclusive
+        _imports[top] = {
+            "inclusive_ms": round(inclusive * 1000, 1),
+            "self_ms": round((inclusive - children) * 1000, 1),
+            "thread": threading.current_thread().name,
+        }
+
+
+def install_import_timer() -> None:
+    builtins.__import__ = _timed_import
+
+
+def stop_import_timer() -> None:
+    builtins.__import__ = _builtin_import
+
+
+@contextmanager
+def phase(name: str):
+    """Chronomètre une étape d'initialisation (la première exécution seulement)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.setdefault(name, {"ms": _elapsed_ms(started), "at_ms": _elapsed_ms()})
+
+
+def mark(name: str) -> None:
+    """Note un jalon du démarrage (seul le premier passage compte)."""
+    if name not in _marks:
+        _marks[name] = _elapsed_ms()
+        log.info(f"⏱️ {name} à {_marks[name]} ms")
+
+
+def report() -> dict:
+    imports = sorted(_imports.items(), key=lambda item: item[1]["inclusive_ms"], reverse=True)
+    return {
+        "started_at": _STARTED_AT,
+        "uptime_seconds": round(time.perf_counter() - _T0, 1),
+        "marks_ms": dict(_marks),
+        "phases": dict(_phases),
+        "imports": {name: entry for name, entry in imports if entry["inclusive_ms"] >= 1},
+        "import_timer_active": builtins.__import__ is _timed_import,
+    }
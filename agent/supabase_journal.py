@@ -5,15 +5,83 @@ Utilise le client officiel : pip install supabase
 Variables d'environnement requises (à définir sur Railway) :
     SUPABASE_URL
     SUPABASE_KEY   -> clé "service_role" recommandée (écriture serveur, pas anon)
+
+ÉCRITURE NON BLOQUANTE (chemin utilisé par execute_trade()) :
+Les fonctions log_*() ci-dessous font un aller-retour HTTPS synchrone vers
+Supabase. Appelées directement depuis du code async, elles bloquent la
+boucle d'Uvicorn pendant toute la durée de la requête. Les variantes
+enqueue_*() se contentent de déposer l'opération dans une file en mémoire
+et rendent la main immédiatement ; un worker unique (start_journal_writer(),
+lancé au démarrage de l'app) vide la file par lots :
+- toutes les insertions d'un lot partent en UN seul insert multi-lignes,
+  puis les mises à jour du lot sont appliquées dans leur ordre d'arrivée
+  (fusionnées par trade) - l'ordre entrée -> BE -> clôture d'un même trade
+  est donc toujours respecté ;
+- chaque appel Supabase est retenté avec un backoff exponentiel avant
+  d'être compté en échec ;
+- chaque lot est d'abord ajouté au journal local journal_wal (une seule
+  transaction SQLite, dans un thread : rien sur la boucle), avant toute
+  requête réseau, et n'y est acquitté qu'une fois écrit dans Supabase : en
+  cas de panne, _replay_loop() le renvoie plus tard. Une insertion rejouée
+  ne fait rien si la ligne existe déjà (ON CONFLICT DO NOTHING sur
+  journal_key) - elle ne peut pas ré-ouvrir un trade clôturé entre-temps ;
+- get_journal_writer_stats() expose profondeur de file, latence du dernier
+  flush, compteurs d'échecs et état du journal local.
+
+CLIENT PARTAGÉ : get_supabase() crée à la première utilisation l'unique
+client Supabase du processus (ctrader_auth, journal_query, journal_stats...
+passent tous par elle). Le SDK n'est importé qu'à ce moment-là, donc hors
+du cold start, et toujours depuis un thread (_with_retry) sur le chemin
+async.
 """
+import asyncio
 import os
+import threading
+import time
+import uuid
+import weakref
 from datetime import datetime, timezone
-from supabase import create_client, Client
+
+import event_log
+import journal_wal
+import metrics
+import startup_report
+
+log = event_log.get_logger("supabase_journal")
 
 SUPABASE_URL = os.environ["SUPABASE_URL"]
 SUPABASE_KEY = os.environ["SUPABASE_KEY"]
 
-_supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+_supabase = None
+_supabase_lock = threading.Lock()
+
+
+def get_supabase():
+    """Client Supabase partagé du processus, créé au premier appel."""
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                with startup_report.phase("supabase_client"):
+                    from supabase import create_client
+                    _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _supabase
+
+# Abonnés aux écritures réussies (ex: journal_stats), appelés avec
+# ("insert", id, ligne insérée) ou ("update", id, champs modifiés).
+_write_listeners = []
+
+
+def add_write_listener(listener) -> None:
+    _write_listeners.append(listener)
+
+
+def _notify_listeners(kind: str, trade_id, fields: dict) -> None:
+    for listener in _write_listeners:
+        try:
+            listener(kind, trade_id, fields)
+        except Exception as e:
+            log.warning(f"⚠️ Abonné aux écritures en échec : {type(e).__name__}: {e}")
 
 
 def log_trade_entry(
@@ -49,16 +117,19 @@ def log_trade_entry(
         "account_balance_before": account_balance_before,
         "status": "OPEN",
     }
-    result = _supabase.table("trades").insert(row).execute()
+    result = get_supabase().table("trades").insert(row).execute()
+    _notify_listeners("insert", result.data[0]["id"], result.data[0])
     return result.data[0]["id"]
 
 
 def log_be_triggered(trade_id: int) -> None:
     """A appeler quand le SL est déplacé au prix d'entrée (BE après 15 min)."""
-    _supabase.table("trades").update({
+    fields = {
         "be_triggered": True,
         "be_time": datetime.now(timezone.utc).isoformat(),
-    }).eq("id", trade_id).execute()
+    }
+    get_supabase().table("trades").update(fields).eq("id", trade_id).execute()
+    _notify_listeners("update", trade_id, fields)
 
 
 def log_trade_exit(
@@ -68,9 +139,362 @@ def log_trade_exit(
     pnl: float,
 ) -> None:
     """A appeler à la clôture du trade (TP, SL, ou BE touché)."""
-    _supabase.table("trades").update({
+    fields = {
         "status": status,
         "exit_time": datetime.now(timezone.utc).isoformat(),
         "exit_price": exit_price,
         "pnl": pnl,
-    }).eq("id", trade_id).execute()
+    }
+    get_supabase().table("trades").update(fields).eq("id", trade_id).execute()
+    _notify_listeners("update", trade_id, fields)
+
+
+def find_trade_ids_by_position(position_ids: list) -> dict:
+    """
+    Retourne {position_id: id} des trades OPEN correspondant à ces positions
+    cTrader (une seule requête, synchrone - à appeler via asyncio.to_thread).
+    """
+    if not position_ids:
+        return {}
+    result = (
+        get_supabase().table("trades")
+        .select("id, position_id")
+        .in_("position_id", list(position_ids))
+        .eq("status", "OPEN")
+        .execute()
+    )
+    return {row["position_id"]: row["id"] for row in result.data}
+
+
+# --- Écriture asynchrone par lots ---------------------------------------------
+
+JOURNAL_BATCH_MAX = int(os.environ.get("JOURNAL_BATCH_MAX", "50"))
+JOURNAL_MAX_RETRIES = int(os.environ.get("JOURNAL_MAX_RETRIES", "5"))
+JOURNAL_RETRY_BASE_SECONDS = 0.5
+# Rejeu du journal local (journal_wal) : période, et âge minimal d'une
+# entrée pour être rejouée (laisse au worker le temps de l'écrire).
+JOURNAL_WAL_REPLAY_SECONDS = float(os.environ.get("JOURNAL_WAL_REPLAY_SECONDS", "15"))
+JOURNAL_WAL_REPLAY_MIN_AGE_SECONDS = float(os.environ.get("JOURNAL_WAL_REPLAY_MIN_AGE_SECONDS", "30"))
+JOURNAL_WAL_REPLAY_BATCH = int(os.environ.get("JOURNAL_WAL_REPLAY_BATCH", "500"))
+JOURNAL_WAL_RETENTION_SECONDS = 7 * 24 * 3600
+
+_queue: asyncio.Queue | None = None
+_writer_task: asyncio.Task | None = None
+_replay_task: asyncio.Task | None = None
+# Future d'enqueue_trade_entry() -> journal_key de la ligne, pour que les
+# mises à jour puissent référencer la ligne avant même son insertion ; et
+# l'inverse pour les insertions pas encore écrites (résolues même si c'est
+# le rejeu qui finit par les écrire).
+_journal_keys = weakref.WeakKeyDictionary()
+_insert_futures = {}
+# Les entrées antérieures au démarrage appartiennent à un processus
+# précédent : rejouées dès le premier passage.
+_started_at = time.time()
+_stats = {
+    "enqueued": 0,
+    "written": 0,
+    "failed": 0,
+    "retries": 0,
+    "flushes": 0,
+    "replayed": 0,
+    "last_flush_seconds": None,
+    "last_flush_size": 0,
+    "last_error": None,
+}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+    return _queue
+
+
+def start_journal_writer() -> None:
+    """A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup)."""
+    global _writer_task, _replay_task
+    loop = asyncio.get_running_loop()
+    if _writer_task is None or _writer_task.done():
+        _writer_task = loop.create_task(_writer_loop())
+    if _replay_task is None or _replay_task.done():
+        _replay_task = loop.create_task(_replay_loop())
+
+
+def enqueue_trade_entry(**fields) -> asyncio.Future:
+    """
+    Version non bloquante de log_trade_entry() (mêmes arguments nommés).
+    Retourne un Future résolu avec l'id de la ligne une fois l'insert fait -
+    il peut être passé tel quel à enqueue_be_triggered()/enqueue_trade_exit()
+    sans l'attendre.
+    """
+    row = {
+        "symbol": fields["symbol"],
+        "direction": fields["direction"],
+        "source": fields.get("source", "auto"),
+        "entry_time": _now_iso(),
+        "entry_price": fields["entry_price"],
+        "sl_price": fields["sl_price"],
+        "tp_price": fields["tp_price"],
+        "sl_points": fields["sl_points"],
+        "tp_points": fields["tp_points"],
+        "volume": fields["volume"],
+        "risk_percent": fields["risk_percent"],
+        "account_balance_before": fields["account_balance_before"],
+        "status": "OPEN",
+        # Colonne trades.journal_key (text UNIQUE) : identifiant attribué
+        # ici, avant l'insertion - rend l'insert rejouable sans doublon
+        # (upsert) et permet les mises à jour par clé (voir journal_wal).
+        "journal_key": uuid.uuid4().hex,
+    }
+    if fields.get("idempotency_key"):
+        # Colonne trades.idempotency_key (UNIQUE) - voir signal_dedup.
+        row["idempotency_key"] = fields["idempotency_key"]
+    if fields.get("account_id"):
+        # Colonne trades.account_id (int8), requise en mode multi-comptes
+        # uniquement (CTRADER_ACCOUNT_IDS) - voir ctrader_trading.
+        row["account_id"] = fields["account_id"]
+    if fields.get("position_id"):
+        # Colonne trades.position_id (int8) : positionId cTrader, pour
+        # retrouver la ligne d'une position après un redémarrage.
+        row["position_id"] = fields["position_id"]
+    future = asyncio.get_running_loop().create_future()
+    _journal_keys[future] = row["journal_key"]
+    _insert_futures[row["journal_key"]] = future
+    _put(("insert", row["journal_key"], row, None))
+    # Fait le lien entre l'identifiant de corrélation du signal et la ligne.
+    log.info("📝 Trade mis en file", journal_key=row["journal_key"], symbol=row["symbol"], account_id=row.get("account_id"))
+    return future
+
+
+def enqueue_be_triggered(trade_id) -> None:
+    """Version non bloquante de log_be_triggered() - trade_id peut être le Future d'enqueue_trade_entry()."""
+    _enqueue_update(trade_id, {"be_triggered": True, "be_time": _now_iso()})
+
+
+def enqueue_trade_exit(trade_id, status: str, exit_price: float, pnl: float) -> None:
+    """Version non bloquante de log_trade_exit() - trade_id peut être le Future d'enqueue_trade_entry()."""
+    _enqueue_update(trade_id, {
+        "status": status,
+        "exit_time": _now_iso(),
+        "exit_price": exit_price,
+        "pnl": pnl,
+    })
+
+
+def enqueue_trade_update(trade_id, fields: dict) -> None:
+    """
+    Mise à jour partielle d'une ligne (seulement les colonnes données), par
+    la file d'écriture : ordonnée avec les autres écritures de la ligne (BE,
+    clôture) au lieu de les écraser.
+    """
+    _enqueue_update(trade_id, dict(fields))
+
+
+def _trade_key(trade_ref) -> str:
+    """journal_key d'une ligne (référencée par son Future d'insertion), ou "id:<id>"."""
+    if isinstance(trade_ref, asyncio.Future):
+        return _journal_keys[trade_ref]
+    return f"id:{int(trade_ref)}"
+
+
+def _enqueue_update(trade_ref, fields: dict) -> None:
+    _put(("update", _trade_key(trade_ref), fields, None))
+
+
+def _put(op) -> None:
+    _get_queue().put_nowait(op)
+    _stats["enqueued"] += 1
+
+
+async def ping() -> None:
+    """Lecture d'une ligne (sans nouvelle tentative) : rouvre la connexion keep-alive du pool HTTP."""
+    await asyncio.to_thread(lambda: get_supabase().table("trades").select("id").limit(1).execute())
+
+
+def get_journal_writer_stats() -> dict:
+    return {
+        **_stats,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "running": _writer_task is not None and not _writer_task.done(),
+        "wal": journal_wal.stats(),
+    }
+
+
+async def flush_journal(timeout: float = 10.0) -> None:
+    """Attend que la file soit vidée (ex: avant un arrêt propre de l'app)."""
+    if _queue is not None:
+        await asyncio.wait_for(_queue.join(), timeout)
+
+
+async def _writer_loop() -> None:
+    queue = _get_queue()
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < JOURNAL_BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+        started = time.monotonic()
+        try:
+            batch = await _log_ahead(batch)
+            await _flush_batch(batch)
+        except Exception as e:
+            # Filet de sécurité : le worker ne doit jamais mourir.
+            _stats["last_error"] = f"{type(e).__name__}: {e}"
+            log.warning(f"⚠️ Lot non écrit : {type(e).__name__}: {e}")
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.observe("signal_stage_seconds", elapsed, stage="journal_write")
+            _stats["flushes"] += 1
+            _stats["last_flush_seconds"] = elapsed
+            _stats["last_flush_size"] = len(batch)
+            for _ in batch:
+                queue.task_done()
+
+
+async def _log_ahead(batch: list) -> list:
+    """Ajoute à journal_wal les opérations du lot qui n'y sont pas encore (seq None)."""
+    fresh = [i for i, op in enumerate(batch) if op[3] is None]
+    if not fresh:
+        return batch
+    try:
+        seqs = await asyncio.to_thread(journal_wal.append_many, [batch[i][:3] for i in fresh])
+    except Exception as e:
+        # Journal local indisponible (disque) : on écrit quand même dans Supabase.
+        log.error(f"❌ Lot non ajouté au journal local : {type(e).__name__}: {e}")
+        return batch
+    batch = list(batch)
+    for i, seq in zip(fresh, seqs):
+        batch[i] = (*batch[i][:3], seq)
+    return batch
+
+
+async def _flush_batch(batch: list) -> int:
+    """
+    Ecrit un lot d'opérations (kind, trade_key, données, seq) et acquitte
+    dans journal_wal celles qui ont abouti. Retourne leur nombre. Les
+    opérations non acquittées seront rejouées par _replay_loop() ; le Future
+    d'une insertion en échec reste en attente jusque-là.
+    """
+    acked = []
+    inserts = [op for op in batch if op[0] == "insert"]
+    if inserts:
+        # Un rejeu d'une insertion déjà faite (ex: acquittement perdu) ne
+        # fait rien : la ligne existante, peut-être déjà clôturée, est gardée.
+        rows = list({key: row for _, key, row, _ in inserts}.values())
+        try:
+            ids = await _insert_rows(rows)
+        except Exception:
+            _stats["failed"] += len(inserts)
+            log.warning("⚠️ Insertions non écrites, laissées au rejeu", journal_keys=[key for _, key, _, _ in inserts])
+        else:
+            for _, key, _, seq in inserts:
+                if key not in ids:
+                    continue   # ni insérée ni trouvée : reste dans journal_wal
+                acked.append(seq)
+                future = _insert_futures.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result(ids[key])
+
+    # Fusion des mises à jour par trade, dans l'ordre d'arrivée : les
+    # insertions du lot sont déjà faites, donc la ligne visée existe (sauf
+    # insertion en échec - la mise à jour reste alors dans journal_wal).
+    updates = {}
+    for kind, key, fields, seq in batch:
+        if kind != "update":
+            continue
+        merged = updates.setdefault(key, ({}, []))
+        merged[0].update(fields)
+        merged[1].append(seq)
+
+    for key, (fields, seqs) in updates.items():
+        column, value = ("id", int(key[3:])) if key.startswith("id:") else ("journal_key", key)
+        try:
+            result = await _with_retry(
+                lambda: get_supabase().table("trades").update(fields).eq(column, value).execute()
+            )
+        except Exception:
+            _stats["failed"] += 1
+            continue
+        if not result.data:
+            # Ligne pas (encore) insérée : on réessaiera au prochain rejeu.
+            _stats["failed"] += 1
+            continue
+        _stats["written"] += 1
+        acked.extend(seqs)
+        for row in result.data:
+            _notify_listeners("update", row["id"], fields)
+
+    acked = [seq for seq in acked if seq is not None]
+    if acked:
+        await asyncio.to_thread(journal_wal.ack, acked)
+    return len(acked)
+
+
+async def _insert_rows(rows: list) -> dict:
+    """
+    Insère les lignes absentes et retourne {journal_key: id} de toutes.
+    ON CONFLICT DO NOTHING : une insertion rejouée (acquittement perdu) ne
+    doit jamais écraser la ligne déjà mise à jour (BE, clôture) - l'id des
+    lignes existantes est relu à part.
+    """
+    result = await _with_retry(
+        lambda: get_supabase().table("trades")
+        .upsert(rows, on_conflict="journal_key", ignore_duplicates=True)
+        .execute()
+    )
+    _stats["written"] += len(result.data)
+    ids = {inserted["journal_key"]: inserted["id"] for inserted in result.data}
+    for inserted in result.data:
+        _notify_listeners("insert", inserted["id"], inserted)
+    missing = [row["journal_key"] for row in rows if row["journal_key"] not in ids]
+    if missing:
+        existing = await _with_retry(
+            lambda: get_supabase().table("trades").select("id, journal_key").in_("journal_key", missing).execute()
+        )
+        ids.update({row["journal_key"]: row["id"] for row in existing.data})
+    if result.data:
+        log.info("✅ Trades journalisés", ids={row["journal_key"]: row["id"] for row in result.data})
+    return ids
+
+
+async def _replay_loop() -> None:
+    """
+    Renvoie par lots les entrées de journal_wal non acquittées (Supabase
+    indisponible lors du premier essai, ou processus précédent arrêté avant
+    l'écriture). Au démarrage, rejoue immédiatement tout l'arriéré.
+    """
+    created_before = _started_at
+    while True:
+        try:
+            while True:
+                entries = await asyncio.to_thread(journal_wal.pending, JOURNAL_WAL_REPLAY_BATCH, created_before)
+                if not entries:
+                    break
+                batch = [(kind, key, payload, seq) for seq, kind, key, payload in entries]
+                written = await _flush_batch(batch)
+                _stats["replayed"] += written
+                log.info(f"🔁 Rejeu du journal local : {written}/{len(batch)} écriture(s)")
+                if written < len(batch):
+                    break   # Supabase encore indisponible : prochain passage
+            await asyncio.to_thread(journal_wal.purge_acked, JOURNAL_WAL_RETENTION_SECONDS)
+        except Exception as e:
+            log.warning(f"⚠️ Rejeu du journal local impossible : {type(e).__name__}: {e}")
+        await asyncio.sleep(JOURNAL_WAL_REPLAY_SECONDS)
+        created_before = time.time() - JOURNAL_WAL_REPLAY_MIN_AGE_SECONDS
+
+
+async def _with_retry(call):
+    """Exécute un appel Supabase (synchrone) hors de la boucle, avec backoff exponentiel."""
+    for attempt in range(JOURNAL_MAX_RETRIES):
+        try:
+            return await asyncio.to_thread(call)
+        except Exception as e:
+            _stats["last_error"] = f"{type(e).__name__}: {e}"
+            if attempt == JOURNAL_MAX_RETRIES - 1:
+                log.error(f"❌ Abandon après {JOURNAL_MAX_RETRIES} tentatives : {e}")
+                raise
+            _stats["retries"] += 1
+            await asyncio.sleep(JOURNAL_RETRY_BASE_SECONDS * (2 ** attempt))
@@ -0,0 +1,196 @@
+"""
+Catalogue des symboles cTrader du compte connecté : index nom -> symbolId,
+specs détaillées des symboles tradés, cache négatif, et snapshot persistant.
+
+Avant : chaque get_symbol_id() non caché retéléchargeait TOUTE la liste
+ProtoOASymbolsListReq pour la parcourir linéairement (y compris pour un
+nom mal orthographié, jamais mis en cache), puis get_symbol_specs() faisait
+un second aller-retour par symbole.
+
+Ici (les requêtes réseau restent dans ctrader_trading, ce module ne fait
+que tenir les données) :
+- la liste complète est chargée UNE fois par connexion dans deux dicts
+  compacts (NOM_MAJUSCULE -> symbolId et symbolId -> nom), lookup en O(1)
+  insensible à la casse ;
+- les noms introuvables sont mémorisés (cache négatif) jusqu'au prochain
+  rechargement du catalogue ;
+- les specs (minVolume/maxVolume/stepVolume/digits) des symboles tradés
+  (TRADED_SYMBOLS) sont préchargées en UN seul ProtoOASymbolByIdReq ;
+- un snapshot (index + specs) est sauvegardé dans Supabase - et non sur
+  disque, effacé par Railway à chaque redéploiement (même raison que pour
+  ctrader_tokens) - pour qu'un démarrage à froid n'ait pas à télécharger le
+  catalogue avant le premier trade.
+
+IMPORTANT - Table Supabase requise :
+    symbol_catalog (account_id int8 PRIMARY KEY, env text, snapshot jsonb,
+                    saved_at int8)
+Sans cette table, le catalogue fonctionne normalement, seul le snapshot
+est ignoré (erreur journalisée, non bloquante).
+"""
+import os
+import threading
+import time
+
+from supabase_journal import get_supabase
+
+# Symboles tradés par le bot (noms côté signal, alias appliqués ensuite) :
+# leurs specs sont préchargées à chaque (re)construction du catalogue.
+TRADED_SYMBOLS = [
+    s.strip().upper()
+    for s in os.environ.get("TRADED_SYMBOLS", "NAS100").split(",")
+    if s.strip()
+]
+
+# Alias de symboles : nom générique (côté signal/TradingView) -> nom exact
+# chez le broker connecté. IC Markets nomme le Nasdaq 100 "USTEC" (et non
+# "NAS100" comme d'autres brokers/plateformes, ni "US100" comme initialement
+# supposé - confirmé via GET /debug/symbols).
+SYMBOL_ALIASES = {
+    "NAS100": "USTEC",
+}
+
+_lock = threading.Lock()
+_ids_by_name = {}      # "USTEC" -> symbolId
+_names_by_id = {}      # symbolId -> "USTEC" (casse d'origine du broker)
+_specs_by_id = {}      # symbolId -> {"minVolume", "maxVolume", "stepVolume", "digits"}
+_missing = set()       # noms (majuscules) introuvables dans le catalogue actuel
+_meta = {"source": None, "loaded_at": None}
+
+
+def load_light_symbols(symbols, source: str = "broker") -> None:
+    """Reconstruit l'index à partir des ProtoOALightSymbol de ProtoOASymbolsListRes."""
+    ids_by_name = {}
+    names_by_id = {}
+    for s in symbols:
+        ids_by_name[s.symbolName.upper()] = s.symbolId
+        names_by_id[s.symbolId] = s.symbolName
+    with _lock:
+        # Specs gardées seulement si l'id désigne toujours le même symbole
+        # (un id retiré ou réattribué par le broker ne doit pas garder les
+        # specs de l'ancien).
+        kept = {
+            symbol_id: specs for symbol_id, specs in _specs_by_id.items()
+            if names_by_id.get(symbol_id) == _names_by_id.get(symbol_id)
+        }
+        _specs_by_id.clear()
+        _specs_by_id.update(kept)
+        _ids_by_name.clear()
+        _ids_by_name.update(ids_by_name)
+        _names_by_id.clear()
+        _names_by_id.update(names_by_id)
+        _missing.clear()
+        _meta["source"] = source
+        _meta["loaded_at"] = time.time()
+
+
+def is_loaded() -> bool:
+    return bool(_ids_by_name)
+
+
+def is_fresh() -> bool:
+    """Vrai si le catalogue vient du broker pour la connexion actuelle (pas d'un snapshot)."""
+    return _meta["source"] == "broker"
+
+
+def mark_stale() -> None:
+    """Après une déconnexion : le catalogue reste utilisable mais sera rechargé."""
+    with _lock:
+        if _meta["source"] == "broker":
+            _meta["source"] = "stale"
+
+
+def resolve_name(symbol_name: str) -> str:
+    """
+    Nom du symbole chez le broker (alias appliqué), en majuscules : clé
+    commune aux caches par symbole (ex: trendbar_cache), sans catalogue
+    chargé - utilisable depuis un worker HTTP.
+    """
+    name = symbol_name.strip().upper()
+    return SYMBOL_ALIASES.get(name, name)
+
+
+def lookup(resolved_name: str):
+    """symbolId du nom (déjà passé par SYMBOL_ALIASES), ou None."""
+    return _ids_by_name.get(resolved_name.upper())
+
+
+def is_known_missing(resolved_name: str) -> bool:
+    return resolved_name.upper() in _missing
+
+
+def mark_missing(resolved_name: str) -> None:
+    with _lock:
+        _missing.add(resolved_name.upper())
+
+
+def get_specs(symbol_id: int) -> dict | None:
+    return _specs_by_id.get(symbol_id)
+
+
+def set_specs_from_symbols(symbols) -> None:
+    """Enregistre les specs des ProtoOASymbol de ProtoOASymbolByIdRes."""
+    with _lock:
+        for s in symbols:
+            _specs_by_id[s.symbolId] = {
+                "minVolume": getattr(s, "minVolume", 100),   # défaut prudent: 1.00 lot si absent
+                "maxVolume": getattr(s, "maxVolume", None),
+                "stepVolume": getattr(s, "stepVolume", 100),
+                "digits": getattr(s, "digits", None),
+            }
+
+
+def names() -> list:
+    return sorted(_names_by_id.values())
+
+
+def stats() -> dict:
+    return {
+        "source": _meta["source"],
+        "loaded_at": _meta["loaded_at"],
+        "symbols": len(_ids_by_name),
+        "specs": len(_specs_by_id),
+        "missing": sorted(_missing),
+    }
+
+
+def save_snapshot(account_id: int, env: str) -> None:
+    """Sauvegarde synchrone (à appeler via asyncio.to_thread) du catalogue dans Supabase."""
+    with _lock:
+        snapshot = {
+            "symbols": [[symbol_id, name] for symbol_id, name in _names_by_id.items()],
+            "specs": {str(symbol_id): specs for symbol_id, specs in _specs_by_id.items()},
+        }
+    get_supabase().table("symbol_catalog").upsert({
+        "account_id": account_id,
+        "env": env,
+        "snapshot": snapshot,
+        "saved_at": int(time.time()),
+    }).execute()
+
+
+def load_snapshot(account_id: int, env: str) -> bool:
+    """Charge le dernier snapshot (synchrone). Retourne False s'il n'y en a pas."""
+    result = (
+        get_supabase().table("symbol_catalog")
+        .select("snapshot")
+        .eq("account_id", account_id)
+        .eq("env", env)
+        .execute()
+    )
+    if not result.data:
+        return False
+    snapshot = result.data[0]["snapshot"]
+    with _lock:
+        _ids_by_name.clear()
+        _names_by_id.clear()
+        for symbol_id, name in snapshot.get("symbols", []):
+            _ids_by_name[name.upper()] = symbol_id
+            _names_by_id[symbol_id] = name
+        _specs_by_id.clear()
+        for symbol_id, specs in snapshot.get("specs", {}).items():
+            if int(symbol_id) in _names_by_id:
+                _specs_by_id[int(symbol_id)] = specs
+        _missing.clear()
+        _meta["source"] = "snapshot"
+        _meta["loaded_at"] = time.time()
+    return bool(_ids_by_name)
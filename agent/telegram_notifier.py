@@ -0,0 +1,188 @@
+"""
+Envoi des notifications Telegram, en dehors du chemin de réponse du webhook.
+
+Avant : chaque signal créait un httpx.AsyncClient neuf (nouvelle connexion
+TCP + TLS vers api.telegram.org) et receive_signal() attendait l'envoi avant
+de répondre. Ici :
+- UN client HTTP persistant (pool de connexions keep-alive), ouvert au
+  démarrage de l'app et fermé à l'arrêt ;
+- notify() dépose le texte dans une file et rend la main immédiatement ;
+- une tâche de fond vide la file en respectant la limite de Telegram par
+  chat (~1 message/seconde, TELEGRAM_MIN_INTERVAL_SECONDS) : les messages
+  arrivés pendant l'attente sont regroupés en un seul envoi (dans la limite
+  des 4096 caractères d'un message Telegram), au lieu de partir un par un ;
+  un message seul plus long est découpé entre deux lignes ;
+- une réponse 429 (Too Many Requests) est respectée via retry_after.
+
+Variables d'environnement (à définir sur Railway) :
+    TELEGRAM_TOKEN
+    TELEGRAM_CHAT_ID
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+import event_log
+import metrics
+
+log = event_log.get_logger("telegram")
+
+TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
+TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
+
+TELEGRAM_MIN_INTERVAL_SECONDS = float(os.environ.get("TELEGRAM_MIN_INTERVAL_SECONDS", "1.0"))
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+_SEPARATOR = "\n\n"
+
+_client: httpx.AsyncClient | None = None
+_queue: asyncio.Queue | None = None
+_task: asyncio.Task | None = None
+_last_sent_at = 0.0
+_stats = {"queued": 0, "sent_messages": 0, "sent_requests": 0, "failed": 0}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Client HTTP partagé (créé à la demande si start_notifier() n'a pas encore tourné)."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url="https://api.telegram.org",
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+        )
+    return _client
+
+
+def start_notifier() -> None:
+    """A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup)."""
+    global _queue, _task
+    get_http_client()
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_dispatch_loop())
+
+
+async def stop_notifier() -> None:
+    """Arrêt propre (hook FastAPI shutdown) : vide la file puis ferme le pool."""
+    global _client, _task
+    if _queue is not None:
+        try:
+            await asyncio.wait_for(_queue.join(), 5)
+        except asyncio.TimeoutError:
+            pass
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def notify(text: str) -> None:
+    """Programme l'envoi d'un message - ne bloque jamais l'appelant."""
+    if _queue is None:
+        start_notifier()
+    _queue.put_nowait((text, event_log.correlation_id()))
+    _stats["queued"] += 1
+
+
+def get_notifier_stats() -> dict:
+    return {**_stats, "queue_depth": _queue.qsize() if _queue is not None else 0}
+
+
+async def _dispatch_loop() -> None:
+    global _last_sent_at
+    while True:
+        items = [await _queue.get()]
+
+        # Respect de l'intervalle minimal par chat : on attend, et tout ce
+        # qui arrive pendant ce temps sera regroupé dans le même envoi.
+        wait = _last_sent_at + TELEGRAM_MIN_INTERVAL_SECONDS - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        while not _queue.empty():
+            items.append(_queue.get_nowait())
+        texts = [text for text, _ in items]
+        # Un envoi peut regrouper plusieurs signaux : leurs identifiants de
+        # corrélation sont tous journalisés.
+        cids = [cid for _, cid in items if cid]
+
+        try:
+            for i, chunk in enumerate(_coalesce(texts)):
+                if i:
+                    await asyncio.sleep(TELEGRAM_MIN_INTERVAL_SECONDS)
+                with metrics.timed("signal_stage_seconds", stage="telegram_send"):
+                    await _post(chunk)
+            _stats["sent_messages"] += len(texts)
+            log.info("📤 Notification envoyée", messages=len(texts), cids=cids)
+        except Exception as e:
+            _stats["failed"] += len(texts)
+            log.warning(f"⚠️ Notification non envoyée : {type(e).__name__}: {e}", messages=len(texts), cids=cids)
+        finally:
+            _last_sent_at = time.monotonic()
+            for _ in texts:
+                _queue.task_done()
+
+
+def _split(text: str) -> list:
+    """
+    Découpe un message trop long pour Telegram (400 sinon) entre deux lignes,
+    pour ne pas couper une balise HTML ; une ligne seule trop longue est
+    coupée net.
+    """
+    if len(text) <= TELEGRAM_MAX_MESSAGE_CHARS:
+        return [text]
+    parts = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > TELEGRAM_MAX_MESSAGE_CHARS:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:TELEGRAM_MAX_MESSAGE_CHARS])
+            line = line[TELEGRAM_MAX_MESSAGE_CHARS:]
+        candidate = f"{current}\n{line}" if current else line
+        if current and len(candidate) > TELEGRAM_MAX_MESSAGE_CHARS:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _coalesce(texts: list) -> list:
+    """Regroupe les messages en aussi peu d'envois que la limite de taille le permet."""
+    chunks = []
+    current = ""
+    for text in (part for text in texts for part in _split(text)):
+        candidate = f"{current}{_SEPARATOR}{text}" if current else text
+        if current and len(candidate) > TELEGRAM_MAX_MESSAGE_CHARS:
+            chunks.append(current)
+            current = text
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def _post(text: str) -> None:
+    payload = {
+        "chat_id": TELEGRAM_CHAT_ID,
+        "text": text,
+        "parse_mode": "HTML",
+    }
+    for _ in range(3):
+        response = await get_http_client().post(f"/bot{TELEGRAM_TOKEN}/sendMessage", json=payload)
+        _stats["sent_requests"] += 1
+        if response.status_code != 429:
+            response.raise_for_status()
+            return
+        retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+        await asyncio.sleep(retry_after)
+    raise RuntimeError("Telegram : limite de débit toujours atteinte après 3 tentatives")
@@ -0,0 +1,189 @@
+"""
+Cache local des barres M1 (ProtoOAGetTrendbarsReq), pour le rejeu des
+signaux (voir replay).
+
+Stockage en colonnes : un fichier .npy par colonne (time en ms epoch,
+open/high/low/close, volume) par symbole, relus en mémoire mappée
+(np.load(mmap_mode="r")) - seules les pages touchées par un rejeu sont
+lues sur le disque. meta.json donne le nombre de lignes valides ; il est
+écrit en dernier, et un cache incohérent (crash pendant l'écriture) est
+simplement ignoré puis re-téléchargé.
+
+Synchronisation incrémentale : seules les barres plus récentes que la
+dernière en cache (et, si la profondeur demandée augmente, celles d'avant
+la première) sont demandées, par tranches de TRENDBAR_CHUNK_HOURS. Les
+requêtes passent par la classe historique de request_scheduler
+(CTRADER_MAX_HISTORICAL_PER_SECOND) : une longue synchronisation ne prend
+jamais le débit des ordres. La barre de la minute en cours, pas encore
+close, n'est jamais stockée.
+
+ATTENTION (Railway) : le système de fichiers est effacé à chaque
+redéploiement. Monter un volume et y faire pointer TRENDBAR_CACHE_DIR pour
+garder l'historique.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import event_log
+import symbol_catalog
+
+log = event_log.get_logger("trendbar_cache")
+
+TRENDBAR_CACHE_DIR = os.environ.get("TRENDBAR_CACHE_DIR", "trendbar_cache")
+# cTrader limite la plage d'une requête M1 à quelques jours.
+TRENDBAR_CHUNK_HOURS = float(os.environ.get("TRENDBAR_CHUNK_HOURS", "48"))
+TRENDBAR_PRICE_SCALE = 100000
+
+COLUMNS = {"time": np.int64, "open": np.float64, "high": np.float64, "low": np.float64, "close": np.float64, "volume": np.int64}
+_MINUTE_MS = 60_000
+
+_locks = defaultdict(asyncio.Lock)
+
+
+def _symbol_dir(symbol: str) -> str:
+    # Un répertoire par symbole broker : NAS100 et USTEC partagent le cache.
+    return os.path.join(TRENDBAR_CACHE_DIR, f"{symbol_catalog.resolve_name(symbol)}_M1")
+
+
+def load(symbol: str) -> dict | None:
+    """Colonnes en cache d'un symbole (tableaux en mémoire mappée), ou None."""
+    directory = _symbol_dir(symbol)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")[:rows] for name in COLUMNS}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"⚠️ Cache {symbol} illisible, ignoré : {type(e).__name__}: {e}")
+        return None
+    times = columns["time"]
+    if any(len(col) != rows for col in columns.values()) or (
+        rows and (int(times[0]) != meta["first"] or int(times[-1]) != meta["last"])
+    ):
+        log.warning(f"⚠️ Cache {symbol} incohérent (écriture interrompue ?), ignoré")
+        return None
+    return columns
+
+
+async def sync(symbol: str, symbol_id: int, days: float, fetch) -> dict:
+    """
+    Complète le cache de symbol jusqu'à `days` jours en arrière.
+    fetch : coroutine fetch(symbol_id, from_ms, to_ms) -> [ProtoOATrendbar]
+    (ctrader_trading.fetch_trendbars).
+    """
+    async with _locks[symbol_catalog.resolve_name(symbol)]:
+        started = time.perf_counter()
+        now_ms = int(time.time() * 1000) // _MINUTE_MS * _MINUTE_MS   # début de la minute en cours
+        start_ms = now_ms - int(days * 86400 * 1000)
+        cached = load(symbol)
+
+        ranges = []
+        if cached is None or not len(cached["time"]):
+            ranges.append((start_ms, now_ms))
+        else:
+            first, last = int(cached["time"][0]), int(cached["time"][-1])
+            if start_ms < first:
+                ranges.append((start_ms, first))
+            if last + _MINUTE_MS < now_ms:
+                ranges.append((max(start_ms, last + _MINUTE_MS), now_ms))
+
+        chunk_ms = int(TRENDBAR_CHUNK_HOURS * 3600 * 1000)
+        fetched, requests = [], 0
+        for begin, end in ranges:
+            for chunk_start in range(begin, end, chunk_ms):
+                bars = await fetch(symbol_id, chunk_start, min(chunk_start + chunk_ms, end) - 1)
+                requests += 1
+                if bars:
+                    fetched.append(_decode(bars, before_ms=now_ms))
+
+        before = len(cached["time"]) if cached is not None else 0
+        if fetched:
+            columns = _merge(cached, fetched)
+            await asyncio.to_thread(_save, symbol, columns)
+        else:
+            columns = cached
+        rows = len(columns["time"]) if columns is not None else 0
+        report = {
+            "symbol": symbol_catalog.resolve_name(symbol),
+            "requests": requests,
+            "added": rows - before,
+            "rows": rows,
+            "first": _iso(columns["time"][0]) if rows else None,
+            "last": _iso(columns["time"][-1]) if rows else None,
+            "duration_seconds": round(time.perf_counter() - started, 3),
+        }
+    log.info(f"✅ {report}")
+    return report
+
+
+def _decode(bars, before_ms: int) -> dict:
+    """ProtoOATrendbar (low + deltas, en 1/100000) -> colonnes NumPy."""
+    raw = np.array(
+        [(b.utcTimestampInMinutes, b.low, b.deltaOpen, b.deltaHigh, b.deltaClose, b.volume) for b in bars],
+        dtype=np.int64,
+    )
+    minutes, low, delta_open, delta_high, delta_close, volume = raw.T
+    columns = {
+        "time": minutes * _MINUTE_MS,
+        "open": (low + delta_open) / TRENDBAR_PRICE_SCALE,
+        "high": (low + delta_high) / TRENDBAR_PRICE_SCALE,
+        "low": low / TRENDBAR_PRICE_SCALE,
+        "close": (low + delta_close) / TRENDBAR_PRICE_SCALE,
+        "volume": volume,
+    }
+    closed = columns["time"] < before_ms
+    return {name: col[closed] for name, col in columns.items()}
+
+
+def _merge(cached: dict | None, fetched: list) -> dict:
+    """Concatène, trie par heure et dé-duplique (la barre déjà en cache est gardée)."""
+    parts = ([cached] if cached is not None else []) + fetched
+    merged = {name: np.concatenate([np.asarray(p[name], dtype=dtype) for p in parts]) for name, dtype in COLUMNS.items()}
+    order = np.argsort(merged["time"], kind="stable")
+    _, first_index = np.unique(merged["time"][order], return_index=True)
+    keep = order[first_index]
+    return {name: col[keep] for name, col in merged.items()}
+
+
+def _save(symbol: str, columns: dict) -> None:
+    directory = _symbol_dir(symbol)
+    os.makedirs(directory, exist_ok=True)
+    for name in COLUMNS:
+        path = os.path.join(directory, f"{name}.npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, columns[name])
+        os.replace(path + ".tmp", path)
+    times = columns["time"]
+    meta = {"rows": len(times), "first": int(times[0]), "last": int(times[-1]), "period": "M1"}
+    meta_path = os.path.join(directory, "meta.json")
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _iso(ms) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(ms) / 1000))
+
+
+def stats() -> dict:
+    symbols = {}
+    if os.path.isdir(TRENDBAR_CACHE_DIR):
+        for entry in sorted(os.listdir(TRENDBAR_CACHE_DIR)):
+            if not entry.endswith("_M1"):
+                continue
+            columns = load(entry[:-3])
+            if columns is None or not len(columns["time"]):
+                continue
+            symbols[entry[:-3]] = {
+                "rows": len(columns["time"]),
+                "first": _iso(columns["time"][0]),
+                "last": _iso(columns["time"][-1]),
+            }
+    return {"dir": TRENDBAR_CACHE_DIR, "chunk_hours": TRENDBAR_CHUNK_HOURS, "symbols": symbols}
@@ -0,0 +1,264 @@
+"""
+Préchauffage avant l'ouverture des sessions de marché.
+
+Presque tous les signaux tombent dans les premières minutes après
+l'ouverture du NASDAQ (15:30 heure de Paris) - or c'est justement là que le
+premier ordre payait tous les coûts à froid : token à rafraîchir, session
+cTrader tombée pendant la nuit, catalogue et specs à recharger, pools HTTP
+Supabase/Telegram fermés par l'inactivité.
+
+Une tâche de fond dort jusqu'à WARMUP_LEAD_MINUTES avant chaque ouverture
+du calendrier configuré, puis enchaîne :
+- tokens : rafraîchissement anticipé si l'access token expire avant
+  WARMUP_TOKEN_MIN_VALIDITY_HOURS, puis ré-authentification de la session ;
+- session cTrader : ensure_connected() (reconnexion si besoin) ;
+- catalogue, specs des TRADED_SYMBOLS et abonnement aux prix ;
+- soldes de tous les comptes (account_state) ;
+- une requête légère Supabase et un getMe Telegram, pour rouvrir les
+  connexions keep-alive des deux pools ;
+- contrôle "prêt" : ping cTrader (aller-retour) et temps du chemin
+  critique d'un signal (symbole, specs, solde) qui doit être une simple
+  lecture mémoire.
+
+Le rapport est exposé par /debug/warmup (et POST /debug/warmup pour lancer
+un préchauffage à la demande), et résumé sur Telegram.
+
+Calendrier (fuseau de la place de cotation, heure d'été comprise) :
+    MARKET_TIMEZONE   (défaut America/New_York)
+    MARKET_SESSIONS   heures d'ouverture HH:MM séparées par des virgules (défaut 09:30)
+    MARKET_DAYS       jours ouvrés (défaut mon,tue,wed,thu,fri)
+    MARKET_HOLIDAYS   jours fériés YYYY-MM-DD séparés par des virgules
+"""
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import event_log
+import metrics
+import supabase_journal
+import symbol_catalog
+from ctrader_auth import get_valid_tokens, is_token_expired, refresh_access_token
+from ctrader_trading import (
+    current_balance,
+    ensure_connected,
+    get_symbol_id,
+    get_symbol_specs,
+    ping,
+    reauthenticate_account,
+    require_account_ids,
+    warm_up,
+)
+from telegram_notifier import TELEGRAM_TOKEN, get_http_client, notify
+
+log = event_log.get_logger("warmup")
+
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") == "1"
+WARMUP_LEAD_MINUTES = float(os.environ.get("WARMUP_LEAD_MINUTES", "5"))
+WARMUP_NOTIFY = os.environ.get("WARMUP_NOTIFY", "1") == "1"
+WARMUP_TOKEN_MIN_VALIDITY_HOURS = float(os.environ.get("WARMUP_TOKEN_MIN_VALIDITY_HOURS", "12"))
+WARMUP_STEP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_STEP_TIMEOUT_SECONDS", "30"))
+# Au-delà, le chemin critique n'est plus une lecture mémoire : "prêt" est refusé.
+WARMUP_MAX_HOT_PATH_MS = float(os.environ.get("WARMUP_MAX_HOT_PATH_MS", "5"))
+# Heure affichée dans les logs et la notification.
+WARMUP_DISPLAY_TIMEZONE = ZoneInfo(os.environ.get("WARMUP_DISPLAY_TIMEZONE", "Europe/Paris"))
+
+MARKET_TIMEZONE = ZoneInfo(os.environ.get("MARKET_TIMEZONE", "America/New_York"))
+MARKET_SESSIONS = sorted(
+    datetime.strptime(s.strip(), "%H:%M").time()
+    for s in os.environ.get("MARKET_SESSIONS", "09:30").split(",")
+    if s.strip()
+)
+_WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MARKET_DAYS = {
+    _WEEKDAYS.index(d.strip().lower()[:3])
+    for d in os.environ.get("MARKET_DAYS", "mon,tue,wed,thu,fri").split(",")
+    if d.strip()
+}
+MARKET_HOLIDAYS = {
+    date.fromisoformat(d.strip())
+    for d in os.environ.get("MARKET_HOLIDAYS", "").split(",")
+    if d.strip()
+}
+
+_task = None
+_run_lock = asyncio.Lock()
+_next_session = None
+_last_report = None
+_stats = {"runs": 0, "ready": 0, "not_ready": 0}
+
+
+def next_session_open(after: datetime) -> datetime | None:
+    """Prochaine ouverture (datetime avec fuseau) strictement après `after`."""
+    local = after.astimezone(MARKET_TIMEZONE)
+    for offset in range(15):
+        day = local.date() + timedelta(days=offset)
+        if day.weekday() not in MARKET_DAYS or day in MARKET_HOLIDAYS:
+            continue
+        for session_time in MARKET_SESSIONS:
+            opens_at = datetime.combine(day, session_time, tzinfo=MARKET_TIMEZONE)
+            if opens_at > after:
+                return opens_at
+    return None
+
+
+def start_warmup_scheduler() -> None:
+    """A appeler UNE SEULE FOIS au démarrage de l'app (hook FastAPI startup)."""
+    global _task
+    if not WARMUP_ENABLED or not MARKET_SESSIONS or not MARKET_DAYS:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_scheduler_loop())
+
+
+async def _scheduler_loop() -> None:
+    global _next_session
+    lead = timedelta(minutes=WARMUP_LEAD_MINUTES)
+    while True:
+        now = datetime.now(timezone.utc)
+        # Une session déjà dans sa fenêtre de préchauffage (ex: redémarrage à
+        # 15:28) est préchauffée tout de suite.
+        _next_session = next_session_open(now)
+        if _next_session is None:
+            log.warning("⚠️ Aucune session dans les 15 prochains jours (calendrier ?)")
+            await asyncio.sleep(86400)
+            continue
+        delay = (_next_session - lead - now).total_seconds()
+        log.info(f"⏰ Prochaine ouverture {_display(_next_session)}, préchauffage dans {max(delay, 0) / 60:.0f} min")
+        if delay > 0:
+            # Réveils au plus toutes les heures : une dérive d'horloge ou une
+            # mise en veille ne décale pas l'échéance.
+            await asyncio.sleep(min(delay, 3600))
+            if delay > 3600:
+                continue
+        try:
+            await run_warmup(session_open=_next_session)
+        except Exception as e:
+            log.warning(f"⚠️ Préchauffage interrompu : {type(e).__name__}: {e}")
+        # Pas de second préchauffage pour la même ouverture.
+        await asyncio.sleep(max(1.0, (_next_session - datetime.now(timezone.utc)).total_seconds() + 1))
+
+
+async def run_warmup(session_open: datetime | None = None) -> dict:
+    """Exécute toutes les étapes (une seule exécution à la fois) et retourne le rapport."""
+    global _last_report
+    async with _run_lock:
+        started = time.perf_counter()
+        steps = {}
+        for name, step in (
+            ("tokens", _warm_tokens),
+            ("broker_session", ensure_connected),
+            ("symbols", warm_up),
+            ("balances", _warm_balances),
+            ("supabase", supabase_journal.ping),
+            ("telegram", _warm_telegram),
+        ):
+            steps[name] = await _run_step(name, step)
+        latency = await _ready_check()
+        ready = all(s["ok"] for s in steps.values()) and latency.get("ok", False)
+
+        report = {
+            "ready": ready,
+            "session_open": _display(session_open) if session_open else None,
+            "ran_at": _display(datetime.now(timezone.utc)),
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "steps": steps,
+            "latency": latency,
+        }
+        _last_report = report
+        _stats["runs"] += 1
+        _stats["ready" if ready else "not_ready"] += 1
+        metrics.set_gauge("warmup_ready", 1 if ready else 0)
+
+    failed = [name for name, s in steps.items() if not s["ok"]]
+    if ready:
+        log.info(f"🟢 Prêt en {report['duration_seconds']}s - ping {latency['broker_rtt_ms']} ms, chemin critique {latency['hot_path_ms']} ms")
+    else:
+        log.warning(f"🔴 Pas prêt : {failed or latency}")
+    if WARMUP_NOTIFY:
+        notify(_summary(report, failed))
+    return report
+
+
+async def _run_step(name: str, step) -> dict:
+    started = time.perf_counter()
+    try:
+        with metrics.timed("warmup_step_seconds", step=name):
+            await asyncio.wait_for(step(), WARMUP_STEP_TIMEOUT_SECONDS)
+        result = {"ok": True}
+    except Exception as e:
+        metrics.inc("warmup_step_failures_total", step=name)
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def _warm_tokens() -> None:
+    tokens = await asyncio.to_thread(get_valid_tokens)
+    margin = int(WARMUP_TOKEN_MIN_VALIDITY_HOURS * 3600)
+    if is_token_expired(tokens, safety_margin_seconds=margin):
+        # Rafraîchi maintenant plutôt qu'en pleine session.
+        await asyncio.to_thread(refresh_access_token)
+        await reauthenticate_account(await asyncio.to_thread(get_valid_tokens))
+
+
+async def _warm_balances() -> None:
+    await asyncio.gather(*(current_balance(account_id) for account_id in require_account_ids()))
+
+
+async def _warm_telegram() -> None:
+    if not TELEGRAM_TOKEN:
+        return
+    response = await get_http_client().get(f"/bot{TELEGRAM_TOKEN}/getMe")
+    response.raise_for_status()
+
+
+async def _ready_check() -> dict:
+    """Aller-retour cTrader et durée du chemin critique d'un signal, à chaud."""
+    try:
+        broker_rtt = await ping(timeout=WARMUP_STEP_TIMEOUT_SECONDS)
+        started = time.perf_counter()
+        for name in symbol_catalog.TRADED_SYMBOLS:
+            symbol_id, _ = await get_symbol_id(name)
+            await get_symbol_specs(symbol_id)
+        for account_id in require_account_ids():
+            await current_balance(account_id)
+        hot_path_ms = round((time.perf_counter() - started) * 1000, 2)
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    metrics.observe("warmup_broker_rtt_seconds", broker_rtt)
+    return {
+        "ok": hot_path_ms <= WARMUP_MAX_HOT_PATH_MS,
+        "broker_rtt_ms": round(broker_rtt * 1000, 1),
+        "hot_path_ms": hot_path_ms,
+    }
+
+
+def _display(moment: datetime) -> str:
+    return moment.astimezone(WARMUP_DISPLAY_TIMEZONE).isoformat(timespec="seconds")
+
+
+def _summary(report: dict, failed: list) -> str:
+    latency = report["latency"]
+    if report["ready"]:
+        return (
+            f"🟢 Bot prêt pour l'ouverture ({report['session_open'] or 'à la demande'})\n"
+            f"Ping cTrader : {latency['broker_rtt_ms']} ms - chemin critique : {latency['hot_path_ms']} ms"
+        )
+    details = [f"{name} : {report['steps'][name]['error']}" for name in failed]
+    if not latency.get("ok"):
+        details.append(f"contrôle de latence : {latency.get('error') or latency}")
+    return "🔴 Préchauffage incomplet avant l'ouverture\n" + "\n".join(details)
+
+
+def stats() -> dict:
+    return {
+        **_stats,
+        "enabled": WARMUP_ENABLED,
+        "market_timezone": str(MARKET_TIMEZONE),
+        "sessions": [t.strftime("%H:%M") for t in MARKET_SESSIONS],
+        "lead_minutes": WARMUP_LEAD_MINUTES,
+        "next_session_open": _display(_next_session) if _next_session else None,
+        "last_report": _last_report,
+    }